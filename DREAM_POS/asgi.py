@@ -3,6 +3,12 @@ ASGI config for DREAM_POS project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The terminal's M-Pesa payment status stream (payment_status_stream) is an
+async view that holds the connection open until the callback arrives, so
+serve the app through this module rather than wsgi.py, e.g.:
+
+    gunicorn DREAM_POS.asgi:application -k uvicorn.workers.UvicornWorker
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
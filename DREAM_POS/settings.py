@@ -75,6 +75,10 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file, not the default in-memory database: the concurrency tests
+        # run checkouts from several threads, which only queue on SQLite's
+        # file lock (an in-memory database fails them with "table is locked")
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -173,12 +177,26 @@ SESSION_COOKIE_AGE = 28800  # 8 hours
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
 
 # Cache configuration (optional, for better performance)
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+# Set REDIS_URL in production so every gunicorn worker shares one cache
+# (M-Pesa tokens, catalog versions, report results).
+from decouple import config
+
+REDIS_URL = config("REDIS_URL", default="")
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+        }
     }
-}
 
 # Logging configuration
 LOGGING = {
@@ -227,6 +245,11 @@ MPESA_PASSKEY = config("MPESA_PASSKEY")
 
 MPESA_ENVIRONMENT = config("MPESA_ENVIRONMENT", default="sandbox")
 MPESA_CALLBACK_URL = config("MPESA_CALLBACK_URL")
+MPESA_BASE_URL = config("MPESA_BASE_URL", default="")  # Overrides the Daraja host, e.g. http://127.0.0.1:8099 for daraja_simulator
+MPESA_DISPATCH_WORKERS = config("MPESA_DISPATCH_WORKERS", default=4, cast=int)  # STK push outbox threads per process
+STOCK_RESERVATION_TTL = config("STOCK_RESERVATION_TTL", default=15, cast=int)  # Minutes an unpaid M-Pesa sale holds its stock
+THUMBNAIL_WORKERS = config("THUMBNAIL_WORKERS", default=2, cast=int)  # Product thumbnail threads per process
+LOW_STOCK_ALERT_EMAILS = config("LOW_STOCK_ALERT_EMAILS", default="", cast=lambda value: [email.strip() for email in value.split(",") if email.strip()])  # Who notify_low_stock mails
 
 # Logging configuration for M-Pesa debugging
 LOGGING = {
@@ -261,6 +284,11 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'pos_application.mpesa': {
+            'handlers': ['file', 'console'],
+            'level': 'INFO',
+            'propagate': True,
+        },
     },
 }
 
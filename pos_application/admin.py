@@ -1,3 +1,4 @@
+from django import forms
 from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
@@ -6,6 +7,9 @@ from .models import (
     Category, Product, Customer, Sale, SaleItem, 
     Discount, Inventory
 )
+from .checkout import add_stock, decrement_stock
+from .sales_rollup import record_sale, unrecord_sale
+from .thumbnails import schedule_thumbnails
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -23,9 +27,9 @@ class ProductAdmin(admin.ModelAdmin):
         'name', 'category', 'sku', 'price', 'stock_quantity', 
         'stock_status', 'is_active', 'created_at'
     ]
-    list_filter = ['category', 'is_active', 'created_at']
+    list_filter = ['category', 'is_active', 'low_stock', 'created_at']
     search_fields = ['name', 'sku', 'description']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['reserved_quantity', 'low_stock', 'created_at', 'updated_at']
     list_editable = ['price', 'stock_quantity', 'is_active']
     
     fieldsets = (
@@ -36,7 +40,7 @@ class ProductAdmin(admin.ModelAdmin):
             'fields': ('price', 'cost_price')
         }),
         ('Inventory', {
-            'fields': ('stock_quantity', 'min_stock_level')
+            'fields': ('stock_quantity', 'reserved_quantity', 'min_stock_level', 'low_stock')
         }),
         ('Status', {
             'fields': ('is_active',)
@@ -56,6 +60,28 @@ class ProductAdmin(admin.ModelAdmin):
             '<span style="color: #28a745; font-weight: bold;">In Stock</span>'
         )
     stock_status.short_description = 'Stock Status'
+    
+    def save_model(self, request, obj, form, change):
+        if 'image' in form.changed_data:
+            # The old hash belongs to the old image: serve the new original
+            # until its own thumbnails are ready
+            obj.image_hash = ''
+        super().save_model(request, obj, form, change)
+        if obj.image and not obj.image_hash:
+            schedule_thumbnails(obj.pk)
+        # Hand edits to the stock count are ledgered, so the ledger still adds up
+        if not change and obj.stock_quantity:
+            Inventory.objects.create(
+                product=obj, transaction_type='in', quantity=obj.stock_quantity,
+                notes='Initial stock', user=request.user,
+            )
+        elif change and 'stock_quantity' in form.changed_data:
+            delta = obj.stock_quantity - (form.initial.get('stock_quantity') or 0)
+            if delta:
+                Inventory.objects.create(
+                    product=obj, transaction_type='adjustment', quantity=delta,
+                    notes='Stock count edited in admin', user=request.user,
+                )
 
 class SaleItemInline(admin.TabularInline):
     model = SaleItem
@@ -84,6 +110,30 @@ class SaleAdmin(admin.ModelAdmin):
         if obj:  # Editing an existing object
             return self.readonly_fields + ['cashier', 'customer']
         return self.readonly_fields
+    
+    # Edits can change a sale's status, payment method or items: the daily
+    # rollups drop what was stored and add the sale back once it is saved
+    def save_model(self, request, obj, form, change):
+        if change:
+            stored = Sale.objects.get(pk=obj.pk)
+            if stored.status == 'completed':
+                unrecord_sale(stored)
+        super().save_model(request, obj, form, change)
+    
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if form.instance.status == 'completed':
+            record_sale(form.instance)
+    
+    def delete_model(self, request, obj):
+        if obj.status == 'completed':
+            unrecord_sale(obj)
+        super().delete_model(request, obj)
+    
+    def delete_queryset(self, request, queryset):
+        for sale in queryset.filter(status='completed'):
+            unrecord_sale(sale)
+        super().delete_queryset(request, queryset)
 
 @admin.register(Customer)
 class CustomerAdmin(admin.ModelAdmin):
@@ -132,7 +182,7 @@ class DiscountAdmin(admin.ModelAdmin):
     status.short_description = 'Status'
 
 from django.contrib import admin
-from .models import Payment
+from .models import Payment, MpesaOutbox, MpesaCallback, StockReservation, StockAlert
 
 
 @admin.register(Payment)
@@ -180,6 +230,58 @@ class PaymentAdmin(admin.ModelAdmin):
     ordering = ("-created_at",)
 
 
+@admin.register(MpesaOutbox)
+class MpesaOutboxAdmin(admin.ModelAdmin):
+    list_display = ("sale", "phone_number", "amount", "status", "attempts", "updated_at")
+    list_filter = ("status", "created_at")
+    search_fields = ("sale__sale_number", "phone_number")
+    readonly_fields = ("created_at", "updated_at", "last_error")
+    ordering = ("-created_at",)
+
+
+@admin.register(MpesaCallback)
+class MpesaCallbackAdmin(admin.ModelAdmin):
+    list_display = ("checkout_request_id", "result_code", "status", "attempts", "received_at", "applied_at")
+    list_filter = ("status", "received_at")
+    search_fields = ("checkout_request_id",)
+    readonly_fields = ("payload", "received_at", "applied_at", "error")
+    ordering = ("-received_at",)
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ("sale", "status", "expires_at", "created_at")
+    list_filter = ("status", "created_at")
+    search_fields = ("sale__sale_number",)
+    # Status changes must go through checkout so reserved_quantity moves with them
+    readonly_fields = ("sale", "status", "expires_at", "created_at")
+    ordering = ("-created_at",)
+
+
+@admin.register(StockAlert)
+class StockAlertAdmin(admin.ModelAdmin):
+    list_display = ("product", "kind", "stock_quantity", "min_stock_level", "created_at", "notified_at")
+    list_filter = ("kind", "created_at")
+    search_fields = ("product__name", "product__sku")
+    # Written by the low-stock tracker, claimed by notify_low_stock
+    readonly_fields = ("product", "kind", "stock_quantity", "min_stock_level", "created_at", "notified_at")
+    ordering = ("-created_at",)
+
+
+class InventoryAdminForm(forms.ModelForm):
+    class Meta:
+        model = Inventory
+        fields = '__all__'
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        product = cleaned_data.get('product')
+        quantity = cleaned_data.get('quantity') or 0
+        # Units held for pending M-Pesa sales are not available to take out
+        if product and quantity < 0 and -quantity > product.available_quantity:
+            raise forms.ValidationError(f'Insufficient stock. Available: {product.available_quantity}')
+        return cleaned_data
+
 @admin.register(Inventory)
 class InventoryAdmin(admin.ModelAdmin):
     list_display = [
@@ -189,8 +291,23 @@ class InventoryAdmin(admin.ModelAdmin):
     list_filter = ['transaction_type', 'created_at', 'user']
     search_fields = ['product__name', 'notes']
     readonly_fields = ['created_at']
+    form = InventoryAdminForm
     
     def get_readonly_fields(self, request, obj=None):
         if obj:  # Editing an existing object
             return self.readonly_fields + ['product', 'transaction_type', 'quantity', 'user']
-        return self.readonly_fields
\ No newline at end of file
+        return self.readonly_fields
+    
+    def save_model(self, request, obj, form, change):
+        # A new ledger row moves the stock with it, in the admin's transaction;
+        # the conditional decrement still refuses a sale that got there first
+        if not change:
+            if obj.quantity > 0:
+                add_stock({obj.product_id: obj.quantity})
+            elif obj.quantity < 0:
+                decrement_stock({obj.product_id: -obj.quantity})
+        super().save_model(request, obj, form, change)
+    
+    def has_delete_permission(self, request, obj=None):
+        # The ledger is append-only: mistakes are corrected with an adjustment row
+        return False
\ No newline at end of file
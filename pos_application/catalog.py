@@ -0,0 +1,180 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.db.models import F
+
+from .metrics import hit_rate, increment
+from .models import Category, Product
+from .thumbnails import thumbnail_url
+
+CATALOG_VERSION_KEY = 'catalog:version'
+# Snapshots are keyed by version, so an old one is never served after a bump;
+# the timeout only bounds how long superseded snapshots occupy the cache.
+SNAPSHOT_TIMEOUT = 60 * 60
+# Part of the snapshot key: bump when fetch_rows() changes shape so workers
+# running the new code never unpack rows cached by the old
+SNAPSHOT_LAYOUT = 2
+CATALOG_STATS_KEYS = {
+    'local_hits': 'catalog:stats:local_hits',
+    'shared_hits': 'catalog:stats:shared_hits',
+    'misses': 'catalog:stats:misses',
+}
+
+_local = {'version': None, 'snapshot': None}
+_local_lock = threading.Lock()
+
+
+def normalize_sku(code):
+    """Scanners and keyboards disagree on case and trailing whitespace"""
+    return code.strip().upper()
+
+
+class CategoryEntry:
+    __slots__ = ('id', 'name', 'icon')
+
+    def __init__(self, id, name, icon):
+        self.id = id
+        self.name = name
+        self.icon = icon
+
+    def __str__(self):
+        return self.name
+
+
+class ImageEntry:
+    """Stands in for the ImageField file so templates can keep using image.url;
+    the url is the grid-sized thumbnail"""
+    __slots__ = ('url',)
+
+    def __init__(self, url):
+        self.url = url
+
+
+class ProductEntry:
+    """Read-only copy of the Product fields the terminal and dashboard render"""
+    __slots__ = ('id', 'name', 'sku', 'price', 'stock_quantity', 'min_stock_level', 'category', 'image')
+
+    def __init__(self, id, name, sku, price, stock_quantity, min_stock_level, category, image):
+        self.id = id
+        self.name = name
+        self.sku = sku
+        self.price = price
+        self.stock_quantity = stock_quantity
+        self.min_stock_level = min_stock_level
+        self.category = category
+        self.image = image
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def is_low_stock(self):
+        return self.stock_quantity <= self.min_stock_level
+
+
+class CatalogSnapshot:
+    """Active products (newest first) and all categories at one catalog version"""
+    __slots__ = ('version', 'categories', 'products', 'by_id', 'by_sku', 'by_category')
+
+    def __init__(self, version, category_rows, product_rows):
+        self.version = version
+        self.categories = [CategoryEntry(*row) for row in category_rows]
+        categories = {category.id: category for category in self.categories}
+
+        self.products = []
+        self.by_id = {}
+        self.by_sku = {}
+        self.by_category = {}
+        for product_id, name, sku, price, stock, min_stock, category_id, image, image_hash in product_rows:
+            entry = ProductEntry(
+                product_id, name, sku, price, stock, min_stock,
+                categories.get(category_id),
+                ImageEntry(thumbnail_url(image, image_hash)) if image else None,
+            )
+            self.products.append(entry)
+            self.by_id[product_id] = entry
+            self.by_sku[normalize_sku(sku)] = entry
+            self.by_category.setdefault(category_id, []).append(entry)
+
+    @staticmethod
+    def fetch_rows():
+        """Plain tuples for the whole catalog; this is what the shared cache stores"""
+        category_rows = list(Category.objects.order_by('pk').values_list('id', 'name', 'icon'))
+        # stock_quantity here is what can still be sold: stock held for
+        # pending M-Pesa sales is not offered to the next customer
+        product_rows = list(
+            Product.objects.filter(is_active=True).annotate(
+                available=F('stock_quantity') - F('reserved_quantity'),
+            ).order_by('-created_at').values_list(
+                'id', 'name', 'sku', 'price', 'available', 'min_stock_level', 'category_id', 'image',
+                'image_hash',
+            )
+        )
+        return category_rows, product_rows
+
+    def lookup_sku(self, code):
+        """Exact SKU match for a scanned barcode, or None"""
+        return self.by_sku.get(normalize_sku(code))
+
+    def in_stock(self, category_id=None):
+        products = self.products if category_id is None else self.by_category.get(category_id, ())
+        return [product for product in products if product.stock_quantity > 0]
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Seed from the clock rather than 1 so a flushed cache can never hand
+        # out a version some worker still holds an older snapshot for
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """Invalidate every worker's catalog snapshot. Call after the change has committed."""
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def get_catalog():
+    """Current catalog snapshot.
+
+    Each request costs one shared-cache read for the version. The snapshot
+    itself comes from this process when the version is unchanged, then from
+    the shared cache (built once by whichever worker got there first), and
+    only then from the database.
+    """
+    version = get_catalog_version()
+    with _local_lock:
+        snapshot = _local['snapshot'] if _local['version'] == version else None
+    if snapshot is not None:
+        increment(CATALOG_STATS_KEYS['local_hits'])
+        return snapshot
+
+    snapshot_key = f'catalog:snapshot:{SNAPSHOT_LAYOUT}:{version}'
+    rows = cache.get(snapshot_key)
+    if rows is not None:
+        increment(CATALOG_STATS_KEYS['shared_hits'])
+    else:
+        increment(CATALOG_STATS_KEYS['misses'])
+        rows = CatalogSnapshot.fetch_rows()
+        cache.set(snapshot_key, rows, timeout=SNAPSHOT_TIMEOUT)
+
+    snapshot = CatalogSnapshot(version, *rows)
+    with _local_lock:
+        _local['version'] = version
+        _local['snapshot'] = snapshot
+    return snapshot
+
+
+def catalog_cache_stats():
+    """Catalog lookups by where they were served from, across every worker"""
+    return hit_rate(CATALOG_STATS_KEYS)
@@ -0,0 +1,209 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Q, Sum, When
+from django.utils import timezone
+
+from .catalog import bump_catalog_version
+from .models import Product, SaleItem, Inventory, StockReservation
+from .stock_alerts import sync_low_stock
+
+
+class CheckoutError(Exception):
+    """Raised inside the checkout transaction to roll it back with a user-facing message"""
+
+
+class InsufficientStock(CheckoutError):
+    """Raised when a basket line cannot be covered by the stock on hand"""
+
+    def __init__(self, message='Insufficient stock for one or more items'):
+        super().__init__(message)
+
+
+def lock_for_checkout():
+    """Take SQLite's write lock as the checkout transaction's first statement.
+
+    SQLite cannot turn a read transaction into a write while another
+    terminal is writing: it fails with "database is locked" instead of
+    waiting. An UPDATE that matches nothing still takes the lock, so
+    concurrent checkouts queue for it. PostgreSQL locks rows and needs
+    nothing here.
+    """
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"UPDATE {Product._meta.db_table} SET id = id WHERE 0")
+
+
+def merge_cart_lines(cart_items):
+    """Collapse cart lines into an ordered {product_id: quantity} map"""
+    quantities = {}
+    for item in cart_items:
+        product_id = int(item['product_id'])
+        quantities[product_id] = quantities.get(product_id, 0) + int(item['quantity'])
+    return quantities
+
+
+def load_products(product_ids):
+    """Load every product in the basket with a single query.
+
+    Nothing is locked: the stock checks that matter are the conditional
+    UPDATEs below, so checkouts sharing a hot product never queue on it.
+    """
+    return Product.objects.in_bulk(list(product_ids))
+
+
+def _adjust_stock(quantities, condition=None, **columns):
+    """One UPDATE over the basket moving each named column by -quantity * sign.
+
+    Returns the number of products that matched condition (all of them
+    when no condition is given).
+    """
+    whens = {
+        column: [When(pk=product_id, then=F(column) - quantity * sign) for product_id, quantity in quantities.items()]
+        for column, sign in columns.items()
+    }
+    return Product.objects.filter(condition if condition is not None else Q(pk__in=list(quantities))).update(
+        updated_at=timezone.now(),
+        **{column: Case(*cases, output_field=IntegerField()) for column, cases in whens.items()},
+    )
+
+
+def _sellable(quantities):
+    """Match products whose unreserved stock still covers their basket quantity"""
+    condition = Q()
+    for product_id, quantity in quantities.items():
+        condition |= Q(pk=product_id, stock_quantity__gte=F('reserved_quantity') + quantity)
+    return condition
+
+
+def decrement_stock(quantities, allow_oversell=False):
+    """Decrement stock for a whole basket in one conditional UPDATE.
+
+    Each product only matches when its unreserved stock still covers the
+    line, so a short row count means another checkout got there first and
+    the caller's transaction must be rolled back. allow_oversell drops that
+    condition for sales that are already paid for and must be recorded
+    regardless.
+    """
+    if not quantities:
+        return
+
+    updated = _adjust_stock(quantities, None if allow_oversell else _sellable(quantities), stock_quantity=1)
+    if updated != len(quantities):
+        raise InsufficientStock()
+    sync_low_stock(quantities)
+    # Queryset updates skip post_save, so the catalog cache is told directly
+    transaction.on_commit(bump_catalog_version)
+
+
+def add_stock(quantities):
+    """Put units back on the shelf (deliveries, returns).
+
+    One UPDATE per distinct quantity: a delivery repeats a few pack sizes
+    across thousands of products, and a plain IN list is far cheaper to
+    build and run than a CASE branch per product.
+    """
+    if not quantities:
+        return
+    by_quantity = {}
+    for product_id, quantity in quantities.items():
+        by_quantity.setdefault(quantity, []).append(product_id)
+    now = timezone.now()
+    for quantity, product_ids in by_quantity.items():
+        Product.objects.filter(pk__in=product_ids).update(
+            stock_quantity=F('stock_quantity') + quantity, updated_at=now,
+        )
+    sync_low_stock(quantities)
+    transaction.on_commit(bump_catalog_version)
+
+
+def sale_quantities(sale_id):
+    """{product_id: quantity} for a recorded sale"""
+    return dict(
+        SaleItem.objects.filter(sale_id=sale_id).order_by().values_list('product_id').annotate(total=Sum('quantity'))
+    )
+
+
+def reserve_stock(sale, quantities):
+    """Hold a pending sale's basket until it is paid, fails or expires.
+
+    Same conditional UPDATE as decrement_stock, but the units move into
+    reserved_quantity, so they stop counting as sellable without leaving
+    the shelf. Raises InsufficientStock if any line cannot be covered.
+    """
+    updated = _adjust_stock(quantities, _sellable(quantities), reserved_quantity=-1)
+    if updated != len(quantities):
+        raise InsufficientStock()
+    ttl = timedelta(minutes=getattr(settings, 'STOCK_RESERVATION_TTL', 15))
+    reservation = StockReservation.objects.create(sale=sale, expires_at=timezone.now() + ttl)
+    transaction.on_commit(bump_catalog_version)
+    return reservation
+
+
+def consume_reservation(sale_id):
+    """Turn a paid sale's hold into a stock decrement.
+
+    Returns False when the sale holds nothing (it expired or predates
+    reservations) and the caller must decrement stock itself. The status
+    change is the only guard needed: of any number of concurrent calls,
+    exactly one sees the row still active.
+    """
+    with transaction.atomic():
+        if not StockReservation.objects.filter(sale_id=sale_id, status='active').update(status='consumed'):
+            return False
+        quantities = sale_quantities(sale_id)
+        _adjust_stock(quantities, stock_quantity=1, reserved_quantity=1)
+        sync_low_stock(quantities)
+        transaction.on_commit(bump_catalog_version)
+    return True
+
+
+def release_reservation(sale_id):
+    """Put a failed or abandoned sale's held stock back on sale. Safe to repeat."""
+    with transaction.atomic():
+        if not StockReservation.objects.filter(sale_id=sale_id, status='active').update(status='released'):
+            return False
+        _adjust_stock(sale_quantities(sale_id), reserved_quantity=1)
+        transaction.on_commit(bump_catalog_version)
+    return True
+
+
+def release_expired_reservations(limit=100):
+    """Release holds past their TTL; returns how many were released"""
+    expired = StockReservation.objects.filter(status='active', expires_at__lt=timezone.now()).values_list(
+        'sale_id', flat=True,
+    )[:limit]
+    return sum(1 for sale_id in list(expired) if release_reservation(sale_id))
+
+
+def create_sale_items(sale, lines):
+    """Bulk insert SaleItems for (product, quantity, unit_price) lines"""
+    return SaleItem.objects.bulk_create([
+        SaleItem(
+            sale=sale,
+            product=product,
+            quantity=quantity,
+            unit_price=unit_price,
+            total_price=unit_price * quantity,
+        )
+        for product, quantity, unit_price in lines
+    ])
+
+
+def record_stock_movements(quantities, user, transaction_type, notes):
+    """Bulk insert Inventory rows for a {product_id: quantity} map.
+
+    Quantities are stored signed, exactly as the single-row writes did:
+    negative for stock leaving the shelf.
+    """
+    return Inventory.objects.bulk_create([
+        Inventory(
+            product_id=product_id,
+            transaction_type=transaction_type,
+            quantity=quantity,
+            notes=notes,
+            user=user,
+        )
+        for product_id, quantity in quantities.items()
+    ])
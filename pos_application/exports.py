@@ -0,0 +1,90 @@
+import csv
+import tempfile
+
+from django.db.models import F
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, PatternFill
+
+from .models import Product
+
+# Rows fetched per database round trip while streaming
+EXPORT_CHUNK_SIZE = 2000
+# Files larger than this spill from memory to disk while the workbook is zipped
+SPOOL_SIZE = 1024 * 1024
+
+EXPORT_HEADERS = [
+    'SKU', 'Product Name', 'Category', 'Current Stock',
+    'Min Level', 'Unit Price', 'Cost Price', 'Stock Value', 'Status'
+]
+# Fixed widths: measuring every cell means holding the whole sheet
+EXPORT_WIDTHS = [16, 40, 20, 14, 10, 12, 12, 14, 13]
+
+
+def inventory_rows():
+    """Active products as export rows, read from the database in chunks"""
+    products = Product.objects.filter(is_active=True).order_by('name').annotate(
+        category_name=F('category__name'),
+    ).values_list(
+        'sku', 'name', 'category_name', 'stock_quantity', 'min_stock_level', 'price', 'cost_price',
+    )
+    for sku, name, category, stock, min_stock, price, cost_price in products.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        if stock == 0:
+            status = "Out of Stock"
+        elif stock <= min_stock:
+            status = "Low Stock"
+        else:
+            status = "In Stock"
+        yield [sku, name, category, stock, min_stock, price, cost_price, stock * cost_price, status]
+
+
+class _Echo:
+    """File-like object for csv.writer that hands each line straight back"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    """Yield a CSV export a chunk of lines at a time"""
+    writer = csv.writer(_Echo())
+    # Byte order mark so Excel opens the file as UTF-8
+    lines = ['\ufeff' + writer.writerow(EXPORT_HEADERS)]
+    for row in rows:
+        lines.append(writer.writerow(row))
+        if len(lines) >= EXPORT_CHUNK_SIZE:
+            yield ''.join(lines)
+            lines = []
+    yield ''.join(lines)
+
+
+def write_xlsx(rows, title="Inventory Report"):
+    """Write an XLSX export with a write-only sheet and return it as a rewound file.
+
+    Rows are flushed to disk as they are appended, so memory stays flat
+    however many products there are.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    for index, width in enumerate(EXPORT_WIDTHS):
+        sheet.column_dimensions[chr(ord('A') + index)].width = width
+
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    header_alignment = Alignment(horizontal="center", vertical="center")
+    header = []
+    for value in EXPORT_HEADERS:
+        cell = WriteOnlyCell(sheet, value=value)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = header_alignment
+        header.append(cell)
+    sheet.append(header)
+
+    for row in rows:
+        sheet.append(row)
+
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    workbook.save(output)
+    output.seek(0)
+    return output
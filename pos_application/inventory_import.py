@@ -0,0 +1,274 @@
+import csv
+import io
+from zipfile import BadZipFile
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from .catalog import bump_catalog_version
+from .checkout import add_stock, record_stock_movements
+from .models import Category, Product
+from .stock_alerts import sync_low_stock
+
+# Rows validated and written per transaction. Each chunk commits on its own,
+# so a bad row late in a large file never undoes the deliveries before it.
+IMPORT_CHUNK_SIZE = 1000
+# Errors beyond this are counted but not listed
+MAX_REPORTED_ERRORS = 100
+
+# Header spellings accepted for each column, after lowercasing and
+# turning spaces into underscores
+COLUMN_ALIASES = {
+    'sku': 'sku', 'code': 'sku', 'barcode': 'sku', 'item_code': 'sku',
+    'name': 'name', 'product': 'name', 'product_name': 'name',
+    'category': 'category', 'category_name': 'category',
+    'price': 'price', 'selling_price': 'price',
+    'cost_price': 'cost_price', 'cost': 'cost_price',
+    'quantity': 'quantity', 'qty': 'quantity', 'received': 'quantity',
+    'min_stock_level': 'min_stock_level', 'min_stock': 'min_stock_level', 'reorder_level': 'min_stock_level',
+    'description': 'description',
+}
+# Prices are DecimalField(max_digits=10, decimal_places=2)
+MAX_NUMBER = Decimal('100000000')
+# Product columns an import may overwrite on an existing SKU
+UPDATABLE_FIELDS = ['name', 'category_id', 'price', 'cost_price', 'min_stock_level', 'description']
+
+
+class ImportRowError(ValueError):
+    """Raised for a row that cannot be imported; the row is skipped and reported"""
+
+
+class ImportReport:
+    """Running totals for an import, reported after every chunk"""
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.received = 0
+        self.error_count = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'received': self.received,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+
+def _header(cells):
+    columns = [COLUMN_ALIASES.get(str(cell or '').strip().lower().replace(' ', '_')) for cell in cells]
+    if 'sku' not in columns:
+        raise ValueError('The file needs a SKU column')
+    return columns
+
+
+def _csv_rows(handle):
+    reader = csv.reader(io.TextIOWrapper(handle, encoding='utf-8-sig', newline=''))
+    columns = _header(next(reader, []))
+    for line, cells in enumerate(reader, start=2):
+        yield line, {column: cell for column, cell in zip(columns, cells) if column}
+
+
+def _xlsx_rows(handle):
+    # Read-only mode parses the sheet XML as it is iterated instead of
+    # building every cell up front
+    try:
+        workbook = load_workbook(handle, read_only=True, data_only=True)
+    except (BadZipFile, KeyError):
+        raise ValueError('The file is not a readable Excel workbook')
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        columns = _header(next(rows, ()))
+        for line, cells in enumerate(rows, start=2):
+            yield line, {column: cell for column, cell in zip(columns, cells) if column}
+    finally:
+        workbook.close()
+
+
+def read_rows(handle, filename):
+    """Yield (line number, {column: raw value}) from a CSV or XLSX file, one row at a time"""
+    if filename.lower().endswith(('.xlsx', '.xlsm')):
+        return _xlsx_rows(handle)
+    return _csv_rows(handle)
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+def _decimal(value, column):
+    text = _text(value)
+    if not text:
+        return None
+    try:
+        number = Decimal(text.replace(',', ''))
+    except InvalidOperation:
+        raise ImportRowError(f'{column} "{text}" is not a number')
+    if not number.is_finite():
+        raise ImportRowError(f'{column} "{text}" is not a number')
+    if number < 0:
+        raise ImportRowError(f'{column} cannot be negative')
+    if number >= MAX_NUMBER:
+        raise ImportRowError(f'{column} is too large')
+    return number.quantize(Decimal('0.01'))
+
+
+def _whole(value, column):
+    number = _decimal(value, column)
+    if number is None:
+        return None
+    if number != number.to_integral_value():
+        raise ImportRowError(f'{column} must be a whole number')
+    return int(number)
+
+
+def _parse_row(raw):
+    sku = _text(raw.get('sku'))
+    if not sku:
+        raise ImportRowError('SKU is required')
+    if len(sku) > 50:
+        raise ImportRowError('SKU is longer than 50 characters')
+    name = _text(raw.get('name'))
+    if len(name) > 200:
+        raise ImportRowError('Name is longer than 200 characters')
+    return {
+        'sku': sku,
+        'name': name or None,
+        'category': _text(raw.get('category')) or None,
+        'price': _decimal(raw.get('price'), 'Price'),
+        'cost_price': _decimal(raw.get('cost_price'), 'Cost price'),
+        'quantity': _whole(raw.get('quantity'), 'Quantity') or 0,
+        'min_stock_level': _whole(raw.get('min_stock_level'), 'Min stock level'),
+        'description': _text(raw.get('description')) or None,
+    }
+
+
+class _Categories:
+    """Category ids by case-insensitive name, creating the ones a file introduces"""
+
+    def __init__(self):
+        self.ids = {}
+        for pk, name in Category.objects.order_by('-pk').values_list('id', 'name'):
+            self.ids[name.lower()] = pk
+
+    def resolve(self, name):
+        key = name.lower()
+        if key not in self.ids:
+            self.ids[key] = Category.objects.create(name=name).pk
+        return self.ids[key]
+
+
+def _import_chunk(rows, user, notes, categories, report):
+    # Later lines for the same SKU win, and their quantities add up
+    parsed = {}
+    for line, raw in rows:
+        try:
+            row = _parse_row(raw)
+        except ImportRowError as e:
+            report.error(line, str(e))
+            continue
+        if row['sku'] in parsed:
+            previous = parsed[row['sku']]
+            row = {key: previous[key] if value is None else value for key, value in row.items()}
+            row['quantity'] += previous['quantity']
+        row['line'] = line
+        parsed[row['sku']] = row
+
+    existing = Product.objects.in_bulk(list(parsed), field_name='sku')
+    now = timezone.now()
+    new_products = []
+    changed = []
+    changed_fields = set()
+    restocked = {}
+
+    for sku, row in parsed.items():
+        category_id = categories.resolve(row['category']) if row['category'] else None
+        product = existing.get(sku)
+        if product is None:
+            if not (row['name'] and row['price'] is not None and category_id):
+                report.error(row['line'], f'New SKU {sku} needs a name, price and category')
+                continue
+            min_stock_level = 5 if row['min_stock_level'] is None else row['min_stock_level']
+            new_products.append(Product(
+                sku=sku,
+                name=row['name'],
+                category_id=category_id,
+                price=row['price'],
+                cost_price=row['cost_price'] or 0,
+                stock_quantity=row['quantity'],
+                min_stock_level=min_stock_level,
+                low_stock=row['quantity'] <= min_stock_level,
+                description=row['description'] or '',
+            ))
+            continue
+
+        values = dict(row, category_id=category_id)
+        fields = [
+            field for field in UPDATABLE_FIELDS
+            if values[field] is not None and getattr(product, field) != values[field]
+        ]
+        if fields:
+            for field in fields:
+                setattr(product, field, values[field])
+            # bulk_update does not run auto_now: stamp it so terminals pick the change up
+            product.updated_at = now
+            changed.append(product)
+            changed_fields.update(fields)
+        if row['quantity']:
+            restocked[product.pk] = row['quantity']
+
+    with transaction.atomic():
+        received = dict(restocked)
+        for product in Product.objects.bulk_create(new_products):
+            if product.stock_quantity:
+                received[product.pk] = product.stock_quantity
+        if changed:
+            Product.objects.bulk_update(changed, sorted(changed_fields) + ['updated_at'])
+            if 'min_stock_level' in changed_fields:
+                sync_low_stock([product.pk for product in changed])
+        # Existing stock is moved by an F() update, never overwritten, so
+        # sales running during the import are not lost
+        add_stock(restocked)
+        record_stock_movements(received, user=user, transaction_type='in', notes=notes)
+        if new_products or changed:
+            # Bulk writes skip post_save
+            transaction.on_commit(bump_catalog_version)
+
+    report.rows += len(rows)
+    report.created += len(new_products)
+    report.updated += len(changed)
+    report.received += sum(received.values())
+
+
+def import_inventory(rows, user, notes='Bulk import', chunk_size=IMPORT_CHUNK_SIZE):
+    """Upsert products by SKU from (line, raw row) pairs, chunk by chunk.
+
+    New SKUs are created with the quantity as their initial stock; existing
+    ones get the columns present in the row and the quantity added to their
+    stock. Every unit received gets an 'in' ledger row. Yields the running
+    ImportReport after each chunk.
+    """
+    report = ImportReport()
+    categories = _Categories()
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            _import_chunk(chunk, user, notes, categories, report)
+            chunk = []
+            yield report
+    if chunk:
+        _import_chunk(chunk, user, notes, categories, report)
+    yield report
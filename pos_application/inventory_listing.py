@@ -0,0 +1,114 @@
+from django.core.paginator import Paginator
+from django.db.models import Case, CharField, Count, DecimalField, ExpressionWrapper, F, Q, Value, When
+from django.utils.functional import cached_property
+
+from .models import Product
+from .search import product_text_filter
+
+INVENTORY_PAGE_SIZE = 50
+
+OUT_OF_STOCK = Q(stock_quantity__lte=0)
+# The low_stock flag is kept in step by stock_alerts.sync_low_stock and has
+# its own partial index, so filtering on it never scans the catalog
+LOW_STOCK = Q(low_stock=True, stock_quantity__gt=0)
+IN_STOCK = Q(low_stock=False, stock_quantity__gt=0)
+STATUS_FILTERS = {
+    'out_of_stock': OUT_OF_STOCK,
+    'low_stock': LOW_STOCK,
+    'in_stock': IN_STOCK,
+}
+
+# Each order ends on id so pages are stable, and matches one of the
+# (column, id) indexes on Product
+SORT_ORDERS = {
+    'name': ('name', 'id'),
+    '-name': ('-name', '-id'),
+    'stock_quantity': ('stock_quantity', 'id'),
+    '-stock_quantity': ('-stock_quantity', '-id'),
+    'price': ('price', 'id'),
+    '-price': ('-price', '-id'),
+}
+DEFAULT_SORT = 'name'
+
+
+class _CountedPaginator(Paginator):
+    """Paginator that is told its count instead of running a COUNT(*)"""
+
+    def __init__(self, object_list, per_page, count):
+        super().__init__(object_list, per_page)
+        self._count = count
+
+    @cached_property
+    def count(self):
+        return self._count
+
+
+def inventory_counts(products):
+    """Product counts for each category and stock status, in one grouped query.
+
+    Returns {category_id: {'total', 'in_stock', 'low_stock', 'out_of_stock'}}.
+    """
+    rows = products.order_by().values('category_id').annotate(
+        total=Count('id'),
+        low_stock=Count('id', filter=LOW_STOCK),
+        out_of_stock=Count('id', filter=OUT_OF_STOCK),
+    )
+    counts = {}
+    for row in rows:
+        counts[row['category_id']] = {
+            'total': row['total'],
+            'in_stock': row['total'] - row['low_stock'] - row['out_of_stock'],
+            'low_stock': row['low_stock'],
+            'out_of_stock': row['out_of_stock'],
+        }
+    return counts
+
+
+def inventory_page(category_id=None, status=None, query='', sort=DEFAULT_SORT, page=1):
+    """One page of the inventory screen and the counts shown around it.
+
+    Rows come annotated with stock_value and stock_status, so the template
+    does no arithmetic. The counts are read once, filtered by the search
+    only: the status cards sum the selected category's row, the category
+    picker reads each category's figure for the selected status, and the
+    page total is the cell where both meet, so no COUNT(*) is needed.
+    """
+    products = Product.objects.all()
+    query = (query or '').strip()
+    if query:
+        products = products.filter(product_text_filter(query))
+    counts = inventory_counts(products)
+
+    if category_id:
+        products = products.filter(category_id=category_id)
+        selected = [counts.get(int(category_id), {})]
+    else:
+        selected = counts.values()
+    status_counts = {
+        key: sum(row.get(key, 0) for row in selected)
+        for key in ('total', 'in_stock', 'low_stock', 'out_of_stock')
+    }
+    if status in STATUS_FILTERS:
+        products = products.filter(STATUS_FILTERS[status])
+    category_counts = {
+        pk: row[status if status in STATUS_FILTERS else 'total'] for pk, row in counts.items()
+    }
+
+    products = products.select_related('category', 'reorder_suggestion').annotate(
+        stock_value=ExpressionWrapper(
+            F('stock_quantity') * F('cost_price'),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        ),
+        stock_status=Case(
+            When(OUT_OF_STOCK, then=Value('out_of_stock')),
+            When(low_stock=True, then=Value('low_stock')),
+            default=Value('in_stock'),
+            output_field=CharField(),
+        ),
+    ).order_by(*SORT_ORDERS.get(sort, SORT_ORDERS[DEFAULT_SORT]))
+
+    paginator = _CountedPaginator(
+        products, INVENTORY_PAGE_SIZE,
+        count=status_counts[status] if status in STATUS_FILTERS else status_counts['total'],
+    )
+    return paginator.get_page(page), status_counts, category_counts
@@ -0,0 +1,118 @@
+import base64
+import binascii
+import json
+from datetime import timedelta
+
+from django.db.models import Max, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Inventory, StockSnapshot
+
+# Inventory rows are stamped when they are written, not when their
+# transaction commits. Checkpoints stay this far behind the clock so no
+# transaction still in flight can add a row to a period already summed up.
+CHECKPOINT_LAG = timedelta(minutes=5)
+
+HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 200
+
+
+def latest_checkpoint(at=None):
+    """as_of of the newest checkpoint at or before at (default: any), or None"""
+    snapshots = StockSnapshot.objects.all() if at is None else StockSnapshot.objects.filter(as_of__lte=at)
+    return snapshots.aggregate(latest=Max('as_of'))['latest']
+
+
+def stock_as_of(product_id, at):
+    """Units of a product on the shelf at a moment, according to the ledger.
+
+    One index seek finds the product's last checkpoint at or before at;
+    only the Inventory rows between the two are summed, and there are at
+    most one checkpoint interval's worth of those.
+    """
+    snapshot = (
+        StockSnapshot.objects.filter(product_id=product_id, as_of__lte=at)
+        .order_by('-as_of').values_list('as_of', 'quantity').first()
+    )
+    rows = Inventory.objects.filter(product_id=product_id, created_at__lte=at)
+    quantity = 0
+    if snapshot:
+        checkpoint, quantity = snapshot
+        rows = rows.filter(created_at__gt=checkpoint)
+    return quantity + (rows.aggregate(total=Sum('quantity'))['total'] or 0)
+
+
+def ledger_balances(at=None):
+    """Ledger stock of every product with history, as {product_id: quantity}.
+
+    Reads the latest checkpoint at or before at, plus one grouped pass over
+    the Inventory rows written since. Products never in the ledger are left out.
+    """
+    checkpoint = latest_checkpoint(at)
+    balances = {}
+    rows = Inventory.objects.all()
+    if checkpoint is not None:
+        balances = dict(StockSnapshot.objects.filter(as_of=checkpoint).values_list('product_id', 'quantity'))
+        rows = rows.filter(created_at__gt=checkpoint)
+    if at is not None:
+        rows = rows.filter(created_at__lte=at)
+    for product_id, total in rows.order_by().values_list('product_id').annotate(total=Sum('quantity')):
+        balances[product_id] = balances.get(product_id, 0) + total
+    return balances
+
+
+def take_checkpoint(as_of=None):
+    """Snapshot every product's ledger balance; returns the checkpoint time, or None if it would not be new"""
+    as_of = as_of or timezone.now() - CHECKPOINT_LAG
+    previous = latest_checkpoint()
+    if previous is not None and previous >= as_of:
+        return None
+    StockSnapshot.objects.bulk_create([
+        StockSnapshot(product_id=product_id, as_of=as_of, quantity=quantity)
+        for product_id, quantity in ledger_balances(as_of).items()
+    ], batch_size=1000)
+    return as_of
+
+
+def _encode_cursor(created_at, pk):
+    return base64.urlsafe_b64encode(json.dumps([created_at.isoformat(), pk]).encode()).decode()
+
+
+def _decode_cursor(cursor):
+    """(created_at, id) from a cursor made by _encode_cursor; ValueError if it is not one"""
+    try:
+        created_at, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at = parse_datetime(created_at)
+        pk = int(pk)
+    except (ValueError, TypeError, binascii.Error):
+        created_at = None
+    if created_at is None:
+        raise ValueError('Invalid cursor')
+    return created_at, pk
+
+
+def product_history(product_id, cursor=None, limit=HISTORY_PAGE_SIZE, since=None, until=None):
+    """One page of a product's ledger, newest first, and the cursor for the next page (None on the last).
+
+    Pages are seeks into the (product, created_at) index: the cursor is the
+    last row's (created_at, id), so loading more costs the same on the
+    thousandth page as on the first. since and until bound the range
+    through the same index. Raises ValueError for a cursor it did not issue.
+    """
+    limit = max(1, min(limit, MAX_HISTORY_PAGE_SIZE))
+    rows = Inventory.objects.filter(product_id=product_id).select_related('user').order_by('-created_at', '-id')
+    if since is not None:
+        rows = rows.filter(created_at__gte=since)
+    if until is not None:
+        rows = rows.filter(created_at__lte=until)
+    if cursor:
+        created_at, pk = _decode_cursor(cursor)
+        # A plain upper bound the index can seek to; ties on the timestamp are split by id
+        rows = rows.filter(created_at__lte=created_at).exclude(created_at=created_at, id__gte=pk)
+
+    records = list(rows[:limit + 1])
+    if len(records) <= limit:
+        return records, None
+    last = records[limit - 1]
+    return records[:limit], _encode_cursor(last.created_at, last.pk)
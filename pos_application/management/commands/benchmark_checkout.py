@@ -0,0 +1,101 @@
+import json
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from pos_application.models import Category, Product, Sale, SaleItem, Inventory
+from pos_application.views import process_sale
+
+
+def legacy_checkout(user, cart_items):
+    """The original per-line checkout, kept only as a baseline for comparison"""
+    with transaction.atomic():
+        total_amount = Decimal('0.00')
+        sale_items = []
+        for item in cart_items:
+            product = Product.objects.get(id=item['product_id'])
+            quantity = int(item['quantity'])
+            item_total = product.price * quantity
+            total_amount += item_total
+            sale_items.append((product, quantity, product.price, item_total))
+
+        sale = Sale.objects.create(
+            cashier=user,
+            total_amount=total_amount,
+            final_amount=total_amount,
+            payment_method='cash',
+            amount_paid=total_amount,
+        )
+        for product, quantity, unit_price, item_total in sale_items:
+            SaleItem.objects.create(
+                sale=sale, product=product, quantity=quantity,
+                unit_price=unit_price, total_price=item_total,
+            )
+            product.stock_quantity -= quantity
+            product.save()
+            Inventory.objects.create(
+                product=product, transaction_type='sale', quantity=-quantity,
+                notes=f'Sale {sale.sale_number}', user=user,
+            )
+
+
+class Command(BaseCommand):
+    help = 'Benchmark checkout latency and query count against basket size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,5,10,20,40,80',
+                            help='Comma separated basket sizes to measure')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Checkouts per basket size')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        repeat = options['repeat']
+        factory = RequestFactory()
+
+        # Everything runs inside one transaction that is rolled back at the end
+        with transaction.atomic():
+            user = User.objects.create(username='__checkout_benchmark__')
+            category = Category.objects.create(name='Benchmark')
+            products = Product.objects.bulk_create([
+                Product(name=f'Benchmark {i}', category=category, sku=f'__BENCH-{i}',
+                        price=Decimal('10.00'), stock_quantity=1_000_000)
+                for i in range(max(sizes))
+            ])
+
+            self.stdout.write(f"{'items':>6} {'legacy ms':>10} {'legacy q':>9} {'batched ms':>11} {'batched q':>10}")
+            for size in sizes:
+                cart = [{'product_id': p.id, 'quantity': 1} for p in products[:size]]
+
+                legacy_ms, legacy_queries = self._measure(repeat, lambda: legacy_checkout(user, cart))
+
+                def batched():
+                    request = factory.post('/process-sale/', data=json.dumps({
+                        'items': cart, 'payment_method': 'cash', 'amount_paid': 1_000_000,
+                    }), content_type='application/json')
+                    request.user = user
+                    response = process_sale(request)
+                    if not json.loads(response.content)['success']:
+                        raise RuntimeError(response.content)
+
+                batched_ms, batched_queries = self._measure(repeat, batched)
+                self.stdout.write(
+                    f'{size:>6} {legacy_ms:>10.2f} {legacy_queries:>9} {batched_ms:>11.2f} {batched_queries:>10}'
+                )
+
+            transaction.set_rollback(True)
+
+    def _measure(self, repeat, checkout):
+        """Return mean milliseconds and queries per checkout"""
+        elapsed = 0.0
+        with CaptureQueriesContext(connection) as ctx:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                checkout()
+                elapsed += time.perf_counter() - start
+        return elapsed * 1000 / repeat, len(ctx.captured_queries) // repeat
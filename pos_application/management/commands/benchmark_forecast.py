@@ -0,0 +1,95 @@
+import os
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from pos_application import forecasting
+from pos_application.models import Category, Product, ReorderSuggestion, Sale, SaleItem
+
+# Items per synthetic sale; only the (product, day) totals matter to the forecast
+ITEMS_PER_SALE = 200
+
+
+class Command(BaseCommand):
+    help = 'Time demand forecasting for a large catalogue with years of sales on a scratch database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=50_000)
+        parser.add_argument('--days', type=int, default=730, help='Days of sales history')
+        parser.add_argument('--density', type=float, default=0.05,
+                            help='Share of (product, day) pairs with at least one sale')
+
+    def handle(self, *args, **options):
+        # Never touch the real database: build a throwaway file-backed copy of the schema
+        scratch = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+        scratch.close()
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = scratch.name
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+        try:
+            started = time.perf_counter()
+            self.populate(options['products'], options['days'], options['density'])
+            self.stdout.write(f'Generated {SaleItem.objects.count()} sale lines for {options["products"]} products '
+                              f'over {options["days"]} days in {time.perf_counter() - started:.1f}s')
+
+            timings = {}
+
+            def timed(label, function, *args):
+                started = time.perf_counter()
+                result = function(*args)
+                timings[label] = time.perf_counter() - started
+                return result
+
+            ids, available, listed = timed('load products', forecasting.load_products)
+            sale_ids, ages, units = timed('load daily sales', forecasting.load_daily_sales, options['days'])
+            result = timed('vectorized forecast', forecasting.forecast, ids, available, listed, sale_ids, ages, units)
+            timed('full refresh (load, forecast, upsert)', forecasting.refresh_suggestions)
+            for label, seconds in timings.items():
+                self.stdout.write(f'{label:<38} {seconds:7.3f}s')
+            self.stdout.write(f'{len(sale_ids)} product-days; {int((result["reorder_quantity"] > 0).sum())} '
+                              f'products need reordering; {ReorderSuggestion.objects.count()} suggestions stored')
+            self.stdout.write(self.style.SUCCESS('✓ Forecast complete'))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if os.path.exists(scratch.name):
+                os.remove(scratch.name)
+
+    def populate(self, product_count, days, density):
+        rng = np.random.default_rng(7)
+        cashier = User.objects.create(username='forecast')
+        category = Category.objects.create(name='Forecast')
+        Product.objects.bulk_create([
+            Product(name=f'Product {i}', sku=f'FC-{i:07d}', category=category, price=Decimal('10.00'),
+                    stock_quantity=int(stock))
+            for i, stock in enumerate(rng.integers(0, 200, product_count))
+        ], batch_size=5000)
+        product_ids = np.array(Product.objects.order_by('id').values_list('id', flat=True))
+        # Each product has its own popularity; busy days are mostly recent ones
+        popularity = rng.gamma(0.6, 2.0, product_count)
+
+        now = timezone.now()
+        with transaction.atomic():
+            for age in range(days):
+                sold = np.flatnonzero(rng.random(product_count) < density * np.minimum(popularity, 4) / 1.2)
+                if not len(sold):
+                    continue
+                quantities = rng.poisson(popularity[sold]) + 1
+                sales = Sale.objects.bulk_create([
+                    Sale(sale_number=f'FC{age:04d}-{n:05d}', cashier=cashier, total_amount=0,
+                         final_amount=0, amount_paid=0)
+                    for n in range((len(sold) + ITEMS_PER_SALE - 1) // ITEMS_PER_SALE)
+                ])
+                # auto_now_add stamps bulk_create rows with now: backdate them afterwards
+                Sale.objects.filter(pk__in=[sale.pk for sale in sales]).update(created_at=now - timedelta(days=age))
+                SaleItem.objects.bulk_create([
+                    SaleItem(sale=sales[n // ITEMS_PER_SALE], product_id=int(product_ids[index]),
+                             quantity=int(quantity), unit_price=Decimal('10.00'), total_price=Decimal('10.00'))
+                    for n, (index, quantity) in enumerate(zip(sold, quantities))
+                ], batch_size=5000)
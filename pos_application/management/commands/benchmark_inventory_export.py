@@ -0,0 +1,112 @@
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from decimal import Decimal
+from io import BytesIO
+
+import openpyxl
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from openpyxl.styles import Alignment, Font, PatternFill
+
+from pos_application.models import Category, Product
+
+
+def legacy_export():
+    """The workbook export_inventory used to build in memory, kept here so
+    the old cost can still be measured"""
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Inventory Report"
+    headers = [
+        'SKU', 'Product Name', 'Category', 'Current Stock',
+        'Min Level', 'Unit Price', 'Cost Price', 'Stock Value', 'Status'
+    ]
+    for col, header in enumerate(headers, 1):
+        cell = ws.cell(row=1, column=col, value=header)
+        cell.font = Font(bold=True, color="FFFFFF")
+        cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+        cell.alignment = Alignment(horizontal="center", vertical="center")
+    products = Product.objects.select_related('category').filter(is_active=True).order_by('name')
+    for row, product in enumerate(products, 2):
+        if product.stock_quantity == 0:
+            status = "Out of Stock"
+        elif product.is_low_stock:
+            status = "Low Stock"
+        else:
+            status = "In Stock"
+        row_data = [
+            product.sku, product.name, product.category.name, product.stock_quantity,
+            product.min_stock_level, float(product.price), float(product.cost_price),
+            float(product.stock_quantity * product.cost_price), status
+        ]
+        for col, value in enumerate(row_data, 1):
+            ws.cell(row=row, column=col, value=value)
+    for column in ws.columns:
+        max_length = max(len(str(cell.value)) for cell in column)
+        ws.column_dimensions[column[0].column_letter].width = min(max_length + 2, 50)
+    output = BytesIO()
+    wb.save(output)
+    return len(output.getvalue())
+
+
+class Command(BaseCommand):
+    help = 'Compare time and peak memory of the old and streaming inventory exports on a scratch database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--skip-legacy', action='store_true', help='Only measure the streaming exports')
+
+    def handle(self, *args, **options):
+        # Never touch the real database: build a throwaway file-backed copy of the schema
+        scratch = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+        scratch.close()
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = scratch.name
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+        try:
+            user = User.objects.create(username='exporter')
+            categories = [Category.objects.create(name=f'Category {i}') for i in range(20)]
+            Product.objects.bulk_create([
+                Product(
+                    name=f'Product {i:06d}', sku=f'SKU-{i:07d}', category=random.choice(categories),
+                    price=Decimal(random.randint(100, 90000)), cost_price=Decimal(random.randint(50, 500)),
+                    stock_quantity=random.randint(0, 40),
+                )
+                for i in range(options['products'])
+            ], batch_size=5000)
+
+            client = Client()
+            client.force_login(user)
+
+            def streamed(query):
+                def run():
+                    response = client.get('/export/' + query)
+                    return sum(len(chunk) for chunk in response.streaming_content)
+                return run
+
+            exports = [('Streaming XLSX', streamed('')), ('Streaming CSV', streamed('?format=csv'))]
+            if not options['skip_legacy']:
+                exports.insert(0, ('Legacy XLSX', legacy_export))
+
+            self.stdout.write(f"{options['products']} products")
+            for label, run in exports:
+                started = time.perf_counter()
+                size = run()
+                elapsed = time.perf_counter() - started
+                # A second pass under tracemalloc, which slows everything down
+                tracemalloc.start()
+                run()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                self.stdout.write(
+                    f'{label:<15} {elapsed:6.2f}s  peak {peak / 1024 / 1024:7.1f} MB  file {size / 1024 / 1024:5.1f} MB'
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if os.path.exists(scratch.name):
+                os.remove(scratch.name)
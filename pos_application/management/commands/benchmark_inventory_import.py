@@ -0,0 +1,94 @@
+import csv
+import os
+import random
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from openpyxl import Workbook
+
+from pos_application.inventory_import import import_inventory, read_rows
+from pos_application.ledger import ledger_balances
+from pos_application.models import Category, Inventory, Product
+
+HEADER = ['SKU', 'Name', 'Category', 'Price', 'Cost Price', 'Quantity']
+CATEGORIES = ['Mobiles', 'Computers', 'Watches', 'Shoes', 'Headphones']
+
+
+class Command(BaseCommand):
+    help = 'Time a new-catalogue import and a restocking import of the same SKUs on a scratch database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000, help='Lines per delivery file')
+        parser.add_argument('--format', choices=['csv', 'xlsx'], default='csv')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        fmt = options['format']
+        workdir = tempfile.mkdtemp()
+
+        # Never touch the real database: build a throwaway file-backed copy of the schema
+        scratch = os.path.join(workdir, 'scratch.sqlite3')
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = scratch
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+        try:
+            user = User.objects.create(username='importer')
+            Category.objects.create(name=CATEGORIES[0])
+
+            catalogue = self.write(workdir, f'catalogue.{fmt}', [
+                [f'SKU-{i:07d}', f'Product {i}', random.choice(CATEGORIES), f'{random.randint(100, 90000)}.00',
+                 f'{random.randint(50, 500)}.00', random.randint(0, 40)]
+                for i in range(rows)
+            ])
+            # A restock of every SKU, with a price change on one line in ten
+            delivery = self.write(workdir, f'delivery.{fmt}', [
+                [f'SKU-{i:07d}', '', '', f'{random.randint(100, 90000)}.00' if i % 10 == 0 else '', '',
+                 random.randint(1, 20)]
+                for i in range(rows)
+            ])
+
+            for label, path in [('New catalogue', catalogue), ('Restock', delivery)]:
+                started = time.perf_counter()
+                with open(path, 'rb') as handle:
+                    for report in import_inventory(read_rows(handle, path), user, label):
+                        pass
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'{label:<14} {rows} rows in {elapsed:6.2f}s ({rows / elapsed:,.0f} rows/s): '
+                    f'{report.created} created, {report.updated} updated, {report.received} units received, '
+                    f'{report.error_count} errors'
+                )
+                if report.error_count:
+                    raise CommandError(f'Unexpected row errors: {report.errors[:5]}')
+
+            balances = ledger_balances()
+            drift = [pk for pk, quantity in Product.objects.values_list('id', 'stock_quantity')
+                     if quantity != balances.get(pk, 0)]
+            self.stdout.write(f'Products / ledger rows: {Product.objects.count()} / {Inventory.objects.count()}')
+            if Product.objects.count() != rows or drift:
+                raise CommandError(f'{len(drift)} products disagree with their ledger')
+            self.stdout.write(self.style.SUCCESS('✓ Every imported product matches its ledger'))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            for name in os.listdir(workdir):
+                os.remove(os.path.join(workdir, name))
+            os.rmdir(workdir)
+
+    def write(self, workdir, filename, lines):
+        path = os.path.join(workdir, filename)
+        if filename.endswith('.csv'):
+            with open(path, 'w', newline='') as handle:
+                writer = csv.writer(handle)
+                writer.writerow(HEADER)
+                writer.writerows(lines)
+        else:
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet()
+            sheet.append(HEADER)
+            for line in lines:
+                sheet.append(line)
+            workbook.save(path)
+        return path
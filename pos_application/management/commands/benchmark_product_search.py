@@ -0,0 +1,164 @@
+import os
+import random
+import string
+import tempfile
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import F, Q
+
+from pos_application.models import Category, Product
+from pos_application.search import find_products, missing_search_triggers
+
+BRANDS = ['Acme', 'Bidco', 'Brookside', 'Cadbury', 'Colgate', 'Dettol', 'Elianto', 'Fresha', 'Golden',
+          'Highlands', 'Jogoo', 'Kasuku', 'Ketepa', 'Kimbo', 'Menengai', 'Nivea', 'Omo', 'Pembe', 'Royco',
+          'Samsung', 'Tecno', 'Tusker', 'Unga', 'Velvex', 'Weetabix']
+ITEMS = ['Maize Flour', 'Cooking Oil', 'Toothpaste', 'Soap', 'Milk', 'Tea Leaves', 'Biscuits', 'Juice',
+         'Detergent', 'Body Lotion', 'Sugar', 'Rice', 'Charger', 'Earphones', 'Phone Case', 'Bread',
+         'Mineral Water', 'Tissue', 'Spaghetti', 'Margarine', 'Drinking Chocolate', 'Baking Flour']
+SIZES = ['250ml', '500ml', '1L', '2L', '5L', '100g', '250g', '500g', '1kg', '2kg', 'Pack of 6', 'Single']
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def legacy_search(query, limit):
+    """The search_products query as it was before the index, including the per-row category lookup"""
+    products = Product.objects.filter(
+        Q(name__icontains=query) | Q(sku__icontains=query),
+        is_active=True,
+        stock_quantity__gt=0
+    )[:limit]
+    return [(product.id, product.category.name) for product in products]
+
+
+def typo(word):
+    if len(word) < 4:
+        return word
+    i = random.randrange(1, len(word) - 2)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark product search latency on a scratch database with a large catalogue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000, help='Catalogue size to seed')
+        parser.add_argument('--queries', type=int, default=2000, help='Searches per run')
+        parser.add_argument('--legacy-queries', type=int, default=200,
+                            help='Searches to run through the old icontains query for comparison (0 to skip)')
+        parser.add_argument('--target-ms', type=float, default=10.0, help='Fail if p99 exceeds this')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+
+        # Never touch the real database: build a throwaway file-backed copy of the schema
+        scratch = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+        scratch.close()
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = scratch.name
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+        try:
+            catalogue = self.seed_catalogue(options['products'])
+            self.check_index()
+            queries = self.build_queries(catalogue, options['queries'])
+
+            find_products('warm up')
+            indexed = self.run(find_products, queries)
+            self.report('Indexed search', indexed)
+
+            if options['legacy_queries']:
+                legacy = self.run(legacy_search, random.sample(queries, min(len(queries), options['legacy_queries'])))
+                self.report('Legacy icontains', legacy)
+
+            worst = percentile([ms for _, ms in indexed], 99)
+            if worst > options['target_ms']:
+                raise CommandError(f"p99 {worst:.2f}ms exceeds the {options['target_ms']:.0f}ms target")
+            self.stdout.write(self.style.SUCCESS(
+                f"✓ p99 {worst:.2f}ms at {options['products']} products (target {options['target_ms']:.0f}ms)"
+            ))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if os.path.exists(scratch.name):
+                os.remove(scratch.name)
+
+    def seed_catalogue(self, count):
+        started = time.perf_counter()
+        categories = Category.objects.bulk_create([Category(name=item) for item in ITEMS])
+        catalogue = []
+        batch = []
+        for index in range(count):
+            item = random.randrange(len(ITEMS))
+            name = f"{random.choice(BRANDS)} {ITEMS[item]} {random.choice(SIZES)}"
+            sku = f"{ITEMS[item][:3].upper()}-{index:06d}"
+            catalogue.append((name, sku))
+            batch.append(Product(
+                name=name,
+                category=categories[item],
+                sku=sku,
+                price=Decimal(random.randint(20, 5000)),
+                stock_quantity=random.randint(0, 50),
+            ))
+            if len(batch) == 5000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        Product.objects.bulk_create(batch)
+        self.stdout.write(f'Seeded {count} products in {time.perf_counter() - started:.1f}s')
+        return catalogue
+
+    def check_index(self, samples=20):
+        """Fail unless seeded products can be found: timing an empty index measures nothing"""
+        missing = missing_search_triggers()
+        if missing:
+            raise CommandError(f"Search index triggers missing: {', '.join(missing)}")
+        sellable = Product.objects.filter(is_active=True, stock_quantity__gt=F('reserved_quantity'))
+        for product_id, name, sku in sellable.order_by('?').values_list('id', 'name', 'sku')[:samples]:
+            for query in (sku, name):
+                if product_id not in [result['id'] for result in find_products(query, 50)]:
+                    raise CommandError(f"Search for {query!r} did not return the product it was taken from")
+
+    def build_queries(self, catalogue, count):
+        kinds = {
+            'short': lambda name, sku: name.split()[random.randrange(len(name.split()))][:2],
+            'prefix': lambda name, sku: name.split()[random.randrange(len(name.split()))][:random.randint(3, 5)],
+            'substring': lambda name, sku: name[random.randrange(len(name) - 4):][:4],
+            'two words': lambda name, sku: ' '.join(name.split()[:2]),
+            'exact sku': lambda name, sku: sku,
+            'typo': lambda name, sku: typo(max(name.split(), key=len)),
+            'no match': lambda name, sku: ''.join(random.choices(string.ascii_lowercase, k=6)),
+        }
+        queries = []
+        for _ in range(count):
+            name, sku = random.choice(catalogue)
+            kind = random.choice(list(kinds))
+            queries.append((kind, kinds[kind](name, sku)))
+        return queries
+
+    def run(self, search, queries):
+        timings = []
+        for kind, query in queries:
+            started = time.perf_counter()
+            search(query, 10)
+            timings.append((kind, (time.perf_counter() - started) * 1000))
+        return timings
+
+    def report(self, label, timings):
+        by_kind = {}
+        for kind, ms in timings:
+            by_kind.setdefault(kind, []).append(ms)
+        all_ms = [ms for _, ms in timings]
+        self.stdout.write(f'\n{label} ({len(timings)} queries)')
+        self.stdout.write(f"  {'kind':<12} {'n':>5} {'p50':>8} {'p95':>8} {'p99':>8}")
+        for kind, values in sorted(by_kind.items()) + [('all', all_ms)]:
+            self.stdout.write(
+                f"  {kind:<12} {len(values):>5} {percentile(values, 50):>7.2f}ms "
+                f"{percentile(values, 95):>7.2f}ms {percentile(values, 99):>7.2f}ms"
+            )
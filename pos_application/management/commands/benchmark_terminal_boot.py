@@ -0,0 +1,204 @@
+import gzip
+import json
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.template import engines
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from pos_application.catalog import bump_catalog_version, get_catalog
+from pos_application.models import Category, Customer, Discount, Product
+
+# The product, customer and discount markup terminal.html used to render for
+# every row, kept here so the old page weight can still be measured
+LEGACY_MARKUP = """
+{% for product in products %}
+<div class="col-lg-3 col-md-4 col-sm-6 mb-3 product-item" data-category="{{ product.category.id }}">
+    <div class="product-card h-100" onclick="addToCart({{ product.id }}, '{{ product.name|escapejs }}', {{ product.price }}, {{ product.stock_quantity }})">
+        {% if product.image %}
+            <img src="{{ product.image.url }}" alt="{{ product.name }}" class="product-image">
+        {% else %}
+            <div class="product-image bg-light d-flex align-items-center justify-content-center">
+                <i class="fas fa-image text-muted fa-2x"></i>
+            </div>
+        {% endif %}
+        <div class="product-info">
+            <div class="product-name">{{ product.name }}</div>
+            <div class="product-category">{{ product.category.name }}</div>
+            <div class="d-flex justify-content-between align-items-center mt-2">
+                <div class="product-price">KES {{ product.price }}</div>
+                <small class="text-muted">{{ product.stock_quantity }} left</small>
+            </div>
+            {% if product.is_low_stock %}
+                <div class="mt-1"><span class="badge bg-warning text-dark">Low Stock</span></div>
+            {% endif %}
+        </div>
+    </div>
+</div>
+{% endfor %}
+{% for customer in customers %}
+<option value="{{ customer.id }}" data-name="{{ customer.name }}" data-tier="{{ customer.loyalty_tier }}" data-points="{{ customer.loyalty_points }}">
+    {{ customer.name }} ({{ customer.get_loyalty_tier_display }})
+</option>
+{% endfor %}
+{% for discount in discounts %}
+<option value="{{ discount.id }}" data-percentage="{{ discount.percentage }}" data-minimum="{{ discount.minimum_amount }}">
+    {{ discount.name }} ({{ discount.percentage }}%)
+</option>
+{% endfor %}
+"""
+
+# What the terminal does with a snapshot before it is usable: parse, build
+# the product map, sort, and render the first page of cards
+CLIENT_SCRIPT = """
+const fs = require('fs');
+const started = process.hrtime.bigint();
+const data = JSON.parse(fs.readFileSync(process.argv[1], 'utf8'));
+const toObject = (fields, row) => { const o = {}; fields.forEach((n, i) => o[n] = row[i]); return o; };
+const products = new Map();
+data.products.forEach(row => { const p = toObject(data.fields.products, row); products.set(p.id, p); });
+const list = Array.from(products.values()).sort((a, b) => b.id - a.id);
+const html = list.filter(p => p.stock > 0).slice(0, 60)
+    .map(p => `<div class="product-card">${p.name} KES ${p.price} ${p.stock} left</div>`).join('');
+console.log(Number(process.hrtime.bigint() - started) / 1e6);
+"""
+
+
+class Command(BaseCommand):
+    help = 'Measure terminal page weight and boot time for growing catalogues on a scratch database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,50000,100000', help='Comma-separated catalogue sizes')
+        parser.add_argument('--customers', type=int, default=500)
+        parser.add_argument('--bandwidth-mbps', type=float, default=10.0,
+                            help='Link speed used to turn bytes into transfer time')
+        parser.add_argument('--changed', type=int, default=20,
+                            help='Products touched between boots for the delta measurement')
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        self.bandwidth_mbps = options['bandwidth_mbps']
+        self.bytes_per_ms = self.bandwidth_mbps * 1_000_000 / 8 / 1000
+        self.node = shutil.which('node')
+
+        # Never touch the real database or shared cache
+        scratch = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+        scratch.close()
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = scratch.name
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+        try:
+            with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+                self.run(sizes, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if os.path.exists(scratch.name):
+                os.remove(scratch.name)
+
+    def run(self, sizes, options):
+        user = User.objects.create(username='benchmark')
+        client = Client()
+        client.force_login(user)
+        categories = Category.objects.bulk_create([Category(name=f'Category {i}') for i in range(20)])
+        Customer.objects.bulk_create([
+            Customer(name=f'Customer {i}', phone=f'0700{i:06d}', loyalty_points=random.randint(0, 2000))
+            for i in range(options['customers'])
+        ])
+        now = timezone.now()
+        Discount.objects.bulk_create([
+            Discount(name=f'Discount {i}', percentage=Decimal(5 * i), valid_from=now, valid_to=now)
+            for i in range(1, 4)
+        ])
+
+        seeded = 0
+        for size in sizes:
+            Product.objects.bulk_create([
+                Product(name=f'Product {i} {random.choice(["250ml", "1kg", "Pack of 6"])}',
+                        category=random.choice(categories), sku=f'SKU-{i:06d}',
+                        price=Decimal(random.randint(20, 5000)), stock_quantity=random.randint(0, 50))
+                for i in range(seeded, size)
+            ], batch_size=5000)
+            seeded = size
+            # Seeded rows are history, not changes a returning terminal should receive
+            an_hour_ago = timezone.now() - timedelta(hours=1)
+            Product.objects.update(updated_at=an_hour_ago)
+            Customer.objects.update(updated_at=an_hour_ago)
+            bump_catalog_version()
+            get_catalog()
+            self.report(size, client, options['changed'])
+
+    def timed(self, func):
+        started = time.perf_counter()
+        result = func()
+        return result, (time.perf_counter() - started) * 1000
+
+    def transfer_ms(self, size):
+        return size / self.bytes_per_ms
+
+    def client_ms(self, body):
+        if not self.node:
+            return None
+        with tempfile.NamedTemporaryFile('wb', suffix='.json', delete=False) as handle:
+            handle.write(body)
+        try:
+            output = subprocess.run([self.node, '-e', CLIENT_SCRIPT, handle.name],
+                                    capture_output=True, text=True, check=True).stdout
+            return float(output)
+        finally:
+            os.remove(handle.name)
+
+    def report(self, size, client, changed):
+        # Old page: the current shell plus the markup it used to render per row
+        page, page_ms = self.timed(lambda: client.get('/terminal/'))
+        legacy_markup, legacy_ms = self.timed(lambda: engines['django'].from_string(LEGACY_MARKUP).render({
+            'products': get_catalog().in_stock(),
+            'customers': Customer.objects.all(),
+            'discounts': Discount.objects.filter(is_active=True),
+        }))
+        legacy_bytes = len(page.content) + len(legacy_markup.encode())
+        legacy_gzip = len(gzip.compress(page.content + legacy_markup.encode()))
+
+        snapshot, snapshot_ms = self.timed(lambda: client.get('/catalog/snapshot/', HTTP_ACCEPT_ENCODING='gzip'))
+        snapshot_raw = gzip.decompress(snapshot.content)
+        version = json.loads(snapshot_raw)['version']
+
+        time.sleep(0.01)
+        for product in Product.objects.order_by('?')[:changed]:
+            product.stock_quantity += 1
+            product.save()
+        delta, delta_ms = self.timed(
+            lambda: client.get(f'/catalog/changes/?since={version}', HTTP_ACCEPT_ENCODING='gzip')
+        )
+        client_ms = self.client_ms(snapshot_raw)
+
+        cold_ms = page_ms + snapshot_ms + self.transfer_ms(len(page.content) + len(snapshot.content))
+        warm_ms = page_ms + delta_ms + self.transfer_ms(len(page.content) + len(delta.content))
+        legacy_tti = page_ms + legacy_ms + self.transfer_ms(legacy_gzip)
+        if client_ms is not None:
+            cold_ms += client_ms
+            warm_ms += client_ms
+
+        kb = lambda n: f'{n / 1024:,.0f} KB'
+        self.stdout.write(f'\n{size:,} products')
+        self.stdout.write(f'  Legacy page:     {kb(legacy_bytes)} ({kb(legacy_gzip)} gzipped), '
+                          f'{page_ms + legacy_ms:.0f}ms server, {size:,}+ product cards in the DOM')
+        self.stdout.write(f'  New page shell:  {kb(len(page.content))}, {page_ms:.0f}ms server')
+        self.stdout.write(f'  Snapshot:        {kb(len(snapshot.content))} gzipped ({kb(len(snapshot_raw))} raw), '
+                          f'{snapshot_ms:.0f}ms server')
+        self.stdout.write(f'  Delta ({changed} changed): {len(delta.content):,} bytes, {delta_ms:.1f}ms server')
+        if client_ms is not None:
+            self.stdout.write(f'  Client boot work: {client_ms:.0f}ms (node: parse, index, first page of cards)')
+        self.stdout.write(
+            f'  Time to interactive at {self.bandwidth_mbps:g} Mbit/s: legacy >= {legacy_tti:.0f}ms '
+            f'(before the browser lays out every card), cold boot {cold_ms:.0f}ms, warm boot {warm_ms:.0f}ms'
+        )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from pos_application.catalog import catalog_cache_stats, get_catalog_version
+
+
+class Command(BaseCommand):
+    help = 'Show product catalog cache hits and misses across all workers'
+
+    def handle(self, *args, **options):
+        stats = catalog_cache_stats()
+        self.stdout.write(f"Catalog version:       {get_catalog_version()}")
+        self.stdout.write(f"Process-local hits:    {stats['local_hits']}")
+        self.stdout.write(f"Shared cache hits:     {stats['shared_hits']}")
+        self.stdout.write(f"Misses (DB rebuilds):  {stats['misses']}")
+        self.stdout.write(f"Hit rate:              {stats['hit_rate']:.1%}")
@@ -0,0 +1,204 @@
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.core.management.base import BaseCommand
+
+
+class DarajaSimulator:
+    """In-memory stand-in for the Daraja OAuth, STK push and STK query APIs"""
+
+    def __init__(self, latency, jitter, error_rate, callback_delay, success_rate, duplicate_rate, callback_url):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.callback_delay = callback_delay
+        self.success_rate = success_rate
+        self.duplicate_rate = duplicate_rate
+        self.callback_url = callback_url
+        self.requests = {}
+        self.lock = threading.Lock()
+        self.stats = {'tokens': 0, 'stk_push': 0, 'stk_errors': 0, 'stk_query': 0, 'callbacks': 0}
+
+    def delay(self):
+        time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def issue_token(self):
+        self.count('tokens')
+        return {'access_token': uuid.uuid4().hex, 'expires_in': '3599'}
+
+    def stk_push(self, payload):
+        self.count('stk_push')
+        if random.random() < self.error_rate:
+            self.count('stk_errors')
+            return 503, {'requestId': uuid.uuid4().hex, 'errorCode': '503.001.01',
+                         'errorMessage': 'Simulated Daraja outage'}
+
+        checkout_request_id = f'ws_CO_SIM_{uuid.uuid4().hex[:20]}'
+        succeeded = random.random() < self.success_rate
+        entry = {
+            'amount': payload.get('Amount'),
+            'phone': payload.get('PhoneNumber'),
+            'callback_url': self.callback_url or payload.get('CallBackURL'),
+            'result_code': 0 if succeeded else 1032,
+            'receipt': f'SIM{uuid.uuid4().hex[:7].upper()}' if succeeded else None,
+            'callback_sent_at': None,
+        }
+        with self.lock:
+            self.requests[checkout_request_id] = entry
+
+        threading.Timer(self.callback_delay, self.send_callback, args=(checkout_request_id,)).start()
+        return 200, {
+            'MerchantRequestID': uuid.uuid4().hex[:20],
+            'CheckoutRequestID': checkout_request_id,
+            'ResponseCode': '0',
+            'ResponseDescription': 'Success. Request accepted for processing',
+            'CustomerMessage': 'Success. Request accepted for processing',
+        }
+
+    def callback_body(self, checkout_request_id, entry):
+        callback = {
+            'MerchantRequestID': uuid.uuid4().hex[:20],
+            'CheckoutRequestID': checkout_request_id,
+            'ResultCode': entry['result_code'],
+            'ResultDesc': 'The service request is processed successfully.' if entry['result_code'] == 0
+            else 'Request cancelled by user',
+        }
+        if entry['result_code'] == 0:
+            callback['CallbackMetadata'] = {'Item': [
+                {'Name': 'Amount', 'Value': entry['amount']},
+                {'Name': 'MpesaReceiptNumber', 'Value': entry['receipt']},
+                {'Name': 'TransactionDate', 'Value': int(datetime.now().strftime('%Y%m%d%H%M%S'))},
+                {'Name': 'PhoneNumber', 'Value': int(entry['phone'])},
+            ]}
+        return {'Body': {'stkCallback': callback}}
+
+    def send_callback(self, checkout_request_id):
+        with self.lock:
+            entry = self.requests[checkout_request_id]
+            entry['callback_sent_at'] = time.time()
+        body = self.callback_body(checkout_request_id, entry)
+        deliveries = 2 if random.random() < self.duplicate_rate else 1
+        for _ in range(deliveries):
+            self.count('callbacks')
+            try:
+                requests.post(entry['callback_url'], json=body, timeout=30)
+            except requests.RequestException:
+                pass
+
+    def stk_query(self, payload):
+        self.count('stk_query')
+        with self.lock:
+            entry = self.requests.get(payload.get('CheckoutRequestID'))
+        if entry is None:
+            return 400, {'errorCode': '400.002.02', 'errorMessage': 'Invalid CheckoutRequestID'}
+        if entry['callback_sent_at'] is None:
+            return 500, {'errorCode': '500.001.1001', 'errorMessage': 'The transaction is being processed'}
+        return 200, {
+            'ResponseCode': '0',
+            'ResponseDescription': 'The service request has been accepted successsfully',
+            'CheckoutRequestID': payload.get('CheckoutRequestID'),
+            'ResultCode': str(entry['result_code']),
+            'ResultDesc': 'The service request is processed successfully.' if entry['result_code'] == 0
+            else 'Request cancelled by user',
+        }
+
+    def callbacks_sent(self):
+        """Receipt -> callback send time, for the load harness's latency measurements"""
+        with self.lock:
+            return {
+                entry['receipt']: entry['callback_sent_at']
+                for entry in self.requests.values()
+                if entry['receipt'] and entry['callback_sent_at']
+            }
+
+
+def make_handler(simulator):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def respond(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def read_json(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return json.loads(self.rfile.read(length) or b'{}')
+
+        def do_GET(self):
+            if self.path.startswith('/oauth/v1/generate'):
+                simulator.delay()
+                self.respond(200, simulator.issue_token())
+            elif self.path == '/__sim/stats':
+                self.respond(200, {'stats': simulator.stats, 'callbacks': simulator.callbacks_sent()})
+            else:
+                self.respond(404, {'errorMessage': 'Not found'})
+
+        def do_POST(self):
+            if not self.headers.get('Authorization', '').startswith('Bearer '):
+                self.respond(401, {'errorCode': '404.001.03', 'errorMessage': 'Invalid Access Token'})
+                return
+            payload = self.read_json()
+            simulator.delay()
+            if self.path == '/mpesa/stkpush/v1/processrequest':
+                self.respond(*simulator.stk_push(payload))
+            elif self.path == '/mpesa/stkpushquery/v1/query':
+                self.respond(*simulator.stk_query(payload))
+            else:
+                self.respond(404, {'errorMessage': 'Not found'})
+
+    return Handler
+
+
+class Command(BaseCommand):
+    help = 'Run a local Daraja API simulator (OAuth, STK push, STK query) that posts callbacks back to the app'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8099)
+        parser.add_argument('--latency', type=float, default=0.3, help='Mean API latency in seconds')
+        parser.add_argument('--jitter', type=float, default=0.1, help='Latency standard deviation in seconds')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of STK pushes answered with HTTP 503')
+        parser.add_argument('--callback-delay', type=float, default=3.0, help='Seconds before the callback is posted')
+        parser.add_argument('--success-rate', type=float, default=0.9, help='Fraction of payments the customer completes')
+        parser.add_argument('--duplicate-rate', type=float, default=0.0, help='Fraction of callbacks delivered twice')
+        parser.add_argument('--callback-url', default='', help='Override the CallBackURL sent by the app')
+
+    def handle(self, *args, **options):
+        simulator = DarajaSimulator(
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            callback_delay=options['callback_delay'],
+            success_rate=options['success_rate'],
+            duplicate_rate=options['duplicate_rate'],
+            callback_url=options['callback_url'],
+        )
+        server = ThreadingHTTPServer((options['host'], options['port']), make_handler(simulator))
+        self.stdout.write(self.style.SUCCESS(
+            f"Daraja simulator listening on http://{options['host']}:{options['port']}\n"
+            f"Point the app at it with MPESA_BASE_URL=http://{options['host']}:{options['port']}"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f'Stats: {simulator.stats}')
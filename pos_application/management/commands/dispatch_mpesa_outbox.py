@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from pos_application.mpesa import dispatch_pending
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued M-Pesa STK push requests from the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and poll the outbox every --interval seconds')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds between polls when looping')
+        parser.add_argument('--limit', type=int, default=100,
+                            help='Maximum entries to deliver per poll')
+
+    def handle(self, *args, **options):
+        while True:
+            delivered = dispatch_pending(limit=options['limit'])
+            if delivered:
+                self.stdout.write(self.style.SUCCESS(f'✓ Delivered {delivered} STK push request(s)'))
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,52 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from pos_application.models import Product
+from pos_application.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Generate missing product image thumbnails in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2,
+                            help='Images processed at once (Pillow resizes and encodes outside the GIL)')
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate thumbnails for every product with an image')
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['force']:
+            products = products.filter(image_hash='')
+        product_ids = list(products.values_list('id', flat=True))
+        if not product_ids:
+            self.stdout.write(self.style.SUCCESS('✓ Every product image already has thumbnails'))
+            return
+
+        self.force = options['force']
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='thumbnails') as pool:
+            results = list(pool.map(self.generate, product_ids))
+
+        failed = [product_id for product_id, outcome in zip(product_ids, results) if outcome is None]
+        created = sum(outcome[1] for outcome in results if outcome is not None)
+        reused = sum(1 for outcome in results if outcome is not None and outcome[1] == 0)
+        for product_id in failed:
+            self.stderr.write(self.style.ERROR(f'✗ Product {product_id}: image could not be read'))
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {len(product_ids) - len(failed)} products in {time.perf_counter() - started:.1f}s: '
+            f'{created} thumbnails written, {reused} reused existing files, {len(failed)} failed'
+        ))
+
+    def generate(self, product_id):
+        try:
+            return generate_thumbnails(product_id, force=self.force)
+        except Exception as e:
+            self.stderr.write(f'Product {product_id}: {e}')
+            return None
+        finally:
+            connections.close_all()
@@ -0,0 +1,45 @@
+import os
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from pos_application.inventory_import import IMPORT_CHUNK_SIZE, import_inventory, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Create or restock products by SKU from a CSV or XLSX delivery file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or XLSX file with a header row; SKU is the only required column')
+        parser.add_argument('--user', default='admin', help='Username recorded on the stock-in ledger rows')
+        parser.add_argument('--notes', default=None, help='Note on the ledger rows (default: the file name)')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE,
+                            help='Rows validated and committed per transaction')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['user']).first()
+        if user is None:
+            raise CommandError(f"User {options['user']} not found")
+        filename = os.path.basename(options['path'])
+        notes = options['notes'] or f'Import {filename}'
+
+        started = time.perf_counter()
+        try:
+            with open(options['path'], 'rb') as handle:
+                for report in import_inventory(read_rows(handle, filename), user, notes, options['chunk_size']):
+                    self.stdout.write(
+                        f'{report.rows} rows: {report.created} created, {report.updated} updated, '
+                        f'{report.received} units received, {report.error_count} errors'
+                    )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for error in report.errors:
+            self.stderr.write(self.style.WARNING(f"Line {error['line']}: {error['error']}"))
+        if report.error_count > len(report.errors):
+            self.stderr.write(self.style.WARNING(f'... and {report.error_count - len(report.errors)} more'))
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Imported {report.rows - report.error_count} of {report.rows} rows '
+            f'in {time.perf_counter() - started:.1f}s'
+        ))
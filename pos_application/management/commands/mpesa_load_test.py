@@ -0,0 +1,134 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Terminal:
+    """One logged-in till talking to the app over HTTP, as the browser does"""
+
+    def __init__(self, app_url, username, password):
+        self.app_url = app_url.rstrip('/')
+        self.session = requests.Session()
+        self.session.get(f'{self.app_url}/')
+        response = self.session.post(f'{self.app_url}/', data={
+            'username': username,
+            'password': password,
+            'csrfmiddlewaretoken': self.csrf_token,
+        }, headers={'Referer': f'{self.app_url}/'})
+        if 'sessionid' not in self.session.cookies:
+            raise CommandError(f'Login failed for {username} (HTTP {response.status_code})')
+
+    @property
+    def csrf_token(self):
+        return self.session.cookies.get('csrftoken', '')
+
+    def current_stock(self, product_id):
+        return self.session.get(f'{self.app_url}/product-history/{product_id}/').json()['current_stock']
+
+    def pay(self, product_id, quantity, phone_number, timeout, poll_interval):
+        """Check out one basket with M-Pesa and wait for the outcome"""
+        started = time.time()
+        sale = self.session.post(f'{self.app_url}/process-sale/', json={
+            'items': [{'product_id': product_id, 'quantity': quantity}],
+            'payment_method': 'mpesa',
+            'phone_number': phone_number,
+        }, headers={'X-CSRFToken': self.csrf_token}).json()
+        checkout_done = time.time()
+        if not sale.get('success'):
+            return {'status': 'REJECTED', 'error': sale.get('error'), 'checkout_s': checkout_done - started}
+
+        while time.time() - started < timeout:
+            status = self.session.get(f'{self.app_url}/check-payment-status/',
+                                      params={'sale_id': sale['sale_id']}).json()
+            if status.get('status') in ('SUCCESS', 'FAILED'):
+                return {
+                    'status': status['status'],
+                    'receipt': status.get('mpesa_receipt'),
+                    'checkout_s': checkout_done - started,
+                    'total_s': time.time() - started,
+                    'completed_at': time.time(),
+                }
+            time.sleep(poll_interval)
+        return {'status': 'TIMEOUT', 'checkout_s': checkout_done - started}
+
+
+class Command(BaseCommand):
+    help = 'Drive concurrent M-Pesa checkouts through a running app wired to daraja_simulator'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--app-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--simulator-url', default='http://127.0.0.1:8099')
+        parser.add_argument('--username', required=True)
+        parser.add_argument('--password', required=True)
+        parser.add_argument('--product-id', type=int, required=True)
+        parser.add_argument('--quantity', type=int, default=1, help='Units per payment')
+        parser.add_argument('--terminals', type=int, default=10, help='Concurrent terminals')
+        parser.add_argument('--payments', type=int, default=100, help='Total payments to attempt')
+        parser.add_argument('--phone', default='254712345678')
+        parser.add_argument('--timeout', type=float, default=60.0, help='Seconds to wait for each payment')
+        parser.add_argument('--poll-interval', type=float, default=0.2)
+        parser.add_argument('--settle-wait', type=float, default=5.0,
+                            help='Seconds to let late callbacks settle before checking stock')
+
+    def handle(self, *args, **options):
+        terminals = [
+            Terminal(options['app_url'], options['username'], options['password'])
+            for _ in range(options['terminals'])
+        ]
+        product_id = options['product_id']
+        stock_before = terminals[0].current_stock(product_id)
+
+        def run(index):
+            return terminals[index % len(terminals)].pay(
+                product_id, options['quantity'], options['phone'],
+                options['timeout'], options['poll_interval'],
+            )
+
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=len(terminals)) as pool:
+            results = list(pool.map(run, range(options['payments'])))
+        elapsed = time.time() - started
+
+        time.sleep(options['settle_wait'])
+        stock_after = terminals[0].current_stock(product_id)
+        simulator = requests.get(f"{options['simulator_url'].rstrip('/')}/__sim/stats").json()
+        callback_sent = simulator['callbacks']
+
+        by_status = {}
+        for result in results:
+            by_status[result['status']] = by_status.get(result['status'], 0) + 1
+        succeeded = [r for r in results if r['status'] == 'SUCCESS']
+        settled = [r for r in results if r['status'] in ('SUCCESS', 'FAILED')]
+        checkout_ms = [r['checkout_s'] * 1000 for r in results]
+        total_ms = [r['total_s'] * 1000 for r in settled]
+        callback_ms = [
+            (r['completed_at'] - callback_sent[r['receipt']]) * 1000
+            for r in succeeded if r.get('receipt') in callback_sent
+        ]
+        expected_stock = stock_before - options['quantity'] * len(succeeded)
+
+        self.stdout.write(f"Payments attempted:   {len(results)} over {elapsed:.1f}s")
+        self.stdout.write(f"Outcomes:             {by_status}")
+        self.stdout.write(f"Settled per second:   {len(settled) / elapsed:.2f}")
+        self.stdout.write(f"Checkout ms p50/p95:  {percentile(checkout_ms, 50):.0f} / {percentile(checkout_ms, 95):.0f}")
+        self.stdout.write(f"End-to-end ms p50/p95: {percentile(total_ms, 50):.0f} / {percentile(total_ms, 95):.0f}")
+        self.stdout.write(
+            f"Callback-to-completion ms p50/p95: {percentile(callback_ms, 50):.0f} / {percentile(callback_ms, 95):.0f}"
+            f" (includes up to {options['poll_interval'] * 1000:.0f}ms polling delay)"
+        )
+        self.stdout.write(f"Simulator:            {simulator['stats']}")
+        self.stdout.write(f"Stock before/after:   {stock_before} / {stock_after} (expected {expected_stock})")
+
+        if stock_after != expected_stock:
+            raise CommandError('Stock does not match completed payments')
+        self.stdout.write(self.style.SUCCESS('✓ Stock matches completed payments'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from pos_application.mpesa import token_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Show shared M-Pesa OAuth token cache hits and misses'
+
+    def handle(self, *args, **options):
+        stats = token_cache_stats()
+        self.stdout.write(f"Token cache hits:   {stats['hits']}")
+        self.stdout.write(f"Token cache misses: {stats['misses']}")
+        self.stdout.write(f"Hit rate:           {stats['hit_rate']:.1%}")
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from pos_application.stock_alerts import deliver_stock_alerts
+
+
+class Command(BaseCommand):
+    help = 'Send queued low-stock and restocked alerts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and poll for alerts every --interval seconds')
+        parser.add_argument('--interval', type=float, default=60.0,
+                            help='Seconds between polls when looping')
+        parser.add_argument('--limit', type=int, default=200,
+                            help='Maximum alerts per notification')
+
+    def handle(self, *args, **options):
+        while True:
+            sent = deliver_stock_alerts(limit=options['limit'])
+            if sent:
+                self.stdout.write(self.style.SUCCESS(f'✓ Sent {sent} stock alert(s)'))
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from pos_application.mpesa import apply_pending_callbacks
+
+
+class Command(BaseCommand):
+    help = 'Apply journaled M-Pesa callbacks that are still waiting to be processed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and poll the journal every --interval seconds')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds between polls when looping')
+        parser.add_argument('--limit', type=int, default=500,
+                            help='Maximum callbacks to apply per poll')
+
+    def handle(self, *args, **options):
+        while True:
+            applied = apply_pending_callbacks(limit=options['limit'])
+            if applied:
+                self.stdout.write(self.style.SUCCESS(f'✓ Applied {applied} M-Pesa callback(s)'))
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
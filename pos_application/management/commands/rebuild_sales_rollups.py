@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pos_application.sales_rollup import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily sales rollups the reports read from Sale and SaleItem'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        sales_rows, product_rows = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Rebuilt {sales_rows} daily sales rows and {product_rows} daily product rows '
+            f'in {time.perf_counter() - started:.1f}s'
+        ))
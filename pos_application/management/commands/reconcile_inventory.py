@@ -0,0 +1,79 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, transaction
+
+from pos_application.checkout import record_stock_movements
+from pos_application.ledger import ledger_balances, take_checkpoint
+from pos_application.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Compare every product\'s stock_quantity with its Inventory ledger, and checkpoint the ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checkpoint', action='store_true',
+                            help='Snapshot ledger balances first, so later queries sum fewer rows')
+        parser.add_argument('--fix-ledger', action='store_true',
+                            help='Append adjustment rows so the ledger matches stock_quantity')
+        parser.add_argument('--user', default='admin',
+                            help='Username recorded on adjustment rows')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep checkpointing and checking every --interval seconds')
+        parser.add_argument('--interval', type=float, default=3600.0,
+                            help='Seconds between passes when looping')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['fix_ledger']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"User {options['user']} not found")
+
+        while True:
+            if options['checkpoint']:
+                as_of = take_checkpoint()
+                if as_of:
+                    self.stdout.write(self.style.SUCCESS(f'✓ Checkpointed the ledger as of {as_of:%Y-%m-%d %H:%M:%S}'))
+
+            drift = self.find_drift()
+            if drift and user:
+                record_stock_movements(drift, user=user, transaction_type='adjustment',
+                                       notes='Ledger reconciled to stock count')
+                self.stdout.write(self.style.SUCCESS(f'✓ Recorded adjustments for {len(drift)} products'))
+            elif drift and not options['loop']:
+                raise CommandError(f'{len(drift)} products disagree with their ledger; rerun with --fix-ledger')
+            elif not drift:
+                self.stdout.write(self.style.SUCCESS('✓ Every product matches its ledger'))
+
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
+
+    def find_drift(self):
+        """{product_id: stock_quantity - ledger balance} for products that disagree"""
+        drift = self.compare(ledger_balances(), Product.objects.values_list('id', 'stock_quantity'))
+        if not drift:
+            return {}
+
+        # A sale may have committed between the two reads. Real drift is
+        # still there when the suspects are read again, side by side.
+        with transaction.atomic():
+            stock = list(Product.objects.filter(pk__in=drift).values_list('id', 'stock_quantity'))
+            balances = ledger_balances()
+        drift = self.compare(balances, stock)
+        for product_id, delta in drift.items():
+            self.stdout.write(self.style.WARNING(
+                f'Product {product_id}: stock_quantity is {delta:+d} against the ledger'
+            ))
+        return drift
+
+    @staticmethod
+    def compare(balances, stock):
+        return {
+            product_id: quantity - balances.get(product_id, 0)
+            for product_id, quantity in stock
+            if quantity != balances.get(product_id, 0)
+        }
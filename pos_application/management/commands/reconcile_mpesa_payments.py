@@ -0,0 +1,47 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from pos_application.checkout import release_expired_reservations
+from pos_application.mpesa import reconcile_pending_payments
+
+
+class Command(BaseCommand):
+    help = 'Settle or cancel M-Pesa payments still pending because no callback arrived, and release expired stock holds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=5,
+                            help='Only check payments pending for at least this many minutes')
+        parser.add_argument('--cancel-after', type=int, default=30,
+                            help='Cancel payments Safaricom cannot resolve after this many minutes')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Concurrent STK status queries')
+        parser.add_argument('--limit', type=int, default=200,
+                            help='Maximum payments to check per sweep')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep sweeping every --interval seconds')
+        parser.add_argument('--interval', type=float, default=60.0,
+                            help='Seconds between sweeps when looping')
+
+    def handle(self, *args, **options):
+        while True:
+            counts = reconcile_pending_payments(
+                older_than=timedelta(minutes=options['older_than']),
+                cancel_after=timedelta(minutes=options['cancel_after']),
+                workers=options['workers'],
+                limit=options['limit'],
+            )
+            if counts['completed'] or counts['failed']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"✓ Completed {counts['completed']}, cancelled {counts['failed']}, "
+                    f"still pending {counts['pending']}"
+                ))
+            released = release_expired_reservations(limit=options['limit'])
+            if released:
+                self.stdout.write(self.style.SUCCESS(f"✓ Released stock held by {released} expired M-Pesa sales"))
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
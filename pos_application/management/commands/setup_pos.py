@@ -1,6 +1,6 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
-from pos_application.models import Category, Product, Customer, Discount
+from pos_application.models import Category, Product, Customer, Discount, Inventory
 from decimal import Decimal
 from datetime import datetime, timedelta
 
@@ -118,6 +118,7 @@ class Command(BaseCommand):
             },
         ]
         
+        admin = User.objects.filter(username='admin').first()
         for prod_data in products_data:
             try:
                 category = Category.objects.get(name=prod_data['category'])
@@ -134,6 +135,15 @@ class Command(BaseCommand):
                     }
                 )
                 if created:
+                    if admin:
+                        # Initial stock goes through the ledger like any delivery
+                        Inventory.objects.create(
+                            product=product,
+                            transaction_type='in',
+                            quantity=product.stock_quantity,
+                            notes='Initial stock',
+                            user=admin,
+                        )
                     self.stdout.write(f'✓ Created product: {product.name}')
             except Category.DoesNotExist:
                 self.stdout.write(
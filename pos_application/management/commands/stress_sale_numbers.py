@@ -0,0 +1,88 @@
+import json
+import os
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import RequestFactory
+
+from pos_application.models import Category, Product, Sale
+from pos_application.views import process_sale
+
+
+class Command(BaseCommand):
+    help = 'Run many concurrent checkouts against a scratch database and verify sale numbers are unique'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent terminals')
+        parser.add_argument('--checkouts', type=int, default=25, help='Checkouts per terminal')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        checkouts = options['checkouts']
+
+        # Never touch the real database: build a throwaway file-backed copy of the schema
+        scratch = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+        scratch.close()
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = scratch.name
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+        try:
+            user = User.objects.create(username='stress')
+            category = Category.objects.create(name='Stress')
+            product = Product.objects.create(
+                name='Stress item', category=category, sku='STRESS-1',
+                price=Decimal('10.00'), stock_quantity=workers * checkouts,
+            )
+
+            def terminal(_):
+                factory = RequestFactory()
+                numbers, errors = [], []
+                try:
+                    for _ in range(checkouts):
+                        request = factory.post('/process-sale/', data=json.dumps({
+                            'items': [{'product_id': product.id, 'quantity': 1}],
+                            'payment_method': 'cash',
+                            'amount_paid': 10,
+                        }), content_type='application/json')
+                        request.user = user
+                        data = json.loads(process_sale(request).content)
+                        if data['success']:
+                            numbers.append(data['sale_number'])
+                        else:
+                            errors.append(data['error'])
+                finally:
+                    connections.close_all()
+                return numbers, errors
+
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(terminal, range(workers)))
+
+            issued = [number for numbers, _ in results for number in numbers]
+            errors = Counter(error for _, errs in results for error in errs)
+            stored = list(Sale.objects.values_list('sale_number', flat=True))
+            duplicates = [number for number, count in Counter(stored).items() if count > 1]
+            suffixes = sorted(int(number[9:]) for number in stored)
+            product.refresh_from_db()
+
+            self.stdout.write(f'Checkouts attempted: {workers * checkouts}')
+            self.stdout.write(f'Sales committed:     {len(stored)} (responses: {len(issued)})')
+            for error, count in errors.items():
+                self.stdout.write(self.style.WARNING(f'Failed checkouts:    {count} x {error}'))
+            self.stdout.write(f'Remaining stock:     {product.stock_quantity}')
+
+            if duplicates or len(set(issued)) != len(issued):
+                raise CommandError(f'Duplicate sale numbers issued: {duplicates}')
+            if suffixes != list(range(1, len(suffixes) + 1)):
+                raise CommandError('Sale numbers are not a gapless sequence')
+            if product.stock_quantity != workers * checkouts - len(stored):
+                raise CommandError('Stock does not match committed sales')
+            self.stdout.write(self.style.SUCCESS('✓ No duplicate sale numbers'))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if os.path.exists(scratch.name):
+                os.remove(scratch.name)
@@ -0,0 +1,131 @@
+import json
+import os
+import random
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test import RequestFactory
+from django.utils import timezone
+
+from pos_application.checkout import (InsufficientStock, consume_reservation, create_sale_items,
+                                      release_expired_reservations, release_reservation, reserve_stock)
+from pos_application.models import Category, Product, Sale, StockReservation
+from pos_application.views import process_sale
+
+
+class Command(BaseCommand):
+    help = 'Race M-Pesa stock holds and cash sales for one scarce product on a scratch database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent terminals')
+        parser.add_argument('--checkouts', type=int, default=10, help='Checkouts per terminal')
+        parser.add_argument('--stock', type=int, default=30, help='Units on the shelf; fewer than the checkouts')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        checkouts = options['checkouts']
+        stock = options['stock']
+
+        # Never touch the real database: build a throwaway file-backed copy of the schema
+        scratch = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+        scratch.close()
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = scratch.name
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+        try:
+            user = User.objects.create(username='stress')
+            category = Category.objects.create(name='Stress')
+            product = Product.objects.create(
+                name='Last units', category=category, sku='HOT-1',
+                price=Decimal('10.00'), stock_quantity=stock,
+            )
+
+            def hold():
+                """The M-Pesa half of process_sale, without queueing a real STK push"""
+                with transaction.atomic():
+                    sale = Sale.objects.create(
+                        cashier=user, total_amount=product.price, final_amount=product.price,
+                        payment_method='mpesa', amount_paid=product.price, status='pending',
+                    )
+                    create_sale_items(sale, [(product, 1, product.price)])
+                    reserve_stock(sale, {product.id: 1})
+
+            def sell():
+                request = RequestFactory().post('/process-sale/', data=json.dumps({
+                    'items': [{'product_id': product.id, 'quantity': 1}],
+                    'payment_method': 'cash',
+                    'amount_paid': 10,
+                }), content_type='application/json')
+                request.user = user
+                data = json.loads(process_sale(request).content)
+                if not data['success']:
+                    raise InsufficientStock(data['error'])
+
+            def terminal(_):
+                outcomes = Counter()
+                try:
+                    for _ in range(checkouts):
+                        kind = random.choice(['hold', 'sell'])
+                        try:
+                            (hold if kind == 'hold' else sell)()
+                            outcomes[kind] += 1
+                        except InsufficientStock:
+                            outcomes['refused'] += 1
+                finally:
+                    connections.close_all()
+                return outcomes
+
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                outcomes = sum(pool.map(terminal, range(workers)), Counter())
+
+            product.refresh_from_db()
+            self.stdout.write(f"Checkouts attempted: {workers * checkouts}")
+            self.stdout.write(f"M-Pesa holds:        {outcomes['hold']}")
+            self.stdout.write(f"Cash sales:          {outcomes['sell']}")
+            self.stdout.write(f"Refused:             {outcomes['refused']}")
+            self.stdout.write(f"Shelf / reserved:    {product.stock_quantity} / {product.reserved_quantity}")
+            if outcomes['hold'] + outcomes['sell'] > stock:
+                raise CommandError('More units were promised than were on the shelf')
+            if product.reserved_quantity != outcomes['hold'] or product.stock_quantity != stock - outcomes['sell']:
+                raise CommandError('Stock counters do not match the committed checkouts')
+
+            # Settle every hold: paid, failed or abandoned, each raced by two workers
+            held = list(StockReservation.objects.values_list('sale_id', flat=True))
+            fates = {sale_id: random.choice(['paid', 'failed', 'expired']) for sale_id in held}
+            StockReservation.objects.filter(
+                sale_id__in=[sale_id for sale_id, fate in fates.items() if fate == 'expired'],
+            ).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+            def settle(sale_id):
+                try:
+                    if fates[sale_id] == 'paid':
+                        return consume_reservation(sale_id)
+                    if fates[sale_id] == 'failed':
+                        return release_reservation(sale_id)
+                    return release_expired_reservations() > 0
+                finally:
+                    connections.close_all()
+
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(settle, held + held))
+
+            paid = sum(1 for fate in fates.values() if fate == 'paid')
+            statuses = Counter(StockReservation.objects.values_list('status', flat=True))
+            product.refresh_from_db()
+            self.stdout.write(f"Holds paid / released: {statuses['consumed']} / {statuses['released']}")
+            self.stdout.write(f"Shelf / reserved:    {product.stock_quantity} / {product.reserved_quantity}")
+            if statuses['active'] or statuses['consumed'] != paid:
+                raise CommandError(f'Holds left unsettled or settled wrongly: {dict(statuses)}')
+            if product.reserved_quantity != 0 or product.stock_quantity != stock - outcomes['sell'] - paid:
+                raise CommandError('A hold was consumed or released more than once')
+            self.stdout.write(self.style.SUCCESS('✓ No oversold units and every hold settled exactly once'))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if os.path.exists(scratch.name):
+                os.remove(scratch.name)
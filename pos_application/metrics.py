@@ -0,0 +1,24 @@
+from django.core.cache import cache
+
+
+def increment(key):
+    """Bump a counter kept in the shared cache so every worker adds to the same total"""
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr(); the counter restarts
+        cache.set(key, 1, timeout=None)
+
+
+def hit_rate(keys):
+    """Read hit/miss style counters; keys maps outcome name -> cache key.
+
+    Every outcome other than 'misses' counts as a hit.
+    """
+    counts = cache.get_many(keys.values())
+    stats = {outcome: counts.get(key, 0) for outcome, key in keys.items()}
+    lookups = sum(stats.values())
+    hits = lookups - stats.get('misses', 0)
+    stats['hit_rate'] = hits / lookups if lookups else 0.0
+    return stats
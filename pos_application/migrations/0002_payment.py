@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2025-08-14 09:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos_application', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('checkout_request_id', models.CharField(help_text='M-Pesa checkout request ID', max_length=100, unique=True)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('SUCCESS', 'Success'), ('FAILED', 'Failed'), ('CANCELLED', 'Cancelled')], default='PENDING', help_text='Payment status', max_length=20)),
+                ('phone_number', models.CharField(blank=True, help_text='Customer phone number used for payment', max_length=15, null=True)),
+                ('amount', models.DecimalField(decimal_places=2, help_text='Payment amount', max_digits=10)),
+                ('mpesa_receipt', models.CharField(blank=True, help_text='M-Pesa transaction receipt number', max_length=50, null=True)),
+                ('transaction_date', models.CharField(blank=True, help_text='M-Pesa transaction date', max_length=50, null=True)),
+                ('raw_response', models.JSONField(blank=True, help_text='Full M-Pesa API response', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='When payment record was created')),
+                ('updated_at', models.DateTimeField(auto_now=True, help_text='When payment record was last updated')),
+                ('sale', models.ForeignKey(help_text='Related sale transaction', on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='pos_application.sale')),
+            ],
+            options={
+                'verbose_name': 'Payment',
+                'verbose_name_plural': 'Payments',
+                'db_table': 'pos_payments',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['checkout_request_id'], name='pos_payment_checkou_4828df_idx'), models.Index(fields=['status'], name='pos_payment_status_6dd83a_idx'), models.Index(fields=['sale'], name='pos_payment_sale_id_0b9423_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2025-08-14 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos_application', '0002_payment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], default='completed', help_text='Sale status', max_length=20),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos_application', '0003_sale_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaleNumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(help_text='Business day the counter belongs to', unique=True)),
+                ('last_value', models.PositiveIntegerField(default=0, help_text='Last sale number issued for the day')),
+            ],
+            options={
+                'db_table': 'pos_sale_number_sequences',
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos_application', '0004_sale_number_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MpesaOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phone_number', models.CharField(help_text='Customer phone number to prompt', max_length=15)),
+                ('amount', models.DecimalField(decimal_places=2, help_text='Amount to request', max_digits=10)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('SENDING', 'Sending'), ('SENT', 'Sent'), ('FAILED', 'Failed')], default='PENDING', help_text='Delivery status', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='Delivery attempts so far')),
+                ('last_error', models.TextField(blank=True, help_text='Last delivery error')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('sale', models.OneToOneField(help_text='Sale awaiting payment', on_delete=django.db.models.deletion.CASCADE, related_name='mpesa_request', to='pos_application.sale')),
+            ],
+            options={
+                'verbose_name': 'M-Pesa Outbox Entry',
+                'verbose_name_plural': 'M-Pesa Outbox',
+                'db_table': 'pos_mpesa_outbox',
+                'indexes': [models.Index(fields=['status', 'updated_at'], name='pos_mpesa_o_status_bf41a4_idx')],
+            },
+        ),
+    ]
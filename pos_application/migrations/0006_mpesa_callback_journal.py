@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos_application', '0005_mpesa_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MpesaCallback',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('checkout_request_id', models.CharField(help_text='M-Pesa checkout request ID; replays are dropped', max_length=100, unique=True)),
+                ('result_code', models.IntegerField(blank=True, help_text='ResultCode reported by Safaricom', null=True)),
+                ('payload', models.JSONField(help_text='Callback body as received')),
+                ('status', models.CharField(choices=[('RECEIVED', 'Received'), ('APPLIED', 'Applied'), ('IGNORED', 'Ignored'), ('ERROR', 'Error')], default='RECEIVED', help_text='Processing status', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='Failed apply attempts')),
+                ('error', models.TextField(blank=True, help_text='Last apply error')),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('applied_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'M-Pesa Callback',
+                'verbose_name_plural': 'M-Pesa Callbacks',
+                'db_table': 'pos_mpesa_callbacks',
+                'indexes': [models.Index(fields=['status', 'received_at'], name='pos_mpesa_c_status_0bbf76_idx')],
+            },
+        ),
+    ]
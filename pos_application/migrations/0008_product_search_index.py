@@ -0,0 +1,61 @@
+from django.db import migrations
+
+# SQLite: an external-content FTS5 table over product name and SKU using the
+# trigram tokenizer (substring matching, like the old icontains), kept in
+# sync by triggers so queryset updates and bulk inserts are covered too.
+SQLITE_FORWARD = [
+    """CREATE VIRTUAL TABLE pos_product_search USING fts5(
+        name, sku, content='pos_application_product', content_rowid='id', tokenize='trigram'
+    )""",
+    "CREATE VIRTUAL TABLE pos_product_search_vocab USING fts5vocab(pos_product_search, 'row')",
+    """CREATE TRIGGER pos_product_search_ai AFTER INSERT ON pos_application_product BEGIN
+        INSERT INTO pos_product_search(rowid, name, sku) VALUES (new.id, new.name, new.sku);
+    END""",
+    """CREATE TRIGGER pos_product_search_ad AFTER DELETE ON pos_application_product BEGIN
+        INSERT INTO pos_product_search(pos_product_search, rowid, name, sku) VALUES ('delete', old.id, old.name, old.sku);
+    END""",
+    """CREATE TRIGGER pos_product_search_au AFTER UPDATE OF name, sku ON pos_application_product BEGIN
+        INSERT INTO pos_product_search(pos_product_search, rowid, name, sku) VALUES ('delete', old.id, old.name, old.sku);
+        INSERT INTO pos_product_search(rowid, name, sku) VALUES (new.id, new.name, new.sku);
+    END""",
+    "INSERT INTO pos_product_search(pos_product_search) VALUES ('rebuild')",
+]
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS pos_product_search_au",
+    "DROP TRIGGER IF EXISTS pos_product_search_ad",
+    "DROP TRIGGER IF EXISTS pos_product_search_ai",
+    "DROP TABLE IF EXISTS pos_product_search_vocab",
+    "DROP TABLE IF EXISTS pos_product_search",
+]
+
+# PostgreSQL: pg_trgm GIN indexes serve ILIKE '%q%' and similarity()
+POSTGRESQL_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS pos_product_name_trgm ON pos_application_product USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS pos_product_sku_trgm ON pos_application_product USING gin (sku gin_trgm_ops)",
+]
+POSTGRESQL_REVERSE = [
+    "DROP INDEX IF EXISTS pos_product_sku_trgm",
+    "DROP INDEX IF EXISTS pos_product_name_trgm",
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(statement)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos_application', '0007_pending_payment_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRESQL_FORWARD}),
+            run({'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRESQL_REVERSE}),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos_application', '0009_terminal_catalog_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_hash',
+            field=models.CharField(blank=True, help_text='SHA-256 of the image its thumbnails were made from; empty until they exist', max_length=64),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:53
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+from pos_application.phones import clean_phone_number
+
+
+def normalize_phones(apps, schema_editor):
+    Customer = apps.get_model('pos_application', 'Customer')
+    customers = Customer.objects.exclude(phone='').only('id', 'phone')
+    batch = []
+    for customer in customers.iterator(chunk_size=2000):
+        customer.phone_normalized = clean_phone_number(customer.phone) or ''
+        batch.append(customer)
+        if len(batch) == 2000:
+            Customer.objects.bulk_update(batch, ['phone_normalized'])
+            batch = []
+    Customer.objects.bulk_update(batch, ['phone_normalized'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos_application', '0010_product_image_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='phone_normalized',
+            field=models.CharField(blank=True, help_text='phone as clean_phone_number formats it (2547XXXXXXXX), for lookups', max_length=12),
+        ),
+        migrations.RunPython(normalize_phones, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(django.db.models.functions.text.Lower('name'), models.F('id'), name='pos_customer_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(django.db.models.functions.text.Lower('email'), models.F('id'), name='pos_customer_email_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['phone_normalized', 'id'], name='pos_customer_phone_idx'),
+        ),
+    ]
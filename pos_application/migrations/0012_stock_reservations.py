@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos_application', '0011_customer_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='reserved_quantity',
+            field=models.IntegerField(default=0, help_text="Units held by pending M-Pesa sales; only moved by checkout's conditional updates"),
+        ),
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('active', 'Active'), ('consumed', 'Consumed'), ('released', 'Released')], default='active', help_text='Active until the payment settles or the hold expires', max_length=10)),
+                ('expires_at', models.DateTimeField(help_text='When an unpaid hold goes back on sale')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sale', models.OneToOneField(help_text='Sale the stock is held for', on_delete=django.db.models.deletion.CASCADE, related_name='stock_reservation', to='pos_application.sale')),
+            ],
+            options={
+                'db_table': 'pos_stock_reservations',
+                'indexes': [models.Index(fields=['status', 'expires_at'], name='pos_stock_r_status_f42532_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos_application', '0012_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateTimeField(help_text='Covers every Inventory row created up to this moment')),
+                ('quantity', models.IntegerField(help_text="Sum of the product's Inventory quantities up to as_of")),
+            ],
+            options={
+                'db_table': 'pos_stock_snapshots',
+            },
+        ),
+        migrations.AlterField(
+            model_name='inventory',
+            name='quantity',
+            field=models.IntegerField(help_text='Signed change in stock: negative for units leaving the shelf'),
+        ),
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(fields=['product', 'created_at'], name='pos_applica_product_24d4e1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(fields=['created_at'], name='pos_applica_created_335aab_idx'),
+        ),
+        migrations.AddField(
+            model_name='stocksnapshot',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='pos_application.product'),
+        ),
+        migrations.AddIndex(
+            model_name='stocksnapshot',
+            index=models.Index(fields=['product', 'as_of'], name='pos_stock_s_product_62b1e1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stocksnapshot',
+            index=models.Index(fields=['as_of'], name='pos_stock_s_as_of_4ece12_idx'),
+        ),
+    ]
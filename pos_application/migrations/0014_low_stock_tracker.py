@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def flag_low_stock(apps, schema_editor):
+    Product = apps.get_model('pos_application', 'Product')
+    Product.objects.filter(stock_quantity__lte=models.F('min_stock_level')).update(low_stock=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos_application', '0013_inventory_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('low', 'Fell to low stock'), ('restocked', 'Back above minimum')], max_length=20)),
+                ('stock_quantity', models.IntegerField(help_text='Stock when the threshold was crossed')),
+                ('min_stock_level', models.IntegerField(help_text='Threshold at the time')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('notified_at', models.DateTimeField(blank=True, help_text='When a notifier claimed the alert; empty while queued', null=True)),
+            ],
+            options={
+                'db_table': 'pos_stock_alerts',
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='low_stock',
+            field=models.BooleanField(default=False, help_text='stock_quantity is at or below min_stock_level; kept in step by stock_alerts.sync_low_stock'),
+        ),
+        migrations.RunPython(flag_low_stock, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('low_stock', True)), fields=['name'], name='pos_product_low_stock_idx'),
+        ),
+        migrations.AddField(
+            model_name='stockalert',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_alerts', to='pos_application.product'),
+        ),
+        migrations.AddIndex(
+            model_name='stockalert',
+            index=models.Index(condition=models.Q(('notified_at__isnull', True)), fields=['created_at'], name='pos_stock_alert_queued_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos_application', '0014_low_stock_tracker'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReorderSuggestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('daily_demand', models.FloatField(help_text='Exponentially smoothed units sold per day')),
+                ('demand_std', models.FloatField(help_text='Smoothed day-to-day spread of units sold')),
+                ('stock_cover_days', models.FloatField(blank=True, help_text='Days the unreserved stock lasts at that rate; empty when nothing sells', null=True)),
+                ('reorder_point', models.IntegerField(help_text='Reorder when available stock falls to this: lead-time demand plus safety stock')),
+                ('reorder_quantity', models.IntegerField(help_text='Units to order now to cover lead time and the review period; 0 above the reorder point')),
+                ('computed_at', models.DateTimeField()),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='reorder_suggestion', to='pos_application.product')),
+            ],
+            options={
+                'db_table': 'pos_reorder_suggestions',
+                'indexes': [models.Index(condition=models.Q(('reorder_quantity__gt', 0)), fields=['product'], name='pos_reorder_needed_idx')],
+            },
+        ),
+    ]
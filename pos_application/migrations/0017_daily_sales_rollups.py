@@ -0,0 +1,68 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+from pos_application.sales_rollup import fill_rollups
+
+
+def backfill_rollups(apps, schema_editor):
+    fill_rollups(
+        apps.get_model('pos_application', 'Sale'),
+        apps.get_model('pos_application', 'SaleItem'),
+        apps.get_model('pos_application', 'DailySales'),
+        apps.get_model('pos_application', 'DailyProductSales'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('pos_application', '0016_inventory_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(help_text='Local calendar day the sale was rung up')),
+                ('payment_method', models.CharField(max_length=20)),
+                ('orders', models.IntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, help_text='Before discounts and tax', max_digits=14)),
+                ('discount_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('final_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cashier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'pos_daily_sales',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(help_text='Local calendar day the sale was rung up')),
+                ('payment_method', models.CharField(max_length=20)),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, help_text='Sum of line totals, before sale-level discounts', max_digits=14)),
+                ('cashier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('category', models.ForeignKey(help_text="The product's category when it sold", on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pos_application.category')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pos_application.product')),
+            ],
+            options={
+                'db_table': 'pos_daily_product_sales',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailysales',
+            constraint=models.UniqueConstraint(fields=('day', 'cashier', 'payment_method'), name='pos_daily_sales_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyproductsales',
+            constraint=models.UniqueConstraint(fields=('day', 'product', 'category', 'cashier', 'payment_method'), name='pos_daily_product_sales_key'),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+# On SQLite, any migration that makes Django rebuild pos_application_product
+# (AddField, AlterField, RemoveField...) copies the table and silently drops
+# the FTS5 triggers 0008 created; 0010, 0012 and 0014 all did. The search
+# index then stops seeing new and renamed products. This puts the triggers
+# back and re-indexes every product.
+#
+# Any future migration that rebuilds the product table on SQLite must do the
+# same: end with RunPython(restore_search_triggers) from this module, or
+# repeat these statements.
+SQLITE_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS pos_product_search_ai",
+    "DROP TRIGGER IF EXISTS pos_product_search_ad",
+    "DROP TRIGGER IF EXISTS pos_product_search_au",
+    """CREATE TRIGGER pos_product_search_ai AFTER INSERT ON pos_application_product BEGIN
+        INSERT INTO pos_product_search(rowid, name, sku) VALUES (new.id, new.name, new.sku);
+    END""",
+    """CREATE TRIGGER pos_product_search_ad AFTER DELETE ON pos_application_product BEGIN
+        INSERT INTO pos_product_search(pos_product_search, rowid, name, sku) VALUES ('delete', old.id, old.name, old.sku);
+    END""",
+    """CREATE TRIGGER pos_product_search_au AFTER UPDATE OF name, sku ON pos_application_product BEGIN
+        INSERT INTO pos_product_search(pos_product_search, rowid, name, sku) VALUES ('delete', old.id, old.name, old.sku);
+        INSERT INTO pos_product_search(rowid, name, sku) VALUES (new.id, new.name, new.sku);
+    END""",
+    "INSERT INTO pos_product_search(pos_product_search) VALUES ('rebuild')",
+]
+
+
+def restore_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in SQLITE_TRIGGERS:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos_application', '0017_daily_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
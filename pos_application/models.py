@@ -1,8 +1,12 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+from django.db.models import F, Q
+from django.db.models.functions import Lower
 from decimal import Decimal
 
+from .phones import clean_phone_number
+
 class Category(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
@@ -23,15 +27,52 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     cost_price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     stock_quantity = models.IntegerField(default=0)
+    reserved_quantity = models.IntegerField(default=0, help_text="Units held by pending M-Pesa sales; only moved by checkout's conditional updates")
     min_stock_level = models.IntegerField(default=5)
+    low_stock = models.BooleanField(default=False, help_text="stock_quantity is at or below min_stock_level; kept in step by stock_alerts.sync_low_stock")
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    image_hash = models.CharField(max_length=64, blank=True, help_text="SHA-256 of the image its thumbnails were made from; empty until they exist")
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # On SQLite, adding, altering or removing a column rebuilds this table and
+    # drops the product search triggers: such a migration must end by
+    # restoring them (see migration 0018_restore_product_search_triggers)
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at']),
+            # Only low-stock rows are indexed, so listing them never scans the catalog
+            models.Index(fields=['name'], condition=Q(low_stock=True), name='pos_product_low_stock_idx'),
+            # Inventory screen orders: each page is a walk along one of these
+            models.Index(fields=['name', 'id'], name='pos_product_name_idx'),
+            models.Index(fields=['category', 'name', 'id'], name='pos_product_category_name_idx'),
+            models.Index(fields=['price', 'id'], name='pos_product_price_idx'),
+            models.Index(fields=['stock_quantity', 'id'], name='pos_product_stock_idx'),
+        ]
+    
     def __str__(self):
         return self.name
     
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            # New products start flagged, without a crossing to alert about
+            self.low_stock = self.stock_quantity <= self.min_stock_level
+        elif kwargs.get('update_fields') is None:
+            # Reservations and the low-stock tracker move these columns with
+            # conditional UPDATEs while this instance may hold a stale copy:
+            # never write them back
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in ('reserved_quantity', 'low_stock')
+            ]
+        super().save(*args, **kwargs)
+    
+    @property
+    def available_quantity(self):
+        """Stock that can still be sold: on hand minus what pending sales hold"""
+        return self.stock_quantity - self.reserved_quantity
+    
     @property
     def is_low_stock(self):
         return self.stock_quantity <= self.min_stock_level
@@ -53,26 +94,112 @@ class Customer(models.Model):
     name = models.CharField(max_length=200)
     email = models.EmailField(blank=True)
     phone = models.CharField(max_length=20, blank=True)
+    phone_normalized = models.CharField(max_length=12, blank=True, help_text="phone as clean_phone_number formats it (2547XXXXXXXX), for lookups")
     address = models.TextField(blank=True)
     loyalty_tier = models.CharField(max_length=20, choices=LOYALTY_CHOICES, default='bronze')
     loyalty_points = models.IntegerField(default=0)
     total_spent = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at']),
+            # Keyset-paginated typeahead: each search walks one of these in order
+            models.Index(Lower('name'), F('id'), name='pos_customer_name_idx'),
+            models.Index(Lower('email'), F('id'), name='pos_customer_email_idx'),
+            models.Index(fields=['phone_normalized', 'id'], name='pos_customer_phone_idx'),
+        ]
     
     def __str__(self):
         return self.name
     
+    def save(self, *args, **kwargs):
+        self.phone_normalized = clean_phone_number(self.phone) or ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'phone' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'phone_normalized'}
+        super().save(*args, **kwargs)
+    
     @property
     def discount_percentage(self):
         discounts = {'bronze': 0, 'silver': 5, 'gold': 10, 'platinum': 15}
         return discounts.get(self.loyalty_tier, 0)
+
+class CatalogTombstone(models.Model):
+    """Deleted products and customers, so terminal delta syncs and the customer list ETag see deletions"""
+    
+    KIND_CHOICES = [
+        ('product', 'Product'),
+        ('customer', 'Customer'),
+    ]
+    
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES,help_text="What was deleted")
+    object_id = models.PositiveBigIntegerField(help_text="Primary key of the deleted row")
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'pos_catalog_tombstones'
+        indexes = [
+            models.Index(fields=['deleted_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} {self.object_id} deleted {self.deleted_at}"
     
 
 
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 import json
 
+
+class SaleNumberSequence(models.Model):
+    """Per-day counter that hands out sale numbers without scanning Sale"""
+    
+    day = models.DateField(unique=True, help_text="Business day the counter belongs to")
+    last_value = models.PositiveIntegerField(default=0, help_text="Last sale number issued for the day")
+    
+    class Meta:
+        db_table = 'pos_sale_number_sequences'
+    
+    def __str__(self):
+        return f"{self.day}: {self.last_value}"
+    
+    @classmethod
+    def next_sale_number(cls):
+        """Allocate the next sale number for today.
+        
+        The increment is a single UPDATE on one indexed row, so terminals
+        committing at the same time queue on that row instead of racing
+        on a COUNT(*) of the sales table. Call it before the checkout
+        transaction, not inside it: the row is then locked for this short
+        transaction only, not for the whole basket. A checkout that rolls
+        back leaves a gap in the day's numbers.
+        """
+        day = timezone.localdate()
+        with transaction.atomic():
+            counter = cls.objects.filter(day=day)
+            if not counter.update(last_value=models.F('last_value') + 1):
+                # First sale of the day: seed the row, tolerating a concurrent seed
+                cls.objects.bulk_create(
+                    [cls(day=day, last_value=cls._issued_before(day))],
+                    ignore_conflicts=True,
+                )
+                counter.update(last_value=models.F('last_value') + 1)
+            value = counter.values_list('last_value', flat=True).get()
+        return f"S{day.strftime('%Y%m%d')}{value:04d}"
+    
+    @staticmethod
+    def _issued_before(day):
+        """Highest number already used for the day by the old count()-based scheme.
+        
+        Only runs once per day, when the counter row is first created.
+        """
+        prefix = f"S{day.strftime('%Y%m%d')}"
+        suffixes = Sale.objects.filter(sale_number__startswith=prefix).values_list('sale_number', flat=True)
+        return max((int(number[len(prefix):]) for number in suffixes if number[len(prefix):].isdigit()), default=0)
+
 class Payment(models.Model):
     """Model to track M-Pesa payments for POS sales"""
     
@@ -103,6 +230,7 @@ class Payment(models.Model):
             models.Index(fields=['checkout_request_id']),
             models.Index(fields=['status']),
             models.Index(fields=['sale']),
+            models.Index(fields=['status', 'created_at']),
         ]
     
     def __str__(self):
@@ -138,6 +266,66 @@ class Payment(models.Model):
             return self.raw_response
         return {}
 
+class MpesaOutbox(models.Model):
+    """STK push requests written at checkout and delivered after the sale commits"""
+    
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('SENDING', 'Sending'),
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed'),
+    ]
+    
+    sale = models.OneToOneField('Sale', on_delete=models.CASCADE, related_name='mpesa_request',help_text="Sale awaiting payment")
+    phone_number = models.CharField(max_length=15,help_text="Customer phone number to prompt")
+    amount = models.DecimalField(max_digits=10, decimal_places=2,help_text="Amount to request")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING',help_text="Delivery status")
+    attempts = models.PositiveIntegerField(default=0,help_text="Delivery attempts so far")
+    last_error = models.TextField(blank=True,help_text="Last delivery error")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'pos_mpesa_outbox'
+        verbose_name = 'M-Pesa Outbox Entry'
+        verbose_name_plural = 'M-Pesa Outbox'
+        indexes = [
+            models.Index(fields=['status', 'updated_at']),
+        ]
+    
+    def __str__(self):
+        return f"STK push for sale {self.sale_id} - {self.status}"
+
+class MpesaCallback(models.Model):
+    """Durable journal of STK callbacks from Safaricom, applied exactly once"""
+    
+    STATUS_CHOICES = [
+        ('RECEIVED', 'Received'),
+        ('APPLIED', 'Applied'),
+        ('IGNORED', 'Ignored'),
+        ('ERROR', 'Error'),
+    ]
+    
+    checkout_request_id = models.CharField(max_length=100, unique=True,help_text="M-Pesa checkout request ID; replays are dropped")
+    result_code = models.IntegerField(null=True, blank=True,help_text="ResultCode reported by Safaricom")
+    payload = models.JSONField(help_text="Callback body as received")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='RECEIVED',help_text="Processing status")
+    attempts = models.PositiveIntegerField(default=0,help_text="Failed apply attempts")
+    error = models.TextField(blank=True,help_text="Last apply error")
+    received_at = models.DateTimeField(auto_now_add=True)
+    applied_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'pos_mpesa_callbacks'
+        verbose_name = 'M-Pesa Callback'
+        verbose_name_plural = 'M-Pesa Callbacks'
+        indexes = [
+            models.Index(fields=['status', 'received_at']),
+        ]
+    
+    def __str__(self):
+        return f"Callback {self.checkout_request_id} - {self.status}"
+
 class Sale(models.Model):
     PAYMENT_METHODS = [
         ('cash', 'Cash'),
@@ -165,14 +353,42 @@ class Sale(models.Model):
     change_given = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'payment_method']),
+        ]
+    
     def __str__(self):
         return f"Sale {self.sale_number}"
     
     def save(self, *args, **kwargs):
         if not self.sale_number:
-            self.sale_number = f"S{timezone.now().strftime('%Y%m%d')}{Sale.objects.count() + 1:04d}"
+            self.sale_number = SaleNumberSequence.next_sale_number()
         super().save(*args, **kwargs)
 
+class StockReservation(models.Model):
+    """Stock held for a pending M-Pesa sale until it is paid, fails or expires"""
+    
+    STATUS_CHOICES = [
+        ('active', 'Active'),
+        ('consumed', 'Consumed'),
+        ('released', 'Released'),
+    ]
+    
+    sale = models.OneToOneField(Sale, on_delete=models.CASCADE, related_name='stock_reservation',help_text="Sale the stock is held for")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='active',help_text="Active until the payment settles or the hold expires")
+    expires_at = models.DateTimeField(help_text="When an unpaid hold goes back on sale")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'pos_stock_reservations'
+        indexes = [
+            models.Index(fields=['status', 'expires_at']),
+        ]
+    
+    def __str__(self):
+        return f"Reservation for sale {self.sale_id} - {self.status}"
+
 class SaleItem(models.Model):
     sale = models.ForeignKey(Sale, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -216,13 +432,124 @@ class Inventory(models.Model):
     
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     transaction_type = models.CharField(max_length=20, choices=TRANSACTION_TYPES)
-    quantity = models.IntegerField()
+    quantity = models.IntegerField(help_text="Signed change in stock: negative for units leaving the shelf")
     notes = models.TextField(blank=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         verbose_name_plural = "Inventory Transactions"
+        indexes = [
+            # Point-in-time stock: one product's rows after its last checkpoint
+            models.Index(fields=['product', 'created_at']),
+            # Reconciliation: every row after the last checkpoint
+            models.Index(fields=['created_at']),
+        ]
         
     def __str__(self):
-        return f"{self.product.name} - {self.transaction_type} - {self.quantity}"
\ No newline at end of file
+        return f"{self.product.name} - {self.transaction_type} - {self.quantity}"
+
+class StockSnapshot(models.Model):
+    """A product's ledger balance at a checkpoint, so stock at any moment is
+    the latest snapshot before it plus the Inventory rows since"""
+    
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_snapshots')
+    as_of = models.DateTimeField(help_text="Covers every Inventory row created up to this moment")
+    quantity = models.IntegerField(help_text="Sum of the product's Inventory quantities up to as_of")
+    
+    class Meta:
+        db_table = 'pos_stock_snapshots'
+        indexes = [
+            models.Index(fields=['product', 'as_of']),
+            models.Index(fields=['as_of']),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} @ {self.as_of}: {self.quantity}"
+
+class StockAlert(models.Model):
+    """A product crossing its min_stock_level, queued for notify_low_stock"""
+    
+    KIND_CHOICES = [
+        ('low', 'Fell to low stock'),
+        ('restocked', 'Back above minimum'),
+    ]
+    
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_alerts')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    stock_quantity = models.IntegerField(help_text="Stock when the threshold was crossed")
+    min_stock_level = models.IntegerField(help_text="Threshold at the time")
+    created_at = models.DateTimeField(auto_now_add=True)
+    notified_at = models.DateTimeField(null=True, blank=True,help_text="When a notifier claimed the alert; empty while queued")
+    
+    class Meta:
+        db_table = 'pos_stock_alerts'
+        indexes = [
+            models.Index(fields=['created_at'], condition=Q(notified_at__isnull=True), name='pos_stock_alert_queued_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} {self.kind} at {self.stock_quantity}"
+
+class ReorderSuggestion(models.Model):
+    """A product's demand forecast and reorder advice, rewritten by forecast_demand"""
+    
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='reorder_suggestion')
+    daily_demand = models.FloatField(help_text="Exponentially smoothed units sold per day")
+    demand_std = models.FloatField(help_text="Smoothed day-to-day spread of units sold")
+    stock_cover_days = models.FloatField(null=True, blank=True,help_text="Days the unreserved stock lasts at that rate; empty when nothing sells")
+    reorder_point = models.IntegerField(help_text="Reorder when available stock falls to this: lead-time demand plus safety stock")
+    reorder_quantity = models.IntegerField(help_text="Units to order now to cover lead time and the review period; 0 above the reorder point")
+    computed_at = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'pos_reorder_suggestions'
+        indexes = [
+            models.Index(fields=['product'], condition=Q(reorder_quantity__gt=0), name='pos_reorder_needed_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id}: order {self.reorder_quantity}"
+
+class DailySales(models.Model):
+    """Completed sales per local day, cashier and payment method, kept by sales_rollup"""
+    
+    day = models.DateField(help_text="Local calendar day the sale was rung up")
+    cashier = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    payment_method = models.CharField(max_length=20)
+    orders = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0, help_text="Before discounts and tax")
+    discount_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    final_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        db_table = 'pos_daily_sales'
+        constraints = [
+            # Also the index every report reads through: day leads
+            models.UniqueConstraint(fields=['day', 'cashier', 'payment_method'], name='pos_daily_sales_key'),
+        ]
+    
+    def __str__(self):
+        return f"{self.day} {self.cashier_id} {self.payment_method}: {self.final_amount}"
+
+class DailyProductSales(models.Model):
+    """Units and revenue of completed sales per local day, product, category, cashier and payment method"""
+    
+    day = models.DateField(help_text="Local calendar day the sale was rung up")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+', help_text="The product's category when it sold")
+    cashier = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    payment_method = models.CharField(max_length=20)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, help_text="Sum of line totals, before sale-level discounts")
+    
+    class Meta:
+        db_table = 'pos_daily_product_sales'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'product', 'category', 'cashier', 'payment_method'], name='pos_daily_product_sales_key',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.day} {self.product_id}: {self.quantity}"
@@ -0,0 +1,614 @@
+import base64
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .checkout import (consume_reservation, decrement_stock, record_stock_movements, release_reservation,
+                       sale_quantities)
+from .metrics import hit_rate, increment
+from .models import Customer, MpesaCallback, MpesaOutbox, Payment, Sale
+from .payment_events import notify_payment_update
+from .sales_rollup import record_sale
+
+logger = logging.getLogger(__name__)
+
+# Refresh cached OAuth tokens this long before Safaricom expires them
+TOKEN_REFRESH_MARGIN = 60
+TOKEN_STATS_KEYS = {
+    'hits': 'mpesa:token:hits',
+    'misses': 'mpesa:token:misses',
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Process-wide pooled session so STK pushes reuse warm TLS connections.
+    
+    Connection failures are retried a couple of times for every method; HTTP
+    status retries only apply to GET, so an STK push is never sent twice.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=2,
+                connect=2,
+                read=0,
+                backoff_factor=0.3,
+                status_forcelist=(502, 503, 504),
+                allowed_methods=frozenset(['GET']),
+            )
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=10, max_retries=retry)
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+
+def token_cache_stats():
+    """Token cache hits and misses across every process sharing the cache"""
+    return hit_rate(TOKEN_STATS_KEYS)
+
+
+class MpesaService:
+    def __init__(self):
+        self.consumer_key = getattr(settings, 'MPESA_CONSUMER_KEY', '')
+        self.consumer_secret = getattr(settings, 'MPESA_CONSUMER_SECRET', '')
+        self.business_shortcode = getattr(settings, 'MPESA_BUSINESS_SHORTCODE', '')
+        self.passkey = getattr(settings, 'MPESA_PASSKEY', '')
+        self.environment = getattr(settings, 'MPESA_ENVIRONMENT', 'sandbox')
+        
+        logger.info(f"M-Pesa Service initialized - Environment: {self.environment}, Shortcode: {self.business_shortcode}")
+        
+        if not all([self.consumer_key, self.consumer_secret, self.business_shortcode, self.passkey]):
+            logger.error("Missing M-Pesa configuration in settings")
+            raise ValueError("M-Pesa configuration is incomplete. Check your settings.")
+        
+        if getattr(settings, 'MPESA_BASE_URL', ''):
+            # e.g. the local daraja_simulator for load testing
+            self.base_url = settings.MPESA_BASE_URL.rstrip('/')
+        elif self.environment == 'sandbox':
+            self.base_url = 'https://sandbox.safaricom.co.ke'
+        else:
+            self.base_url = 'https://api.safaricom.co.ke'
+    
+    @property
+    def token_cache_key(self):
+        return f"mpesa:token:{self.environment}:{self.business_shortcode}"
+    
+    def get_access_token(self):
+        """Get an M-Pesa access token, reusing the shared cached one while it is fresh"""
+        access_token = cache.get(self.token_cache_key)
+        if access_token:
+            increment(TOKEN_STATS_KEYS['hits'])
+            return access_token
+        
+        increment(TOKEN_STATS_KEYS['misses'])
+        access_token, expires_in = self.fetch_access_token()
+        cache.set(self.token_cache_key, access_token, timeout=max(expires_in - TOKEN_REFRESH_MARGIN, 1))
+        return access_token
+    
+    def invalidate_access_token(self):
+        cache.delete(self.token_cache_key)
+    
+    def fetch_access_token(self):
+        """Request a new access token; returns (token, lifetime in seconds)"""
+        logger.info("Requesting M-Pesa access token")
+        
+        try:
+            url = f"{self.base_url}/oauth/v1/generate?grant_type=client_credentials"
+            credentials = f"{self.consumer_key}:{self.consumer_secret}"
+            encoded_credentials = base64.b64encode(credentials.encode()).decode()
+            
+            headers = {
+                'Authorization': f'Basic {encoded_credentials}',
+                'Content-Type': 'application/json'
+            }
+            
+            response = get_session().get(url, headers=headers, timeout=(5, 30))
+            
+            if response.status_code != 200:
+                logger.error(f"Token request failed with status {response.status_code}")
+                raise Exception(f"Token request failed: HTTP {response.status_code}")
+            
+            token_data = response.json()
+            access_token = token_data.get('access_token')
+            
+            if not access_token:
+                raise Exception("No access token received from API")
+            
+            logger.info("Access token obtained successfully")
+            return access_token, int(token_data.get('expires_in', 3599))
+            
+        except Exception as e:
+            logger.exception(f"Error getting access token: {str(e)}")
+            raise Exception(f"Failed to get access token: {str(e)}")
+    
+    def generate_password(self):
+        """Generate M-Pesa password"""
+        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        password_string = f"{self.business_shortcode}{self.passkey}{timestamp}"
+        password = base64.b64encode(password_string.encode()).decode()
+        return password, timestamp
+    
+    def stk_push(self, phone_number, amount, account_reference, transaction_desc):
+        """Initiate STK Push with comprehensive error handling"""
+        logger.info(f"Starting STK Push - Phone: {phone_number}, Amount: {amount}")
+        
+        try:
+            access_token = self.get_access_token()
+            password, timestamp = self.generate_password()
+            
+            url = f"{self.base_url}/mpesa/stkpush/v1/processrequest"
+            
+            headers = {
+                'Authorization': f'Bearer {access_token}',
+                'Content-Type': 'application/json'
+            }
+            
+            amount = int(float(amount))
+            callback_url = getattr(settings, 'MPESA_CALLBACK_URL', '')
+            
+            payload = {
+                'BusinessShortCode': self.business_shortcode,
+                'Password': password,
+                'Timestamp': timestamp,
+                'TransactionType': 'CustomerPayBillOnline',
+                'Amount': amount,
+                'PartyA': phone_number,
+                'PartyB': self.business_shortcode,
+                'PhoneNumber': phone_number,
+                'CallBackURL': callback_url,
+                'AccountReference': account_reference,
+                'TransactionDesc': transaction_desc
+            }
+            
+            logger.info("Sending STK Push request...")
+            response = get_session().post(url, headers=headers, json=payload, timeout=(5, 30))
+            
+            if response.status_code == 401:
+                # Token revoked before it expired: drop it so the next push fetches a new one
+                self.invalidate_access_token()
+            
+            if response.status_code != 200:
+                raise Exception(f"STK Push API error: HTTP {response.status_code}")
+            
+            response_data = response.json()
+            response_code = response_data.get('ResponseCode')
+            
+            if response_code != '0':
+                error_desc = response_data.get('ResponseDescription', 'Unknown error')
+                raise Exception(f"STK Push failed: {error_desc}")
+            
+            logger.info("STK Push completed successfully")
+            return response_data
+            
+        except Exception as e:
+            logger.exception(f"STK Push failed: {str(e)}")
+            raise Exception(f"STK Push failed: {str(e)}")
+
+    
+    def stk_query(self, checkout_request_id):
+        """Ask Safaricom for the outcome of an STK push.
+        
+        Returns the raw response; a request Safaricom is still processing
+        comes back as an errorCode instead of a ResultCode.
+        """
+        access_token = self.get_access_token()
+        password, timestamp = self.generate_password()
+        
+        url = f"{self.base_url}/mpesa/stkpushquery/v1/query"
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/json'
+        }
+        payload = {
+            'BusinessShortCode': self.business_shortcode,
+            'Password': password,
+            'Timestamp': timestamp,
+            'CheckoutRequestID': checkout_request_id,
+        }
+        
+        response = get_session().post(url, headers=headers, json=payload, timeout=(5, 30))
+        if response.status_code == 401:
+            self.invalidate_access_token()
+        
+        try:
+            return response.json()
+        except ValueError:
+            raise Exception(f"STK query API error: HTTP {response.status_code}")
+
+# STK push outbox
+#
+# Checkout only writes an MpesaOutbox row inside its transaction. The request
+# to Safaricom is made after commit, from a small thread pool in the web
+# process, with the dispatch_mpesa_outbox command as the durable fallback for
+# anything a restarted worker left behind.
+
+# Entries stuck in SENDING longer than this belong to a dispatcher that died mid-request
+SENDING_TIMEOUT = timedelta(minutes=2)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'MPESA_DISPATCH_WORKERS', 4),
+                thread_name_prefix='mpesa-outbox',
+            )
+        return _executor
+
+
+def enqueue_stk_push(sale, phone_number, amount):
+    """Queue an STK push for a pending sale; it is sent once the sale commits"""
+    entry = MpesaOutbox.objects.create(sale=sale, phone_number=phone_number, amount=amount)
+    transaction.on_commit(lambda: _get_executor().submit(_deliver_in_thread, entry.pk))
+    return entry
+
+
+def _deliver_in_thread(entry_id):
+    try:
+        deliver(entry_id)
+    except Exception as e:
+        logger.exception(f"Outbox delivery crashed for entry {entry_id}: {str(e)}")
+    finally:
+        connections.close_all()
+
+
+def deliver(entry_id):
+    """Send one outbox entry to Safaricom.
+    
+    The entry is claimed with a conditional update first, so the thread pool
+    and the management command never send the same request twice. Returns
+    True when this call delivered the entry.
+    """
+    claimed = MpesaOutbox.objects.filter(pk=entry_id, status='PENDING').update(
+        status='SENDING',
+        attempts=F('attempts') + 1,
+        updated_at=timezone.now(),
+    )
+    if not claimed:
+        return False
+    
+    entry = MpesaOutbox.objects.select_related('sale').get(pk=entry_id)
+    sale = entry.sale
+    logger.info(f"Initiating M-Pesa payment for sale {sale.sale_number}")
+    
+    try:
+        response = MpesaService().stk_push(
+            phone_number=entry.phone_number,
+            amount=int(entry.amount),
+            account_reference=f"Sale-{sale.sale_number}",
+            transaction_desc=f"Payment for Sale {sale.sale_number}"
+        )
+    except Exception as e:
+        logger.exception(f"M-Pesa payment initialization failed: {str(e)}")
+        fail(entry, str(e))
+        return False
+    
+    checkout_request_id = response.get('CheckoutRequestID')
+    with transaction.atomic():
+        # A fast callback may already be journaled, waiting for this Payment row
+        transaction.on_commit(lambda: _submit_callbacks_for(checkout_request_id))
+        Payment.objects.create(
+            sale=sale,
+            checkout_request_id=checkout_request_id,
+            status="PENDING",
+            raw_response=response,
+            phone_number=entry.phone_number,
+            amount=entry.amount
+        )
+        MpesaOutbox.objects.filter(pk=entry.pk).update(status='SENT', last_error='', updated_at=timezone.now())
+        transaction.on_commit(lambda: notify_payment_update(sale.pk))
+    
+    logger.info(f"STK Push successful. CheckoutRequestID: {checkout_request_id}")
+    return True
+
+
+def fail(entry, error):
+    """Mark an outbox entry failed and cancel its still-pending sale"""
+    with transaction.atomic():
+        MpesaOutbox.objects.filter(pk=entry.pk).update(status='FAILED', last_error=error, updated_at=timezone.now())
+        Sale.objects.filter(pk=entry.sale_id, status='pending').update(status='cancelled')
+        release_reservation(entry.sale_id)
+        transaction.on_commit(lambda: notify_payment_update(entry.sale_id))
+
+
+def dispatch_pending(limit=100):
+    """Deliver queued entries and fail those abandoned mid-request.
+    
+    Abandoned entries are not resent: Safaricom may already have prompted the
+    customer, and a second prompt for the same sale is worse than a cancelled one.
+    """
+    cutoff = timezone.now() - SENDING_TIMEOUT
+    for entry in MpesaOutbox.objects.filter(status='SENDING', updated_at__lt=cutoff):
+        logger.error(f"Outbox entry {entry.pk} abandoned while sending; cancelling sale {entry.sale_id}")
+        fail(entry, 'Dispatcher stopped before Safaricom answered')
+    
+    entry_ids = list(
+        MpesaOutbox.objects.filter(status='PENDING')
+        .order_by('created_at')
+        .values_list('pk', flat=True)[:limit]
+    )
+    return sum(1 for entry_id in entry_ids if deliver(entry_id))
+
+
+# Callback journal
+#
+# mpesa_callback only appends to MpesaCallback and acknowledges. Entries are
+# applied after commit from the same thread pool as the outbox, with
+# process_mpesa_callbacks as the durable fallback. Each entry is claimed and
+# applied inside one transaction, so it takes effect exactly once.
+
+# Callbacks still unmatched to a Payment after this long are parked as IGNORED
+UNMATCHED_CALLBACK_TIMEOUT = timedelta(hours=1)
+MAX_APPLY_ATTEMPTS = 5
+
+
+def journal_callback(checkout_request_id, result_code, payload):
+    """Append a callback to the journal; replays are silently dropped"""
+    MpesaCallback.objects.bulk_create(
+        [MpesaCallback(checkout_request_id=checkout_request_id, result_code=result_code, payload=payload)],
+        ignore_conflicts=True,
+    )
+    transaction.on_commit(lambda: _submit_callbacks_for(checkout_request_id))
+
+
+def _submit_callbacks_for(checkout_request_id):
+    _get_executor().submit(_apply_in_thread, checkout_request_id)
+
+
+def _apply_in_thread(checkout_request_id):
+    try:
+        callback_id = (
+            MpesaCallback.objects.filter(checkout_request_id=checkout_request_id, status='RECEIVED')
+            .values_list('pk', flat=True).first()
+        )
+        if callback_id:
+            apply_callback(callback_id)
+    except Exception as e:
+        logger.exception(f"Callback apply crashed for {checkout_request_id}: {str(e)}")
+    finally:
+        connections.close_all()
+
+
+def apply_callback(callback_id):
+    """Apply one journaled callback to its Payment, Sale and stock.
+    
+    Returns True when this call applied it. Callbacks that arrive before
+    their Payment row exists are left RECEIVED and picked up later.
+    """
+    callback = MpesaCallback.objects.get(pk=callback_id)
+    payment = (
+        Payment.objects.select_related('sale', 'sale__cashier')
+        .filter(checkout_request_id=callback.checkout_request_id).first()
+    )
+    if payment is None:
+        logger.warning(f"No Payment yet for CheckoutRequestID: {callback.checkout_request_id}")
+        return False
+    
+    try:
+        with transaction.atomic():
+            claimed = MpesaCallback.objects.filter(pk=callback_id, status__in=('RECEIVED', 'ERROR')).update(
+                status='APPLIED',
+                error='',
+                applied_at=timezone.now(),
+            )
+            if not claimed:
+                return False
+            settle_payment(payment, callback.payload)
+    except Exception as e:
+        logger.exception(f"Error applying callback {callback.checkout_request_id}: {str(e)}")
+        MpesaCallback.objects.filter(pk=callback_id).update(
+            status='ERROR',
+            error=str(e),
+            attempts=F('attempts') + 1,
+        )
+        return False
+    
+    notify_payment_update(payment.sale_id)
+    return True
+
+
+def settle_payment(payment, callback_data):
+    """Move a pending payment and its sale to their final state.
+    
+    Must run inside a transaction. Payments that are no longer pending are
+    left alone, so a settlement never moves stock twice; the one exception
+    is a success without a receipt, which a later callback completes.
+    """
+    stk_callback = callback_data.get('Body', {}).get('stkCallback', {})
+    result_code = stk_callback.get('ResultCode')
+    sale = payment.sale
+    now = timezone.now()
+    
+    if result_code == 0:  # Success
+        callback_metadata = stk_callback.get('CallbackMetadata', {}).get('Item', [])
+        transaction_data = {item['Name']: item.get('Value') for item in callback_metadata}
+        
+        logger.info(f"Transaction data: {transaction_data}")
+        
+        receipt = transaction_data.get('MpesaReceiptNumber')
+        transaction_date = transaction_data.get('TransactionDate')
+        transaction_date = None if transaction_date is None else str(transaction_date)
+        
+        settled = Payment.objects.filter(pk=payment.pk, status='PENDING').update(
+            status='SUCCESS',
+            mpesa_receipt=receipt,
+            phone_number=transaction_data.get('PhoneNumber') or payment.phone_number,
+            transaction_date=transaction_date,
+            amount=transaction_data.get('Amount') or payment.amount,
+            raw_response=callback_data,
+            updated_at=now,
+        )
+        if not settled:
+            # Reconciliation settles from the STK query, which carries no
+            # receipt. Safaricom's own callback may still follow: keep its
+            # receipt details, but never move stock a second time.
+            if receipt:
+                Payment.objects.filter(
+                    Q(mpesa_receipt__isnull=True) | Q(mpesa_receipt=''), pk=payment.pk, status='SUCCESS',
+                ).update(
+                    mpesa_receipt=receipt,
+                    phone_number=transaction_data.get('PhoneNumber') or payment.phone_number,
+                    transaction_date=transaction_date,
+                    raw_response=callback_data,
+                    updated_at=now,
+                )
+            return
+        
+        if not Sale.objects.filter(pk=sale.pk, status='pending').update(status='completed'):
+            # Cancelled before the money arrived: the sale stays cancelled and
+            # nothing is sold, so the payment must be refunded by hand
+            logger.error(f"Payment received for sale {sale.sale_number}, which is no longer pending")
+            release_reservation(sale.pk)
+            return
+        record_sale(sale)
+        
+        # Now take the stock held at checkout off the shelf. If the hold has
+        # expired the money is still taken, so decrement anyway and never refuse
+        quantities = sale_quantities(sale.pk)
+        if not consume_reservation(sale.pk):
+            decrement_stock(quantities, allow_oversell=True)
+        record_stock_movements(
+            {product_id: -quantity for product_id, quantity in quantities.items()},
+            user=sale.cashier,
+            transaction_type='sale',
+            notes=f'Sale {sale.sale_number} - M-Pesa Payment Confirmed',
+        )
+        
+        # Update customer loyalty points if applicable
+        if sale.customer_id:
+            Customer.objects.filter(pk=sale.customer_id).update(
+                loyalty_points=F('loyalty_points') + int(sale.final_amount / 10),
+                total_spent=F('total_spent') + sale.final_amount,
+                updated_at=timezone.now(),
+            )
+        
+        logger.info(f"Payment completed - Receipt: {transaction_data.get('MpesaReceiptNumber')}")
+    
+    else:  # Failed
+        settled = Payment.objects.filter(pk=payment.pk, status='PENDING').update(
+            status='FAILED',
+            raw_response=callback_data,
+            updated_at=now,
+        )
+        if not settled:
+            return
+        
+        Sale.objects.filter(pk=sale.pk, status='pending').update(status='cancelled')
+        release_reservation(sale.pk)
+        
+        logger.error(f"Payment failed - ResultCode: {result_code}, ResultDesc: {stk_callback.get('ResultDesc')}")
+
+
+def apply_pending_callbacks(limit=500):
+    """Apply journaled callbacks that were not applied right after they arrived"""
+    cutoff = timezone.now() - UNMATCHED_CALLBACK_TIMEOUT
+    applied = 0
+    pending = (
+        MpesaCallback.objects.filter(status__in=('RECEIVED', 'ERROR'), attempts__lt=MAX_APPLY_ATTEMPTS)
+        .order_by('received_at')
+        .values_list('pk', 'received_at')[:limit]
+    )
+    for callback_id, received_at in pending:
+        if apply_callback(callback_id):
+            applied += 1
+        elif received_at < cutoff:
+            MpesaCallback.objects.filter(pk=callback_id, status='RECEIVED').update(
+                status='IGNORED',
+                error='No matching Payment',
+            )
+    return applied
+
+
+# Reconciliation of payments whose callback never arrived
+
+# errorCode Safaricom returns from the STK query while the customer has not answered yet
+STK_QUERY_IN_PROGRESS = '500.001.1001'
+
+
+def find_stale_payments(older_than, limit):
+    """Pending payments created before now - older_than, oldest first (status, created_at index)"""
+    cutoff = timezone.now() - older_than
+    return list(
+        Payment.objects.filter(status='PENDING', created_at__lt=cutoff)
+        .select_related('sale', 'sale__cashier')
+        .order_by('created_at')[:limit]
+    )
+
+
+def _query_outcome(checkout_request_id):
+    try:
+        return MpesaService().stk_query(checkout_request_id)
+    except Exception as e:
+        logger.exception(f"STK query failed for {checkout_request_id}: {str(e)}")
+        return None
+    finally:
+        connections.close_all()
+
+
+def reconcile_pending_payments(older_than=timedelta(minutes=5), cancel_after=timedelta(minutes=30),
+                               workers=4, limit=200):
+    """Settle stale pending payments from Safaricom's STK query API.
+    
+    Status queries run concurrently on a bounded pool; settlement happens
+    here, one transaction per payment, through settle_payment so a late
+    callback for the same payment becomes a no-op. Payments Safaricom
+    cannot answer for are cancelled once they are older than cancel_after.
+    Returns a {'completed', 'failed', 'pending'} count.
+    """
+    payments = find_stale_payments(older_than, limit)
+    counts = {'completed': 0, 'failed': 0, 'pending': 0}
+    if not payments:
+        return counts
+    
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mpesa-reconcile') as pool:
+        outcomes = list(pool.map(_query_outcome, [payment.checkout_request_id for payment in payments]))
+    
+    abandon_before = timezone.now() - cancel_after
+    for payment, outcome in zip(payments, outcomes):
+        result_code = None
+        if outcome and outcome.get('ResultCode') is not None:
+            result_code = int(outcome['ResultCode'])
+        elif payment.created_at < abandon_before:
+            # No answer from Safaricom for too long: give the stock and the till back
+            result_code = 1037
+            outcome = {**(outcome or {}), 'ResultDesc': 'No response from M-Pesa; cancelled by reconciliation'}
+        
+        if result_code is None:
+            counts['pending'] += 1
+            continue
+        
+        with transaction.atomic():
+            settle_payment(payment, {
+                'Body': {'stkCallback': {
+                    'CheckoutRequestID': payment.checkout_request_id,
+                    'ResultCode': result_code,
+                    'ResultDesc': outcome.get('ResultDesc'),
+                    'CallbackMetadata': {'Item': []},
+                }},
+                'source': 'stk_query',
+                'query_response': outcome,
+            })
+            transaction.on_commit(lambda sale_id=payment.sale_id: notify_payment_update(sale_id))
+        counts['completed' if result_code == 0 else 'failed'] += 1
+    
+    return counts
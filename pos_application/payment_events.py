@@ -0,0 +1,78 @@
+import asyncio
+import threading
+import time
+
+from django.core.cache import cache
+
+# How often a waiting stream re-reads the shared version key. Wake-ups from
+# the same process are immediate; this bounds the delay for callbacks that
+# land on another worker.
+CROSS_PROCESS_POLL_INTERVAL = 1.0
+VERSION_TIMEOUT = 600
+
+_waiters = {}
+_waiters_lock = threading.Lock()
+
+
+def _version_key(sale_id):
+    return f"payment:status:{sale_id}"
+
+
+def notify_payment_update(sale_id):
+    """Wake every terminal waiting on this sale's payment status.
+
+    Call after the status change has committed. The version key reaches
+    streams held by other workers; local streams are woken directly.
+    """
+    cache.set(_version_key(sale_id), time.time_ns(), timeout=VERSION_TIMEOUT)
+    with _waiters_lock:
+        waiters = list(_waiters.get(int(sale_id), ()))
+    for loop, event in waiters:
+        loop.call_soon_threadsafe(event.set)
+
+
+async def wait_for_payment_update(sale_id, seen_version, timeout):
+    """Wait until the sale's payment status version moves past seen_version.
+
+    Returns the new version, or None if nothing changed within timeout.
+    """
+    sale_id = int(sale_id)
+    loop = asyncio.get_running_loop()
+    event = asyncio.Event()
+    waiter = (loop, event)
+    with _waiters_lock:
+        _waiters.setdefault(sale_id, set()).add(waiter)
+
+    try:
+        deadline = loop.time() + timeout
+        while True:
+            # Never None: an evicted key is re-seeded, which wakes callers
+            # once to re-read the status rather than on every poll
+            version = await current_payment_version(sale_id)
+            if version != seen_version:
+                return version
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+            try:
+                await asyncio.wait_for(event.wait(), min(CROSS_PROCESS_POLL_INTERVAL, remaining))
+            except asyncio.TimeoutError:
+                pass
+            event.clear()
+    finally:
+        with _waiters_lock:
+            sale_waiters = _waiters.get(sale_id)
+            if sale_waiters is not None:
+                sale_waiters.discard(waiter)
+                if not sale_waiters:
+                    del _waiters[sale_id]
+
+
+async def current_payment_version(sale_id):
+    """The sale's payment status version, seeding the key if it expired or was evicted"""
+    key = _version_key(sale_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), timeout=VERSION_TIMEOUT)
+        version = await cache.aget(key)
+    return version
@@ -0,0 +1,43 @@
+def clean_phone_number(phone):
+    """Clean and format phone number for M-Pesa"""
+    if not phone:
+        return None
+    
+    # Remove all non-digit characters
+    phone = ''.join(filter(str.isdigit, str(phone)))
+    
+    # Handle Kenyan phone numbers
+    if phone.startswith('0'):
+        phone = '254' + phone[1:]
+    elif phone.startswith('+254'):
+        phone = phone[1:]
+    elif phone.startswith('254'):
+        pass
+    elif len(phone) == 9:
+        phone = '254' + phone
+    
+    # Validate length
+    if len(phone) == 12 and phone.startswith('254'):
+        return phone
+    
+    return None
+
+
+def looks_like_phone(text):
+    """Search input made of digits and phone punctuation, with enough digits to mean something"""
+    digits = sum(char.isdigit() for char in text)
+    return digits >= 3 and all(char.isdigit() or char in ' +-()' for char in text)
+
+
+def phone_search_prefix(text):
+    """The start of a normalized (2547...) number that partial input can be matched against.
+
+    Follows clean_phone_number: a leading 0 stands for 254, and bare
+    local digits get 254 in front.
+    """
+    digits = ''.join(filter(str.isdigit, text))
+    if digits.startswith('0'):
+        return '254' + digits[1:]
+    if digits.startswith('254') or '254'.startswith(digits):
+        return digits
+    return '254' + digits
@@ -0,0 +1,190 @@
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .catalog import get_catalog_version
+from .models import Customer, DailyProductSales, DailySales, Product
+
+# Reports cover this many days back from today. Each reads at most this
+# many days of rollup rows, so it costs the same however long the shop has
+# been trading.
+REPORT_DAYS = 365
+DAY_NAMES = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+TOP_PRODUCTS = 10
+
+# Days before today only change when a late M-Pesa settlement, an admin
+# edit or a rebuild touches them; today's figures change with every sale.
+# Each has its own version so a sale never throws away the year's history.
+HISTORY_VERSION_KEY = 'reports:version:history'
+TODAY_VERSION_KEY = 'reports:version:today'
+# Part of the cache keys: bump when the cached rows change shape
+REPORTS_LAYOUT = 1
+HISTORY_TIMEOUT = 24 * 60 * 60
+# Customer counts carry no version of their own; this bounds how stale
+# they get on a day without sales
+TODAY_TIMEOUT = 5 * 60
+
+
+def _version(key):
+    version = cache.get(key)
+    if version is None:
+        # Seeded from the clock, like the catalog version, so a flushed
+        # cache never reuses a version an old entry was stored under
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+def bump_reports_version(day=None):
+    """Invalidate cached reports for a day's sales, or all of them. Call after the change has committed."""
+    if day is None or day == timezone.localdate():
+        _bump(TODAY_VERSION_KEY)
+    if day is None or day != timezone.localdate():
+        _bump(HISTORY_VERSION_KEY)
+
+
+def _history(today):
+    """Rollup totals for the report window up to yesterday, as plain values for the cache"""
+    window = Q(day__gte=today - timedelta(days=REPORT_DAYS), day__lt=today)
+    days = [
+        (row['day'], float(row['sales'] or 0), row['orders'] or 0)
+        for row in DailySales.objects.filter(window).values('day').annotate(
+            sales=Sum('final_amount'), orders=Sum('orders'),
+        ).order_by('day')
+    ]
+    # Every product sold in the window, not just the top ones, so today's
+    # sales can be merged in without another trip to the database
+    products = [
+        (row['product_id'], row['product__name'], row['quantity'] or 0, float(row['revenue'] or 0))
+        for row in DailyProductSales.objects.filter(window).values('product_id', 'product__name').annotate(
+            quantity=Sum('quantity'), revenue=Sum('revenue'),
+        ).order_by()
+    ]
+    return {'days': days, 'products': products}
+
+
+def _today(today):
+    """Today's rollup totals and the store-wide counts shown next to them"""
+    sales = DailySales.objects.filter(day=today).aggregate(sales=Sum('final_amount'), orders=Sum('orders'))
+    products = [
+        (row['product_id'], row['product__name'], row['quantity'] or 0, float(row['revenue'] or 0))
+        for row in DailyProductSales.objects.filter(day=today).values('product_id', 'product__name').annotate(
+            quantity=Sum('quantity'), revenue=Sum('revenue'),
+        ).order_by()
+    ]
+    catalog = Product.objects.aggregate(
+        total=Count('id'),
+        low_stock=Count('id', filter=Q(low_stock=True, is_active=True)),
+    )
+    top_customer = Customer.objects.order_by('-total_spent').values_list('name', flat=True).first()
+    return {
+        'day': (today, float(sales['sales'] or 0), sales['orders'] or 0),
+        'products': products,
+        'top_customer': top_customer or 'No customers',
+        'total_customers': Customer.objects.count(),
+        'total_products': catalog['total'],
+        'low_stock_products': catalog['low_stock'],
+    }
+
+
+def _monthly(days):
+    months = {}
+    for day, sales, orders in days:
+        totals = months.setdefault(day.strftime('%Y-%m'), [0.0, 0])
+        totals[0] += sales
+        totals[1] += orders
+    return {
+        'months': list(months),
+        'sales': [sales for sales, _ in months.values()],
+        'orders': [orders for _, orders in months.values()],
+    }
+
+
+def _top_products(*sources):
+    merged = {}
+    for rows in sources:
+        for product_id, name, quantity, revenue in rows:
+            totals = merged.setdefault(product_id, [name, 0, 0.0])
+            totals[1] += quantity
+            totals[2] += revenue
+    top = sorted(merged.values(), key=lambda totals: totals[1], reverse=True)[:TOP_PRODUCTS]
+    return {
+        'products': [name for name, _, _ in top],
+        'quantities': [quantity for _, quantity, _ in top],
+        'revenues': [revenue for _, _, revenue in top],
+    }
+
+
+def _weekdays(days):
+    sales = [0.0] * 7
+    orders = [0] * 7
+    for day, day_sales, day_orders in days:
+        index = day.isoweekday() % 7
+        sales[index] += day_sales
+        orders[index] += day_orders
+    return {
+        'days': DAY_NAMES,
+        'sales': sales,
+        'orders': orders,
+        'avg_values': [total / count if count else 0 for total, count in zip(sales, orders)],
+    }
+
+
+def _summary(today, days, live):
+    this_month_start = today.replace(day=1)
+    last_month_start = (this_month_start - timedelta(days=1)).replace(day=1)
+    yesterday = today - timedelta(days=1)
+    this_month = [(sales, orders) for day, sales, orders in days if day >= this_month_start]
+    return {
+        'today_sales': live['day'][1],
+        'today_orders': live['day'][2],
+        'yesterday_sales': sum(sales for day, sales, _ in days if day == yesterday),
+        'month_sales': sum(sales for sales, _ in this_month),
+        'month_orders': sum(orders for _, orders in this_month),
+        'last_month_sales': sum(
+            sales for day, sales, _ in days if last_month_start <= day < this_month_start
+        ),
+        'top_customer': live['top_customer'],
+        'total_customers': live['total_customers'],
+        'total_products': live['total_products'],
+        'low_stock_products': live['low_stock_products'],
+    }
+
+
+def reports_payload():
+    """Everything the reports page shows, as one dict.
+
+    The window up to yesterday is cached for the day and rebuilt only when
+    a past day's rollups change. Today's part is cached per sale (and per
+    catalog version, for the stock counts): a refresh between sales costs
+    three cache reads for the versions and two for the parts, and the first
+    refresh after a sale runs five small queries over today's rows and the
+    store counts. The two are merged here, which is cheap arithmetic over at
+    most REPORT_DAYS days and the products sold in the window.
+    """
+    today = timezone.localdate()
+    history = cache.get_or_set(
+        f'reports:history:{REPORTS_LAYOUT}:{today}:{_version(HISTORY_VERSION_KEY)}',
+        lambda: _history(today), HISTORY_TIMEOUT,
+    )
+    live = cache.get_or_set(
+        f'reports:today:{REPORTS_LAYOUT}:{today}:{_version(TODAY_VERSION_KEY)}:{get_catalog_version()}',
+        lambda: _today(today), TODAY_TIMEOUT,
+    )
+    days = history['days'] + [live['day']]
+    return {
+        'summary': _summary(today, days, live),
+        'sales_data': _monthly(days),
+        'top_products': _top_products(history['products'], live['products']),
+        'daily_analysis': _weekdays(days),
+    }
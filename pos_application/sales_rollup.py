@@ -0,0 +1,172 @@
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyProductSales, DailySales, Sale, SaleItem
+from .reports import bump_reports_version
+
+SALES_KEY = ['day', 'cashier_id', 'payment_method']
+SALES_TOTALS = ['orders', 'total_amount', 'discount_amount', 'final_amount']
+PRODUCT_KEY = ['day', 'product_id', 'category_id', 'cashier_id', 'payment_method']
+PRODUCT_TOTALS = ['quantity', 'revenue']
+REBUILD_BATCH_SIZE = 2000
+# Rows per INSERT: stays under SQLite's 999 bound parameters on older builds
+UPSERT_BATCH_SIZE = 100
+
+
+def _adapt(value):
+    """Turn a date or Decimal into what the database driver expects"""
+    if hasattr(value, 'isoformat'):
+        return connection.ops.adapt_datefield_value(value)
+    if hasattr(value, 'as_tuple'):
+        return connection.ops.adapt_decimalfield_value(value)
+    return value
+
+
+def _add(model, key, totals, rows):
+    """Add each row's totals onto the row with the same key, creating it if needed.
+
+    SQLite and PostgreSQL take the rows as INSERT ... ON CONFLICT statements,
+    so concurrent sales on the same day never race to create a row. Keys
+    must be distinct within rows.
+    """
+    if not rows:
+        return
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        for row in rows:
+            lookup = {column: row[column] for column in key}
+            if not model.objects.filter(**lookup).update(**{column: F(column) + row[column] for column in totals}):
+                model.objects.create(**row)
+        return
+
+    table = model._meta.db_table
+    columns = key + totals
+    updates = ', '.join(f"{column} = {table}.{column} + excluded.{column}" for column in totals)
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            values = ', '.join(['(%s)' % ', '.join(['%s'] * len(columns))] * len(batch))
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES {values} "
+                f"ON CONFLICT ({', '.join(key)}) DO UPDATE SET {updates}",
+                [_adapt(row[column]) for row in batch for column in columns],
+            )
+
+
+def _apply(sale, lines, sign):
+    day = timezone.localtime(sale.created_at).date()
+    _add(DailySales, SALES_KEY, SALES_TOTALS, [{
+        'day': day,
+        'cashier_id': sale.cashier_id,
+        'payment_method': sale.payment_method,
+        'orders': sign,
+        'total_amount': sign * sale.total_amount,
+        'discount_amount': sign * sale.discount_amount,
+        'final_amount': sign * sale.final_amount,
+    }])
+
+    if lines is None:
+        lines = SaleItem.objects.filter(sale_id=sale.pk).values_list(
+            'product_id', 'product__category_id', 'quantity', 'total_price',
+        )
+    # A basket may repeat a product; one row per key keeps the upsert valid
+    merged = {}
+    for product_id, category_id, quantity, total_price in lines:
+        totals = merged.setdefault((product_id, category_id), [0, 0])
+        totals[0] += quantity
+        totals[1] += total_price
+    _add(DailyProductSales, PRODUCT_KEY, PRODUCT_TOTALS, [
+        {
+            'day': day,
+            'product_id': product_id,
+            'category_id': category_id,
+            'cashier_id': sale.cashier_id,
+            'payment_method': sale.payment_method,
+            'quantity': sign * quantity,
+            'revenue': sign * revenue,
+        }
+        for (product_id, category_id), (quantity, revenue) in merged.items()
+    ])
+    transaction.on_commit(lambda: bump_reports_version(day))
+
+
+def record_sale(sale, lines=None):
+    """Add a sale that just completed to the daily rollups.
+
+    Call it inside the transaction that completed the sale, so the totals
+    commit or roll back with it. lines are (product_id, category_id,
+    quantity, line_total) tuples; checkout passes the ones it already has,
+    otherwise they are read from the sale's items.
+    """
+    _apply(sale, lines, 1)
+
+
+def unrecord_sale(sale):
+    """Take a completed sale back out of the rollups, before it is cancelled, edited or deleted"""
+    _apply(sale, None, -1)
+
+
+def fill_rollups(Sale, SaleItem, DailySales, DailyProductSales):
+    """Write rollups for every completed sale into empty rollup tables.
+
+    Takes the models as arguments so migrations can pass their historical
+    versions. Each table is one grouped query, with the day worked out in
+    the current time zone by the database.
+    """
+    completed = Sale.objects.filter(status='completed')
+    sales = completed.annotate(day=TruncDate('created_at')).order_by().values(
+        'day', 'cashier_id', 'payment_method',
+    ).annotate(
+        orders=Count('id'),
+        total=Sum('total_amount'),
+        discount=Sum('discount_amount'),
+        final=Sum('final_amount'),
+    )
+    DailySales.objects.bulk_create((
+        DailySales(
+            day=row['day'], cashier_id=row['cashier_id'], payment_method=row['payment_method'],
+            orders=row['orders'], total_amount=row['total'], discount_amount=row['discount'],
+            final_amount=row['final'],
+        )
+        for row in sales.iterator()
+    ), batch_size=REBUILD_BATCH_SIZE)
+
+    lines = SaleItem.objects.filter(sale__in=completed).annotate(
+        day=TruncDate('sale__created_at'),
+        category_id=F('product__category_id'),
+        cashier_id=F('sale__cashier_id'),
+        payment_method=F('sale__payment_method'),
+    ).order_by().values(*PRODUCT_KEY).annotate(
+        units=Sum('quantity'),
+        total=Sum('total_price'),
+    )
+    DailyProductSales.objects.bulk_create((
+        DailyProductSales(
+            day=row['day'], product_id=row['product_id'], category_id=row['category_id'],
+            cashier_id=row['cashier_id'], payment_method=row['payment_method'],
+            quantity=row['units'], revenue=row['total'],
+        )
+        for row in lines.iterator()
+    ), batch_size=REBUILD_BATCH_SIZE)
+
+
+def rebuild_rollups():
+    """Recompute the rollups from Sale and SaleItem. Returns (sales rows, product rows).
+
+    On PostgreSQL the rollup tables are locked first: a checkout that
+    already added to them must commit before the rebuild reads, and one
+    that has not yet waits until it is done, so no sale is missed or
+    counted twice. SQLite serializes writers anyway.
+    """
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"LOCK TABLE {DailySales._meta.db_table}, {DailyProductSales._meta.db_table} IN EXCLUSIVE MODE"
+                )
+        DailyProductSales.objects.all().delete()
+        DailySales.objects.all().delete()
+        fill_rollups(Sale, SaleItem, DailySales, DailyProductSales)
+        transaction.on_commit(bump_reports_version)
+        return DailySales.objects.count(), DailyProductSales.objects.count()
@@ -0,0 +1,287 @@
+import base64
+import binascii
+import json
+
+from django.db import connection
+from django.db.models import F, Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Lower
+
+from .models import Category, Customer, Product
+from .phones import looks_like_phone, phone_search_prefix
+
+SEARCH_TABLE = 'pos_product_search'
+SEARCH_VOCAB_TABLE = 'pos_product_search_vocab'
+# Keep the SQLite index in step with the product table; a migration that
+# rebuilds that table drops them
+SEARCH_TRIGGERS = ['pos_product_search_ai', 'pos_product_search_ad', 'pos_product_search_au']
+# Very common terms ("ml", "pack") can match most of the catalogue; ranking is
+# only done over the first candidates so such queries cost the same as rare ones.
+CANDIDATE_LIMIT = 200
+# Fuzzy matching only looks for the query's rarest trigrams: they carry the
+# most signal about which product was meant
+FUZZY_TRIGRAMS = 4
+# pg_trgm similarity below this is not shown as a fuzzy match
+FUZZY_THRESHOLD = 0.3
+CUSTOMER_PAGE_SIZE = 50
+MAX_CUSTOMER_PAGE_SIZE = 100
+# Columns a customer cursor may continue from; None is the newest-first listing
+CURSOR_FIELDS = (None, 'name', 'email', 'phone_normalized')
+
+_COLUMNS = """p.id, p.name, p.sku, p.price, p.stock_quantity - p.reserved_quantity, c.name"""
+_PRODUCTS = Product._meta.db_table
+_CATEGORIES = Category._meta.db_table
+
+
+def missing_search_triggers():
+    """Names of the search index triggers that are missing from the database.
+
+    Without them the index silently stops seeing new and renamed products,
+    so searches for them come back empty. Always empty off SQLite.
+    """
+    if connection.vendor != 'sqlite':
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN ({', '.join(['%s'] * len(SEARCH_TRIGGERS))})",
+            SEARCH_TRIGGERS,
+        )
+        present = {name for name, in cursor.fetchall()}
+    return [name for name in SEARCH_TRIGGERS if name not in present]
+
+
+def _phrase(text):
+    """Quote text as a single FTS5 string so user input is never parsed as query syntax"""
+    return '"%s"' % text.replace('"', '""')
+
+
+def _trigrams(text):
+    return [text[i:i + 3] for i in range(len(text) - 2)]
+
+
+def _rarest_trigrams(text):
+    """The query's trigrams that occur in the index, least common first"""
+    trigrams = sorted(set(_trigrams(text.lower())))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT term FROM {SEARCH_VOCAB_TABLE} WHERE term IN ({', '.join(['%s'] * len(trigrams))}) "
+            f"ORDER BY doc LIMIT %s",
+            trigrams + [FUZZY_TRIGRAMS],
+        )
+        return [term for term, in cursor.fetchall()]
+
+
+def _rows(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [
+            {'id': pk, 'name': name, 'sku': sku, 'price': price, 'stock': stock, 'category': category}
+            for pk, name, sku, price, stock, category in cursor.fetchall()
+        ]
+
+
+def _search_sqlite(query, limit):
+    if len(query) < 3:
+        # The trigram index cannot answer one- and two-letter queries; the
+        # scan stops as soon as it has enough rows, and short strings are
+        # common enough that it rarely gets far
+        return _rows(f"""
+            SELECT {_COLUMNS}
+            FROM {_PRODUCTS} p JOIN {_CATEGORIES} c ON c.id = p.category_id
+            WHERE p.is_active AND p.stock_quantity > p.reserved_quantity
+              AND (p.name LIKE %s ESCAPE '\\' OR p.sku LIKE %s ESCAPE '\\')
+            LIMIT %s
+        """, [_like_contains(query), _like_contains(query), limit])
+
+    results = _ranked(_phrase(query), query, limit)
+    if results or len(query) < 4:
+        return results
+
+    # Nothing contains the query as typed: look for products sharing at least
+    # two of its rarer trigrams, which tolerates a typo or two
+    trigrams = _rarest_trigrams(query)
+    if len(trigrams) < 2:
+        return _ranked(' OR '.join(_phrase(trigram) for trigram in trigrams), query, limit) if trigrams else []
+    pairs = [
+        f'({_phrase(first)} AND {_phrase(second)})'
+        for i, first in enumerate(trigrams) for second in trigrams[i + 1:]
+    ]
+    return _ranked(' OR '.join(pairs), query, limit)
+
+
+def _ranked(match, query, limit):
+    """Rank the first CANDIDATE_LIMIT sellable rows matching an FTS5 expression"""
+    return _rows(f"""
+        SELECT {_COLUMNS}
+        FROM (
+            SELECT s.rowid AS id, s.rank AS rank
+            FROM {SEARCH_TABLE} s JOIN {_PRODUCTS} p ON p.id = s.rowid
+            WHERE {SEARCH_TABLE} MATCH %s AND p.is_active AND p.stock_quantity > p.reserved_quantity
+            LIMIT %s
+        ) m
+        JOIN {_PRODUCTS} p ON p.id = m.id JOIN {_CATEGORIES} c ON c.id = p.category_id
+        ORDER BY p.sku = %s COLLATE NOCASE DESC, p.name LIKE %s ESCAPE '\\' DESC, m.rank
+        LIMIT %s
+    """, [match, CANDIDATE_LIMIT, query, _like_prefix(query), limit])
+
+
+def _search_postgresql(query, limit):
+    """Substring and fuzzy matches served by the pg_trgm GIN indexes"""
+    return _rows(f"""
+        SELECT {_COLUMNS}
+        FROM {_PRODUCTS} p JOIN {_CATEGORIES} c ON c.id = p.category_id
+        WHERE p.is_active AND p.stock_quantity > p.reserved_quantity
+          AND (p.name ILIKE %s OR p.sku ILIKE %s
+               OR (length(%s) > 3 AND similarity(p.name, %s) > %s))
+        ORDER BY lower(p.sku) = lower(%s) DESC,
+                 p.name ILIKE %s DESC,
+                 greatest(similarity(p.name, %s), similarity(p.sku, %s)) DESC
+        LIMIT %s
+    """, [
+        _like_contains(query), _like_contains(query), query, query, FUZZY_THRESHOLD,
+        query, _like_prefix(query), query, query, limit,
+    ])
+
+
+def _search_orm(query, limit):
+    products = Product.objects.select_related('category').filter(
+        Q(name__icontains=query) | Q(sku__icontains=query),
+        is_active=True,
+        stock_quantity__gt=F('reserved_quantity'),
+    )
+    return [
+        {'id': product.id, 'name': product.name, 'sku': product.sku, 'price': product.price,
+         'stock': product.available_quantity, 'category': product.category.name}
+        for product in products[:limit]
+    ]
+
+
+def _like_prefix(text):
+    return _escape_like(text) + '%'
+
+
+def _like_contains(text):
+    return '%' + _escape_like(text) + '%'
+
+
+def _escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def find_products(query, limit=10):
+    """In-stock active products matching query, best match first.
+
+    An exact SKU comes first, then names starting with the query, then
+    other substring matches by relevance. Returns plain dicts with the
+    category name already joined in.
+    """
+    query = query.strip()
+    if not query:
+        return []
+    if connection.vendor == 'sqlite':
+        return _search_sqlite(query, limit)
+    if connection.vendor == 'postgresql':
+        return _search_postgresql(query, limit)
+    return _search_orm(query, limit)
+
+
+def product_text_filter(query):
+    """Q for products, active or not, whose name or SKU contains query.
+
+    On SQLite queries of three letters or more are answered by the trigram
+    index; on PostgreSQL the icontains lookups use the pg_trgm indexes.
+    """
+    if connection.vendor == 'sqlite' and len(query) >= 3:
+        return Q(id__in=RawSQL(
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", [_phrase(query)]
+        ))
+    return Q(name__icontains=query) | Q(sku__icontains=query)
+
+
+def _encode_cursor(field, key, pk):
+    return base64.urlsafe_b64encode(json.dumps([field, key, pk]).encode()).decode()
+
+
+def _decode_cursor(cursor):
+    """(field, key, id) from a cursor made by _encode_cursor; ValueError if it is not one"""
+    try:
+        field, key, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        pk = int(pk)
+    except (ValueError, TypeError, binascii.Error):
+        field = key = pk = None
+    # Newest-first pages carry no key; prefix pages carry the matched column's value
+    if pk is None or field not in CURSOR_FIELDS or not (key is None if field is None else isinstance(key, str)):
+        raise ValueError('Invalid cursor')
+    return field, key, pk
+
+
+def _prefix_upper_bound(prefix):
+    """Smallest string greater than every string starting with prefix"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _customer_prefix_page(field, prefix, after, limit):
+    """Customers whose field starts with prefix, in index order, after a (key, id) position"""
+    if field == 'phone_normalized':
+        key = field
+        customers = Customer.objects.all()
+    else:
+        key = 'search_key'
+        customers = Customer.objects.annotate(search_key=Lower(field))
+    # The range lets the database seek straight to the prefix; startswith
+    # keeps the result exact under collations where the range is loose
+    customers = customers.filter(**{
+        f'{key}__gte': max(prefix, after[0]) if after else prefix,
+        f'{key}__lt': _prefix_upper_bound(prefix),
+        f'{key}__startswith': prefix,
+    }).order_by(key, 'id')
+    if after:
+        customers = customers.exclude(**{key: after[0], 'id__lte': after[1]})
+    return [(getattr(customer, key), customer) for customer in customers[:limit + 1]]
+
+
+def find_customers(query='', cursor=None, limit=CUSTOMER_PAGE_SIZE):
+    """One page of customers and the cursor for the next page (None on the last).
+
+    Without a query customers come newest first. A query is matched as a
+    prefix of the normalized phone number when it looks like a phone
+    number, of the email when it contains '@', and otherwise of the name,
+    then of the email if no name matches. Results come in the matched
+    column's order. Every page is a seek into one index, so its cost does
+    not depend on how many customers there are or how far the caller has
+    paged. Raises ValueError for a cursor it did not issue for this query.
+    """
+    limit = max(1, min(limit, MAX_CUSTOMER_PAGE_SIZE))
+    query = query.strip()
+    after = _decode_cursor(cursor) if cursor else None
+
+    if not query:
+        if after and after[0] is not None:
+            raise ValueError('Invalid cursor')
+        customers = Customer.objects.order_by('-id')
+        if after:
+            customers = customers.filter(id__lt=after[2])
+        rows = [(None, customer) for customer in customers[:limit + 1]]
+        field = None
+    elif looks_like_phone(query):
+        field = 'phone_normalized'
+        if after and after[0] != field:
+            raise ValueError('Invalid cursor')
+        rows = _customer_prefix_page(field, phone_search_prefix(query), after and after[1:], limit)
+    else:
+        prefix = query.lower()
+        fields = ['email'] if '@' in query else ['name', 'email']
+        if after:
+            if after[0] not in fields:
+                raise ValueError('Invalid cursor')
+            fields = [after[0]]
+        for field in fields:
+            rows = _customer_prefix_page(field, prefix, after and after[1:], limit)
+            if rows:
+                break
+
+    page = [customer for _, customer in rows[:limit]]
+    if len(rows) <= limit:
+        return page, None
+    key, last = rows[limit - 1]
+    return page, _encode_cursor(field, key, last.id)
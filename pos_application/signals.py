@@ -0,0 +1,31 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog import bump_catalog_version
+from .models import CatalogTombstone, Category, Customer, Product
+from .stock_alerts import sync_low_stock
+from .terminal_sync import purge_tombstones
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog(sender, **kwargs):
+    """Any product or category edit makes the cached catalog stale"""
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=Product)
+def track_low_stock(sender, instance, **kwargs):
+    """Direct saves (admin, new products) may move stock or the threshold itself"""
+    sync_low_stock([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Customer)
+def record_tombstone(sender, instance, **kwargs):
+    """Deleted rows leave nothing for updated_at to find, so terminals are told explicitly"""
+    CatalogTombstone.objects.create(kind=sender._meta.model_name, object_id=instance.pk)
+    purge_tombstones()
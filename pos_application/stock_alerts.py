@@ -0,0 +1,95 @@
+import logging
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Product, StockAlert
+
+logger = logging.getLogger(__name__)
+
+LOW = Q(stock_quantity__lte=F('min_stock_level'))
+
+
+def sync_low_stock(product_ids):
+    """Bring the low_stock flag of products whose stock just moved into line,
+    queueing a StockAlert for each one that crossed its threshold.
+
+    Call it inside the transaction that moved the stock. Costs one indexed
+    read of the given products; crossings are rare, and each is claimed with
+    a conditional update so concurrent writers never alert twice.
+    """
+    if not product_ids:
+        return 0
+    crossed = Product.objects.filter(pk__in=list(product_ids)).filter(
+        (LOW & Q(low_stock=False)) | (~LOW & Q(low_stock=True))
+    ).values_list('id', 'stock_quantity', 'min_stock_level', 'low_stock')
+
+    alerts = []
+    for product_id, stock, minimum, was_low in crossed:
+        if Product.objects.filter(pk=product_id, low_stock=was_low).update(low_stock=not was_low):
+            alerts.append(StockAlert(
+                product_id=product_id,
+                kind='restocked' if was_low else 'low',
+                stock_quantity=stock,
+                min_stock_level=minimum,
+            ))
+    StockAlert.objects.bulk_create(alerts)
+    return len(alerts)
+
+
+def products_low_on_stock():
+    """Active products at or below their minimum, read from the partial index"""
+    return Product.objects.filter(low_stock=True, is_active=True).order_by('name')
+
+
+def _notify(alerts):
+    """Log the crossings and mail them to LOW_STOCK_ALERT_EMAILS, if any are configured"""
+    lines = []
+    for alert in alerts:
+        verb = 'is low' if alert.kind == 'low' else 'is back in stock'
+        lines.append(f"{alert.product.name} ({alert.product.sku}) {verb}: "
+                     f"{alert.stock_quantity} left, minimum {alert.min_stock_level}")
+    for line in lines:
+        logger.warning(line)
+
+    recipients = getattr(settings, 'LOW_STOCK_ALERT_EMAILS', [])
+    if recipients:
+        low = sum(1 for alert in alerts if alert.kind == 'low')
+        send_mail(
+            subject=f"{low} product(s) need restocking",
+            message='\n'.join(lines),
+            from_email=None,
+            recipient_list=recipients,
+        )
+
+
+def deliver_stock_alerts(limit=200):
+    """Send queued alerts as one notification. Returns how many were sent.
+
+    Alerts are claimed with a conditional update first, so two notifiers
+    never send the same crossing; a failed send puts them back in the queue.
+    """
+    queued = list(
+        StockAlert.objects.filter(notified_at__isnull=True)
+        .order_by('created_at').values_list('pk', flat=True)[:limit]
+    )
+    if not queued:
+        return 0
+
+    now = timezone.now()
+    claimed = []
+    for alert_id in queued:
+        if StockAlert.objects.filter(pk=alert_id, notified_at__isnull=True).update(notified_at=now):
+            claimed.append(alert_id)
+    alerts = list(StockAlert.objects.filter(pk__in=claimed).select_related('product').order_by('created_at'))
+    try:
+        _notify(alerts)
+    except Exception as e:
+        logger.exception(f"Stock alert notification failed: {str(e)}")
+        with transaction.atomic():
+            StockAlert.objects.filter(pk__in=claimed, notified_at=now).update(notified_at=None)
+        return 0
+    return len(alerts)
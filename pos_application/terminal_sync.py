@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import F
+from django.utils import timezone
+
+from .catalog import get_catalog
+from .models import CatalogTombstone, Category, Discount, Product
+from .thumbnails import thumbnail_url
+
+# Rows are matched on updated_at, which is stamped before the writing
+# transaction commits; re-sending this much history covers any write that
+# was still in flight when the previous sync ran. Re-applied rows are harmless.
+SYNC_OVERLAP = timedelta(seconds=30)
+# Terminals that have been away longer than this reload the full snapshot
+TOMBSTONE_RETENTION = timedelta(days=7)
+
+# Positional row layouts, sent once with every payload so terminals never
+# have to guess which column is which
+PRODUCT_FIELDS = ['id', 'name', 'sku', 'price', 'stock', 'min_stock', 'category_id', 'image']
+DISCOUNT_FIELDS = ['id', 'name', 'percentage', 'minimum']
+CATEGORY_FIELDS = ['id', 'name', 'icon']
+
+
+def encode_version(moment):
+    """Sync versions are epoch milliseconds"""
+    return int(moment.timestamp() * 1000)
+
+
+def decode_version(value):
+    try:
+        return datetime.fromtimestamp(int(value) / 1000, tz=dt_timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+
+
+def purge_tombstones():
+    CatalogTombstone.objects.filter(deleted_at__lt=timezone.now() - TOMBSTONE_RETENTION).delete()
+
+
+def _layout():
+    return {
+        'products': PRODUCT_FIELDS,
+        'discounts': DISCOUNT_FIELDS,
+        'categories': CATEGORY_FIELDS,
+    }
+
+
+def _discount_rows():
+    # Discounts are a handful of rows, so every payload carries all of them
+    return [
+        [pk, name, str(percentage), str(minimum)]
+        for pk, name, percentage, minimum in Discount.objects.filter(is_active=True).values_list(
+            'id', 'name', 'percentage', 'minimum_amount',
+        )
+    ]
+
+
+def snapshot_payload():
+    """Everything a terminal needs to boot, as compact positional rows"""
+    as_of = timezone.now()
+    catalog = get_catalog()
+    return {
+        'version': encode_version(as_of),
+        'fields': _layout(),
+        'categories': [[category.id, category.name, category.icon] for category in catalog.categories],
+        'products': [
+            [product.id, product.name, product.sku, str(product.price), product.stock_quantity,
+             product.min_stock_level, product.category.id if product.category else None,
+             product.image.url if product.image else None]
+            for product in catalog.products
+        ],
+        'discounts': _discount_rows(),
+    }
+
+
+def changes_payload(since):
+    """Rows changed since a version from an earlier snapshot or delta.
+
+    Returns {'reset': True} when the terminal is too far behind to be
+    caught up from tombstones and must reload the snapshot.
+    """
+    as_of = timezone.now()
+    since_at = decode_version(since)
+    if since_at is None or since_at < as_of - TOMBSTONE_RETENTION:
+        return {'reset': True}
+    cutoff = since_at - SYNC_OVERLAP
+
+    products = []
+    removed_products = []
+    changed = Product.objects.filter(updated_at__gte=cutoff).annotate(
+        available=F('stock_quantity') - F('reserved_quantity'),
+    )
+    for row in changed.values_list(
+        'id', 'name', 'sku', 'price', 'available', 'min_stock_level', 'category_id', 'image', 'image_hash', 'is_active',
+    ):
+        pk, name, sku, price, stock, min_stock, category_id, image, image_hash, is_active = row
+        if is_active:
+            products.append([pk, name, sku, str(price), stock, min_stock, category_id,
+                             thumbnail_url(image, image_hash)])
+        else:
+            removed_products.append(pk)
+
+    removed_products += list(CatalogTombstone.objects.filter(kind='product', deleted_at__gte=cutoff).values_list(
+        'object_id', flat=True,
+    ))
+
+    return {
+        'version': encode_version(as_of),
+        'fields': _layout(),
+        # Read directly: a delta usually follows a catalog change, and the
+        # cached catalog would be rebuilt just for these few rows
+        'categories': [list(row) for row in Category.objects.order_by('pk').values_list('id', 'name', 'icon')],
+        'products': products,
+        'removed_products': removed_products,
+        'discounts': _discount_rows(),
+    }
@@ -1,3 +1,735 @@
-from django.test import TestCase
+import asyncio
+import base64
+import io
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.urls import reverse
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .checkout import add_stock, decrement_stock, release_expired_reservations
+from .models import (Category, Customer, DailyProductSales, DailySales, Inventory, MpesaCallback, Payment, Product, Sale,
+                     StockAlert, StockReservation)
+from .mpesa import apply_callback, apply_pending_callbacks, reconcile_pending_payments, settle_payment
+from .payment_events import _version_key, current_payment_version, wait_for_payment_update
+from .search import find_products, missing_search_triggers
+from .views import export_inventory, import_inventory, mpesa_callback, payment_status_stream, process_sale
+
+
+class ProductSearchIndexTests(TestCase):
+    """The search index must keep up with products written after the migrations ran"""
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Drinks')
+
+    def test_triggers_survive_migrations(self):
+        self.assertEqual(missing_search_triggers(), [])
+
+    def test_new_product_is_found_by_name_and_sku(self):
+        product = Product.objects.create(
+            name='Coca Cola 500ml', sku='COKE500', category=self.category,
+            price=Decimal('60.00'), stock_quantity=10,
+        )
+        self.assertEqual([result['id'] for result in find_products('coca')], [product.id])
+        self.assertEqual([result['id'] for result in find_products('COKE500')], [product.id])
+
+    def test_renamed_product_is_found_by_its_new_name(self):
+        product = Product.objects.create(
+            name='Fanta Orange 500ml', sku='FANTA500', category=self.category,
+            price=Decimal('60.00'), stock_quantity=10,
+        )
+        product.name = 'Sprite Lemon 500ml'
+        product.save()
+        self.assertEqual([result['id'] for result in find_products('sprite')], [product.id])
+        self.assertEqual(find_products('orange'), [])
+
+
+class PaymentUpdateWaitTests(SimpleTestCase):
+    """Waiting streams must block, not spin, when the version key goes missing"""
+
+    def setUp(self):
+        cache.delete(_version_key(1))
+
+    def wait(self, seen_version, timeout=0.3):
+        started = time.monotonic()
+        version = asyncio.run(wait_for_payment_update(1, seen_version, timeout=timeout))
+        return version, time.monotonic() - started
+
+    def test_unchanged_version_waits_for_the_timeout(self):
+        seen = asyncio.run(current_payment_version(1))
+        version, elapsed = self.wait(seen)
+        self.assertIsNone(version)
+        self.assertGreaterEqual(elapsed, 0.25)
+
+    def test_evicted_key_is_reseeded_and_then_waited_on(self):
+        seen = asyncio.run(current_payment_version(1))
+        cache.delete(_version_key(1))
+
+        version, _ = self.wait(seen)
+        self.assertIsNotNone(version)
+        self.assertEqual(cache.get(_version_key(1)), version)
+
+        again, elapsed = self.wait(version)
+        self.assertIsNone(again)
+        self.assertGreaterEqual(elapsed, 0.25)
+
+
+def checkout(user, lines, payment_method='cash', **extra):
+    """Run process_sale for a basket of (product, quantity) lines and return its JSON"""
+    request = RequestFactory().post('/process-sale/', data=json.dumps({
+        'items': [{'product_id': product.id, 'quantity': quantity} for product, quantity in lines],
+        'payment_method': payment_method,
+        'amount_paid': 100000,
+        **extra,
+    }), content_type='application/json')
+    request.user = user
+    return json.loads(process_sale(request).content)
+
+
+class SaleNumberConcurrencyTests(TransactionTestCase):
+    """Terminals checking out at the same moment must never share a sale number"""
+
+    terminals = 8
+    checkouts = 5
+
+    def test_concurrent_checkouts_get_unique_increasing_numbers(self):
+        user = User.objects.create(username='cashier')
+        category = Category.objects.create(name='Drinks')
+        product = Product.objects.create(
+            name='Water 500ml', sku='WATER500', category=category,
+            price=Decimal('10.00'), stock_quantity=self.terminals * self.checkouts,
+        )
+
+        def terminal(_):
+            try:
+                return [checkout(user, [(product, 1)]) for _ in range(self.checkouts)]
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=self.terminals) as pool:
+            batches = list(pool.map(terminal, range(self.terminals)))
+
+        responses = [response for batch in batches for response in batch]
+        self.assertEqual([response.get('error') for response in responses if not response['success']], [])
+        issued = [response['sale_number'] for response in responses]
+        stored = list(Sale.objects.values_list('sale_number', flat=True))
+        self.assertEqual(sorted(issued), sorted(stored))
+        self.assertEqual(len(set(stored)), len(stored))
+        # S + YYYYMMDD + a per-day counter; each terminal's numbers go up.
+        # Numbers are taken outside the checkout, so a rolled back one may leave a gap
+        for batch in batches:
+            counters = [int(response['sale_number'][9:]) for response in batch]
+            self.assertEqual(counters, sorted(counters))
+        product.refresh_from_db()
+        self.assertEqual(product.stock_quantity, 0)
+
+    def test_failed_checkout_leaves_a_gap(self):
+        user = User.objects.create(username='cashier')
+        category = Category.objects.create(name='Drinks')
+        product = Product.objects.create(
+            name='Water 500ml', sku='WATER500', category=category,
+            price=Decimal('10.00'), stock_quantity=1,
+        )
+        first = checkout(user, [(product, 1)])
+        self.assertFalse(checkout(user, [(product, 1)])['success'])
+        product.stock_quantity = 1
+        product.save()
+        third = checkout(user, [(product, 1)])
+        self.assertEqual(int(third['sale_number'][9:]), int(first['sale_number'][9:]) + 2)
+
+
+def pending_mpesa_sale(user, lines, checkout_request_id='ws_CO_TEST'):
+    """Check out a basket by M-Pesa and record the STK push as sent; returns (sale, payment)"""
+    response = checkout(user, lines, payment_method='mpesa', phone_number='0712345678')
+    sale = Sale.objects.get(pk=response['sale_id'])
+    payment = Payment.objects.create(
+        sale=sale, checkout_request_id=checkout_request_id, status='PENDING',
+        phone_number='254712345678', amount=sale.final_amount,
+    )
+    return sale, payment
+
+
+def stk_callback(checkout_request_id, result_code=0, amount=0):
+    """An STK callback body as Safaricom posts it"""
+    body = {'CheckoutRequestID': checkout_request_id, 'ResultCode': result_code, 'ResultDesc': 'Test'}
+    if result_code == 0:
+        body['CallbackMetadata'] = {'Item': [
+            {'Name': 'Amount', 'Value': amount},
+            {'Name': 'MpesaReceiptNumber', 'Value': 'RCP' + checkout_request_id[-6:]},
+            {'Name': 'TransactionDate', 'Value': 20261018120000},
+            {'Name': 'PhoneNumber', 'Value': 254712345678},
+        ]}
+    return {'Body': {'stkCallback': body}}
+
+
+class WorkerCrash(BaseException):
+    """Stands in for a worker dying mid-apply: not an Exception, so nothing catches it"""
+
+
+class MpesaCallbackJournalTests(TestCase):
+    """Each callback moves payment, sale and stock exactly once"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='cashier')
+        category = Category.objects.create(name='Drinks')
+        self.product = Product.objects.create(
+            name='Water 500ml', sku='WATER500', category=category,
+            price=Decimal('50.00'), stock_quantity=10,
+        )
+        self.sale, self.payment = pending_mpesa_sale(self.user, [(self.product, 2)])
+
+    def deliver(self, body):
+        request = RequestFactory().post('/mpesa/callback/', data=json.dumps(body), content_type='application/json')
+        return json.loads(mpesa_callback(request).content)
+
+    def assert_settled_once(self):
+        self.sale.refresh_from_db()
+        self.payment.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(self.sale.status, 'completed')
+        self.assertEqual(self.payment.status, 'SUCCESS')
+        self.assertEqual(self.product.stock_quantity, 8)
+        self.assertEqual(self.product.reserved_quantity, 0)
+        self.assertEqual(Inventory.objects.filter(product=self.product, transaction_type='sale').count(), 1)
+
+    def test_callback_delivered_twice_is_applied_once(self):
+        body = stk_callback(self.payment.checkout_request_id, amount=100)
+        self.assertEqual(self.deliver(body)['ResultCode'], 0)
+        self.assertEqual(self.deliver(body)['ResultCode'], 0)
+        self.assertEqual(MpesaCallback.objects.count(), 1)
+
+        self.assertEqual(apply_pending_callbacks(), 1)
+        callback = MpesaCallback.objects.get()
+        self.assertFalse(apply_callback(callback.pk))
+        self.assertEqual(apply_pending_callbacks(), 0)
+        self.assert_settled_once()
+
+    def test_payment_for_a_cancelled_sale_sells_nothing(self):
+        Sale.objects.filter(pk=self.sale.pk).update(status='cancelled')
+        self.deliver(stk_callback(self.payment.checkout_request_id, amount=100))
+        self.assertEqual(apply_pending_callbacks(), 1)
+
+        self.sale.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(self.sale.status, 'cancelled')
+        self.assertEqual((self.product.stock_quantity, self.product.reserved_quantity), (10, 0))
+        self.assertFalse(Inventory.objects.filter(transaction_type='sale').exists())
+        self.assertFalse(DailySales.objects.exists())
+
+    def test_callback_after_reconciliation_fills_in_the_receipt(self):
+        Payment.objects.filter(pk=self.payment.pk).update(created_at=timezone.now() - timedelta(minutes=10))
+        with mock.patch('pos_application.mpesa._query_outcome', return_value={'ResultCode': '0', 'ResultDesc': 'OK'}):
+            self.assertEqual(reconcile_pending_payments()['completed'], 1)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'SUCCESS')
+        self.assertIsNone(self.payment.mpesa_receipt)
+        self.assertIsNone(self.payment.transaction_date)
+
+        self.deliver(stk_callback(self.payment.checkout_request_id, amount=100))
+        self.assertEqual(apply_pending_callbacks(), 1)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.mpesa_receipt, 'RCP' + self.payment.checkout_request_id[-6:])
+        self.assertEqual(self.payment.transaction_date, '20261018120000')
+        self.assert_settled_once()
+
+    def test_callback_claimed_by_a_crashed_worker_is_picked_up_again(self):
+        self.deliver(stk_callback(self.payment.checkout_request_id, amount=100))
+        callback = MpesaCallback.objects.get()
+
+        with mock.patch('pos_application.mpesa.settle_payment', side_effect=WorkerCrash):
+            with self.assertRaises(WorkerCrash):
+                apply_callback(callback.pk)
+
+        # The claim rolled back with the crashed transaction
+        callback.refresh_from_db()
+        self.assertEqual(callback.status, 'RECEIVED')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 10)
+
+        self.assertEqual(apply_pending_callbacks(), 1)
+        self.assertEqual(apply_pending_callbacks(), 0)
+        self.assert_settled_once()
+
+
+class StockReservationTests(TestCase):
+    """Stock held for a pending M-Pesa sale is either sold once or put back once"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='cashier')
+        category = Category.objects.create(name='Drinks')
+        self.product = Product.objects.create(
+            name='Water 500ml', sku='WATER500', category=category,
+            price=Decimal('50.00'), stock_quantity=5,
+        )
+        self.sale, self.payment = pending_mpesa_sale(self.user, [(self.product, 3)])
+
+    def settle(self, result_code):
+        with transaction.atomic():
+            settle_payment(self.payment, stk_callback(self.payment.checkout_request_id, result_code, amount=150))
+
+    def assert_stock(self, on_shelf, reserved, reservation_status):
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock_quantity, self.product.reserved_quantity), (on_shelf, reserved))
+        self.assertEqual(StockReservation.objects.get(sale=self.sale).status, reservation_status)
+
+    def test_checkout_holds_the_basket(self):
+        self.assert_stock(5, 3, 'active')
+        self.assertEqual(self.sale.status, 'pending')
+
+    def test_held_stock_is_not_sold_again(self):
+        response = checkout(self.user, [(self.product, 3)])
+        self.assertFalse(response['success'])
+        response = checkout(self.user, [(self.product, 3)], payment_method='mpesa', phone_number='0712345678')
+        self.assertFalse(response['success'])
+        self.assertTrue(checkout(self.user, [(self.product, 2)])['success'])
+        self.assert_stock(3, 3, 'active')
+
+    def test_payment_consumes_the_hold(self):
+        self.settle(0)
+        self.assert_stock(2, 0, 'consumed')
+        self.sale.refresh_from_db()
+        self.assertEqual(self.sale.status, 'completed')
+
+    def test_failed_payment_releases_the_hold(self):
+        self.settle(1032)
+        self.assert_stock(5, 0, 'released')
+        self.sale.refresh_from_db()
+        self.assertEqual(self.sale.status, 'cancelled')
+
+    def test_expired_hold_is_released_and_late_payment_still_sells(self):
+        self.assertEqual(release_expired_reservations(), 0)
+        StockReservation.objects.filter(sale=self.sale).update(expires_at=timezone.now())
+        self.assertEqual(release_expired_reservations(), 1)
+        self.assertEqual(release_expired_reservations(), 0)
+        self.assert_stock(5, 0, 'released')
+
+        # The customer paid after all: the money is taken, so the stock goes
+        self.settle(0)
+        self.assert_stock(2, 0, 'released')
+
+
+# Admin pages render static tags; the manifest only exists after collectstatic
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class InventoryAdminTests(TestCase):
+    """Ledger rows entered in the admin move the stock and cannot be deleted"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='secret')
+        self.client.force_login(self.admin)
+        category = Category.objects.create(name='Drinks')
+        self.product = Product.objects.create(
+            name='Water 500ml', sku='WATER500', category=category,
+            price=Decimal('50.00'), stock_quantity=5,
+        )
+
+    def add_row(self, transaction_type, quantity):
+        return self.client.post(reverse('admin:pos_application_inventory_add'), {
+            'product': self.product.pk, 'transaction_type': transaction_type,
+            'quantity': quantity, 'notes': '', 'user': self.admin.pk,
+        })
+
+    def test_added_rows_move_the_stock(self):
+        self.assertEqual(self.add_row('in', 7).status_code, 302)
+        self.assertEqual(self.add_row('out', -4).status_code, 302)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 8)
+        self.assertEqual(Inventory.objects.filter(product=self.product).count(), 2)
+
+    def test_taking_out_more_than_is_available_is_refused(self):
+        response = self.add_row('out', -6)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Insufficient stock. Available: 5')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 5)
+        self.assertFalse(Inventory.objects.exists())
+
+    def test_rows_cannot_be_deleted(self):
+        self.add_row('in', 1)
+        row = Inventory.objects.get()
+        response = self.client.post(reverse('admin:pos_application_inventory_delete', args=[row.pk]), {'post': 'yes'})
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(Inventory.objects.filter(pk=row.pk).exists())
+
+
+class InventoryImportStreamTests(TestCase):
+    """Under ASGI the import streams its progress instead of being buffered whole"""
+
+    def test_asgi_import_streams_progress_lines(self):
+        user = User.objects.create(username='manager')
+        upload = SimpleUploadedFile('delivery.csv', (
+            b'sku,name,category,price,quantity\n'
+            b'WATER500,Water 500ml,Drinks,50,12\n'
+            b'COKE500,Coca Cola 500ml,Drinks,60,24\n'
+        ), content_type='text/csv')
+        request = AsyncRequestFactory().post('/import/', {'file': upload})
+        request.user = user
+        response = import_inventory(request)
+        self.assertTrue(response.is_async)
+
+        async def read():
+            return [json.loads(line) async for line in response]
+
+        lines = async_to_sync(read)()
+        self.assertEqual(lines[-1]['success'], True)
+        self.assertEqual(lines[-1]['created'], 2)
+        self.assertEqual(
+            dict(Product.objects.values_list('sku', 'stock_quantity')), {'WATER500': 12, 'COKE500': 24},
+        )
+
+
+class InventoryExportStreamTests(TestCase):
+    """Under ASGI exports are sent as they are read, not collected first"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='manager')
+        category = Category.objects.create(name='Drinks')
+        Product.objects.create(
+            name='Water 500ml', sku='WATER500', category=category,
+            price=Decimal('50.00'), stock_quantity=12,
+        )
+
+    def export(self, export_format):
+        request = AsyncRequestFactory().get('/export/', {'format': export_format})
+        request.user = self.user
+        response = export_inventory(request)
+        self.assertTrue(response.is_async)
+
+        async def read():
+            return b''.join([chunk async for chunk in response])
+
+        return async_to_sync(read)()
+
+    def test_csv_streams(self):
+        self.assertIn(b'WATER500', self.export('csv'))
+
+    def test_xlsx_streams(self):
+        # An XLSX is a zip archive
+        self.assertTrue(self.export('xlsx').startswith(b'PK'))
+
+
+class PaymentStatusStreamTests(TestCase):
+    """A stream must see payments settled by other processes, which never touch its cache"""
+
+    def test_stream_notices_an_unannounced_settlement(self):
+        user = User.objects.create(username='cashier')
+        category = Category.objects.create(name='Drinks')
+        product = Product.objects.create(
+            name='Water 500ml', sku='WATER500', category=category,
+            price=Decimal('50.00'), stock_quantity=10,
+        )
+        sale, payment = pending_mpesa_sale(user, [(product, 1)])
+        request = AsyncRequestFactory().get('/payment-stream/', {'sale_id': sale.pk})
+        request.user = user
+
+        async def read():
+            response = await payment_status_stream(request)
+            statuses = []
+            async for event in response:
+                event = event.decode()
+                if event.startswith('event: status'):
+                    statuses.append(json.loads(event.split('data: ', 1)[1])['status'])
+                    # Settled elsewhere: no notify_payment_update in this process
+                    await sync_to_async(Payment.objects.filter(pk=payment.pk).update)(status='SUCCESS')
+                elif event.startswith('event: timeout'):
+                    break
+            return statuses
+
+        with mock.patch('pos_application.views.PAYMENT_STREAM_KEEPALIVE', 0.05), \
+                mock.patch('pos_application.views.PAYMENT_STREAM_TIMEOUT', 5):
+            self.assertEqual(async_to_sync(read)(), ['PENDING', 'SUCCESS'])
+
+
+class SalesRollupTests(TestCase):
+    """The daily rollups move with every completed sale and agree with a rebuild"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='secret')
+        self.category = Category.objects.create(name='Drinks')
+        self.water = Product.objects.create(
+            name='Water 500ml', sku='WATER500', category=self.category,
+            price=Decimal('50.00'), stock_quantity=100,
+        )
+        self.coke = Product.objects.create(
+            name='Coca Cola 500ml', sku='COKE500', category=self.category,
+            price=Decimal('60.00'), stock_quantity=100,
+        )
+
+    def sales(self):
+        return {
+            row.payment_method: (row.orders, row.final_amount)
+            for row in DailySales.objects.exclude(orders=0)
+        }
+
+    def products(self):
+        return {
+            (row.product_id, row.payment_method): (row.quantity, row.revenue)
+            for row in DailyProductSales.objects.exclude(quantity=0)
+        }
+
+    def test_cash_checkout_adds_one_sale(self):
+        checkout(self.admin, [(self.water, 2), (self.coke, 1), (self.water, 1)])
+        self.assertEqual(self.sales(), {'cash': (1, Decimal('210.00'))})
+        self.assertEqual(self.products(), {
+            (self.water.pk, 'cash'): (3, Decimal('150.00')),
+            (self.coke.pk, 'cash'): (1, Decimal('60.00')),
+        })
+
+    def test_mpesa_sale_counts_once_it_is_paid(self):
+        sale, payment = pending_mpesa_sale(self.admin, [(self.coke, 2)])
+        self.assertEqual(self.sales(), {})
+        for _ in range(2):
+            with transaction.atomic():
+                settle_payment(payment, stk_callback(payment.checkout_request_id, amount=120))
+        self.assertEqual(self.sales(), {'mpesa': (1, Decimal('120.00'))})
+        self.assertEqual(self.products(), {(self.coke.pk, 'mpesa'): (2, Decimal('120.00'))})
+
+    def test_admin_edit_moves_the_sale(self):
+        self.client.force_login(self.admin)
+        sale = Sale.objects.get(pk=checkout(self.admin, [(self.water, 2)])['sale_id'])
+        item = sale.items.get()
+        response = self.client.post(reverse('admin:pos_application_sale_change', args=[sale.pk]), {
+            'status': 'completed', 'payment_method': 'card', 'amount_paid': '100000',
+            'items-TOTAL_FORMS': 1, 'items-INITIAL_FORMS': 1, 'items-MIN_NUM_FORMS': 0, 'items-MAX_NUM_FORMS': 1000,
+            'items-0-id': item.pk, 'items-0-sale': sale.pk, 'items-0-product': self.water.pk,
+            'items-0-quantity': 3, 'items-0-unit_price': '50.00',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.sales(), {'card': (1, Decimal('100.00'))})
+        self.assertEqual(self.products(), {(self.water.pk, 'card'): (3, Decimal('150.00'))})
+
+    def test_admin_delete_takes_the_sale_out(self):
+        self.client.force_login(self.admin)
+        kept = checkout(self.admin, [(self.coke, 1)])
+        deleted = checkout(self.admin, [(self.water, 2)])
+        response = self.client.post(
+            reverse('admin:pos_application_sale_delete', args=[deleted['sale_id']]), {'post': 'yes'},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Sale.objects.filter(pk=kept['sale_id']).exists())
+        self.assertEqual(self.sales(), {'cash': (1, Decimal('60.00'))})
+        self.assertEqual(self.products(), {(self.coke.pk, 'cash'): (1, Decimal('60.00'))})
+
+    def test_rebuild_matches_the_incremental_totals(self):
+        checkout(self.admin, [(self.water, 2), (self.coke, 1)])
+        checkout(self.admin, [(self.coke, 3)])
+        sale, payment = pending_mpesa_sale(self.admin, [(self.water, 1)])
+        with transaction.atomic():
+            settle_payment(payment, stk_callback(payment.checkout_request_id, amount=50))
+        # Pending and cancelled sales are not counted either way
+        pending_mpesa_sale(self.admin, [(self.water, 1)], checkout_request_id='ws_CO_OTHER')
+        incremental = self.sales(), self.products()
+
+        call_command('rebuild_sales_rollups', stdout=io.StringIO())
+        self.assertEqual((self.sales(), self.products()), incremental)
+        self.assertEqual(incremental[0]['cash'], (2, Decimal('340.00')))
+
+
+class LowStockFlagTests(TestCase):
+    """low_stock follows the stock across min_stock_level, with one alert per crossing"""
+
+    def setUp(self):
+        category = Category.objects.create(name='Drinks')
+        self.product = Product.objects.create(
+            name='Water 500ml', sku='WATER500', category=category,
+            price=Decimal('50.00'), stock_quantity=10, min_stock_level=5,
+        )
+
+    def alerts(self):
+        return list(StockAlert.objects.order_by('created_at', 'id').values_list('kind', 'stock_quantity'))
+
+    def test_decrement_across_the_minimum_flags_once(self):
+        decrement_stock({self.product.pk: 4})
+        self.assertEqual(self.alerts(), [])
+        decrement_stock({self.product.pk: 1})
+        decrement_stock({self.product.pk: 2})
+        self.product.refresh_from_db()
+        self.assertTrue(self.product.low_stock)
+        self.assertEqual(self.alerts(), [('low', 5)])
+
+    def test_restock_clears_the_flag(self):
+        decrement_stock({self.product.pk: 8})
+        add_stock({self.product.pk: 3})
+        self.product.refresh_from_db()
+        self.assertTrue(self.product.low_stock)
+        add_stock({self.product.pk: 10})
+        self.product.refresh_from_db()
+        self.assertFalse(self.product.low_stock)
+        self.assertEqual(self.alerts(), [('low', 2), ('restocked', 15)])
+
+    def test_full_save_keeps_the_maintained_flag(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        decrement_stock({self.product.pk: 8})
+        # Current stock, but the flag as it was when the instance was loaded
+        stale.refresh_from_db(fields=['stock_quantity'])
+        self.assertFalse(stale.low_stock)
+        stale.name = 'Water 500ml (still)'
+        stale.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.name, 'Water 500ml (still)')
+        self.assertTrue(self.product.low_stock)
+        self.assertEqual(self.alerts(), [('low', 2)])
+
+
+def forged_cursors():
+    """Cursors a client could send that the server never issued"""
+    return ['not-a-cursor', '!!!'] + [
+        base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+        for value in ({'a': 1}, ['yesterday', 1], ['2026-01-01T00:00:00+00:00', 'x'], [1, 2], [])
+    ]
+
+
+class ProductHistoryCursorTests(TestCase):
+    """Loading more history never skips or repeats a row, even when timestamps tie"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='manager')
+        self.client.force_login(self.user)
+        category = Category.objects.create(name='Drinks')
+        self.product = Product.objects.create(
+            name='Water 500ml', sku='WATER500', category=category,
+            price=Decimal('50.00'), stock_quantity=0,
+        )
+        Inventory.objects.bulk_create([
+            Inventory(product=self.product, transaction_type='in', quantity=1, notes=f'row {n}', user=self.user)
+            for n in range(7)
+        ])
+        # Every row in the same instant, as a bulk import writes them
+        Inventory.objects.update(created_at=timezone.now())
+
+    def history(self, **params):
+        return self.client.get(reverse('product_history', args=[self.product.pk]), params)
+
+    def test_pages_through_tied_timestamps(self):
+        notes = []
+        params = {'limit': 3}
+        while True:
+            page = self.history(**params).json()
+            self.assertTrue(page['success'])
+            self.assertLessEqual(len(page['history']), 3)
+            notes += [row['notes'] for row in page['history']]
+            if not page['next']:
+                break
+            params['cursor'] = page['next']
+        # Newest first, ties broken by id
+        self.assertEqual(notes, [f'row {n}' for n in reversed(range(7))])
+
+    def test_forged_cursor_is_rejected(self):
+        for cursor in forged_cursors():
+            with self.subTest(cursor=cursor):
+                response = self.history(cursor=cursor)
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(response.json()['success'])
+
+
+class CustomerSearchTests(TestCase):
+    """Customer pages never skip or repeat a row, and phone numbers match however they are typed"""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create(username='cashier'))
+        # Same name and the same instant for everyone: only the id tells them apart
+        for n in range(7):
+            Customer.objects.create(name='Amina Otieno', email=f'amina{n}@example.com', phone=f'071234567{n}')
+        Customer.objects.update(created_at=timezone.now())
+        self.ids = sorted(Customer.objects.values_list('id', flat=True))
+
+    def customers(self, **params):
+        return self.client.get(reverse('customers_ajax'), params)
+
+    def all_pages(self, **params):
+        ids = []
+        params['limit'] = 3
+        while True:
+            page = self.customers(**params).json()
+            self.assertLessEqual(len(page['data']), 3)
+            ids += [customer['id'] for customer in page['data']]
+            if not page['next']:
+                return ids
+            params['cursor'] = page['next']
+
+    def test_pages_through_tied_rows(self):
+        self.assertEqual(self.all_pages(), self.ids[::-1])
+        self.assertEqual(self.all_pages(q='amina'), self.ids)
+        self.assertEqual(self.all_pages(q='0712 345'), self.ids)
+
+    def test_phone_lookup_is_normalized(self):
+        wanted = Customer.objects.get(phone='0712345673').id
+        for query in ('0712345673', '+254 712 345 673', '254712345673', '712-345-673'):
+            with self.subTest(query=query):
+                self.assertEqual([customer['id'] for customer in self.customers(q=query).json()['data']], [wanted])
+
+    def test_forged_cursor_is_rejected(self):
+        name_cursor = self.customers(q='amina', limit=3).json()['next']
+        for query, cursor in [('', cursor) for cursor in forged_cursors()] + [('', name_cursor), ('0712', name_cursor)]:
+            with self.subTest(query=query, cursor=cursor):
+                response = self.customers(q=query, cursor=cursor)
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(response.json()['success'])
+
+
+class ConditionalGetTests(TestCase):
+    """Terminals revalidate with If-None-Match: unchanged data is a 304, any change a new ETag"""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create(username='cashier'))
+        self.category = Category.objects.create(name='Drinks')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product = Product.objects.create(
+                name='Water 500ml', sku='WATER500', category=self.category,
+                price=Decimal('50.00'), stock_quantity=10,
+            )
+        self.customer = Customer.objects.create(name='Amina Otieno', phone='0712345678')
+        self.catalog_url = reverse('products_by_category', args=[self.category.pk])
+        self.customers_url = reverse('customers_ajax')
+
+    def assert_not_modified(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        return etag
+
+    def assert_modified(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response
+
+    def test_product_edit_changes_the_catalog_etag(self):
+        etag = self.assert_not_modified(self.catalog_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = Decimal('55.00')
+            self.product.save()
+        response = self.assert_modified(self.catalog_url, etag)
+        self.assertEqual([product['price'] for product in response.json()['products']], [55.0])
+
+    def test_product_delete_changes_the_catalog_etag(self):
+        etag = self.assert_not_modified(self.catalog_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        self.assertEqual(self.assert_modified(self.catalog_url, etag).json()['products'], [])
+
+    def test_customer_edit_changes_the_customers_etag(self):
+        etag = self.assert_not_modified(self.customers_url)
+        self.customer.name = 'Amina Wanjiru'
+        self.customer.save()
+        response = self.assert_modified(self.customers_url, etag)
+        self.assertEqual([customer['name'] for customer in response.json()['data']], ['Amina Wanjiru'])
+
+    def test_customer_delete_changes_the_customers_etag(self):
+        # An older customer's deletion leaves the newest updated_at as it was
+        Customer.objects.create(name='Brian Kamau', phone='0722345678')
+        etag = self.assert_not_modified(self.customers_url)
+        self.customer.delete()
+        response = self.assert_modified(self.customers_url, etag)
+        self.assertEqual([customer['name'] for customer in response.json()['data']], ['Brian Kamau'])
@@ -0,0 +1,142 @@
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels. Grid tiles are 80px tall and up to ~250px wide, so
+# 'md' covers them on 2x screens; 'sm' is for table rows, 'lg' for detail views.
+THUMBNAIL_SIZES = {'sm': 96, 'md': 320, 'lg': 640}
+# WebP is what browsers get; JPEG is kept for clients that cannot show it
+THUMBNAIL_FORMATS = {'webp': ('WEBP', {'quality': 80, 'method': 4}),
+                     'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True})}
+THUMBNAIL_ROOT = 'thumbnails'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _storage():
+    return Product._meta.get_field('image').storage
+
+
+def thumbnail_path(digest, size, fmt):
+    """Thumbnails are addressed by the original's content hash, so identical
+    uploads share one set of files"""
+    return f'{THUMBNAIL_ROOT}/{digest[:2]}/{digest}/{size}.{fmt}'
+
+
+def thumbnail_url(image, digest, size='md', fmt='webp'):
+    """URL for an image column value, falling back to the original upload
+    until its thumbnails have been generated"""
+    if not image:
+        return None
+    if digest:
+        return _storage().url(thumbnail_path(digest, size, fmt))
+    return _storage().url(image)
+
+
+def _flatten(image):
+    """JPEG has no alpha channel: paint transparent areas white"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _render(data, digest, missing):
+    storage = _storage()
+    largest = max(THUMBNAIL_SIZES.values())
+    with Image.open(io.BytesIO(data)) as source:
+        # Lets the JPEG decoder skip detail we are about to throw away
+        source.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(source)
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+    created = 0
+    # Largest first, each size shrunk from the previous one
+    for size, edge in sorted(THUMBNAIL_SIZES.items(), key=lambda item: -item[1]):
+        image.thumbnail((edge, edge), Image.LANCZOS)
+        for fmt, (pil_format, options) in THUMBNAIL_FORMATS.items():
+            path = thumbnail_path(digest, size, fmt)
+            if path not in missing:
+                continue
+            buffer = io.BytesIO()
+            (image if pil_format == 'WEBP' else _flatten(image)).save(buffer, pil_format, **options)
+            storage.save(path, ContentFile(buffer.getvalue()))
+            created += 1
+    return created
+
+
+def generate_thumbnails(product_id, force=False):
+    """Make every thumbnail size for a product's current image.
+
+    Files that already exist for the same content are reused. Records the
+    content hash on the product (which makes the catalog serve the
+    thumbnails) and returns (hash, files created), or (None, 0) when the
+    product has no image.
+    """
+    row = Product.objects.filter(pk=product_id).values_list('image', 'image_hash').first()
+    if not row or not row[0]:
+        return None, 0
+    image, current_hash = row
+
+    storage = _storage()
+    with storage.open(image, 'rb') as handle:
+        data = handle.read()
+    digest = hashlib.sha256(data).hexdigest()
+
+    paths = [thumbnail_path(digest, size, fmt) for size in THUMBNAIL_SIZES for fmt in THUMBNAIL_FORMATS]
+    missing = set(paths) if force else {path for path in paths if not storage.exists(path)}
+    if force:
+        for path in paths:
+            storage.delete(path)
+    created = _render(data, digest, missing) if missing else 0
+
+    if digest != current_hash:
+        with transaction.atomic():
+            # Only if the image was not replaced while we worked. Saving bumps
+            # the catalog version, and updated_at puts the new URL in the next
+            # terminal delta.
+            product = Product.objects.select_for_update().filter(pk=product_id, image=image).first()
+            if product is not None:
+                product.image_hash = digest
+                product.save(update_fields=['image_hash', 'updated_at'])
+    return digest, created
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'THUMBNAIL_WORKERS', 2),
+                thread_name_prefix='thumbnails',
+            )
+        return _executor
+
+
+def schedule_thumbnails(product_id):
+    """Generate a product's thumbnails in the background once the upload commits"""
+    transaction.on_commit(lambda: _get_executor().submit(_generate_in_thread, product_id))
+
+
+def _generate_in_thread(product_id):
+    try:
+        generate_thumbnails(product_id)
+    except Exception as e:
+        # The product keeps showing its original image; the backfill command retries it
+        logger.exception(f"Thumbnail generation failed for product {product_id}: {str(e)}")
+    finally:
+        connections.close_all()
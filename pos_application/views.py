@@ -2,17 +2,16 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, Sum, Count
+from django.db.models import Q, Sum, Count, Max
 from django.utils import timezone
 from decimal import Decimal
 import json
-from datetime import datetime, timedelta
+from datetime import datetime
 from django.db import models
-from .models import Product, Category, Sale, SaleItem, Customer, Discount, Inventory
-from django.views.decorators.http import require_http_methods
-from django.http import HttpResponse
-from openpyxl import Workbook
-from io import BytesIO
+from .models import Product, Category, Sale, Customer, Discount, Inventory
+from django.views.decorators.http import require_http_methods, condition
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.cache import cache_control
 from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
@@ -20,14 +19,7 @@ from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_protect
 from django.http import JsonResponse
 import json
-from django.http import HttpResponse
-from openpyxl import Workbook
-from io import BytesIO
-from django.http import HttpResponse, JsonResponse
 from django.utils import timezone
-from io import BytesIO
-import openpyxl
-from openpyxl.styles import Font, PatternFill, Alignment
 
 
 @csrf_protect
@@ -100,23 +92,21 @@ def dashboard(request):
     # Get recent sales
     recent_sales = Sale.objects.select_related('customer', 'cashier').order_by('-created_at')[:5]
     
-    # Get low stock products
-    low_stock_products = Product.objects.filter(
-        stock_quantity__lte=models.F('min_stock_level'),
-        is_active=True
-    )[:5]
-    
-    # Get categories for sidebar
-    categories = Category.objects.all()
+    # Get low stock products: the maintained flag's partial index holds only these
+    low_stock = products_low_on_stock()
+    low_stock_products = low_stock[:5]
     
-    # Get featured/recent products
-    products = Product.objects.filter(is_active=True).order_by('-created_at')[:8]
+    # Categories and featured/recent products come from the cached catalog
+    catalog = get_catalog()
+    categories = catalog.categories
+    products = catalog.products[:8]
     
     context = {
         'total_sales_today': total_sales_today,
         'total_transactions': total_transactions,
         'recent_sales': recent_sales,
         'low_stock_products': low_stock_products,
+        'low_stock_count': low_stock.count(),
         'categories': categories,
         'products': products,
         'current_date': timezone.now(),
@@ -126,14 +116,18 @@ def dashboard(request):
 
 
 
+def catalog_etag(request, *args, **kwargs):
+    """Catalog responses only change when the catalog version is bumped"""
+    return f"catalog-{get_catalog_version()}"
+
+
 @login_required
+@gzip_page
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=catalog_etag)
 def get_products_by_category(request, category_id):
     """AJAX view to get products by category"""
-    products = Product.objects.filter(
-        category_id=category_id, 
-        is_active=True,
-        stock_quantity__gt=0
-    )
+    products = get_catalog().in_stock(category_id)
     
     products_data = []
     for product in products:
@@ -158,151 +152,71 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from decimal import Decimal
 import json
-from datetime import datetime, timedelta
-import uuid
+from datetime import datetime
 import logging
-import requests
-import base64
+import asyncio
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse, FileResponse
 from django.db import transaction
+from django.db.models import F
 from django.conf import settings
+from django.core.cache import cache
+from django.utils.dateparse import parse_date, parse_datetime
 
-from .models import (Product, Category, Sale, SaleItem, Customer, Discount, 
-                    Inventory, Payment)  # Add Payment model
+from .models import (Product, Category, Sale, Customer, Discount, 
+                    Inventory, Payment, SaleNumberSequence, MpesaOutbox, CatalogTombstone)  # Add Payment model
+from .mpesa import enqueue_stk_push, journal_callback
+from .payment_events import wait_for_payment_update, current_payment_version
+from .catalog import get_catalog, get_catalog_version
+from .search import find_products, find_customers, CUSTOMER_PAGE_SIZE
+from .phones import clean_phone_number
+from .thumbnails import schedule_thumbnails
+from .terminal_sync import snapshot_payload, changes_payload
+from .checkout import (CheckoutError, InsufficientStock, merge_cart_lines, load_products,
+                       decrement_stock, add_stock, reserve_stock, release_expired_reservations,
+                       create_sale_items, record_stock_movements, lock_for_checkout)
+from .ledger import stock_as_of, product_history, HISTORY_PAGE_SIZE
+from .inventory_import import import_inventory as run_inventory_import, read_rows
+from .exports import inventory_rows, stream_csv, write_xlsx
+from .stock_alerts import products_low_on_stock
+from .inventory_listing import inventory_page, SORT_ORDERS, DEFAULT_SORT
+from .sales_rollup import record_sale
+from .reports import reports_payload
 
 # Set up logging for M-Pesa debugging
 logger = logging.getLogger(__name__)
 
-# M-Pesa Service Class (copied from your ecommerce)
-class MpesaService:
-    def __init__(self):
-        self.consumer_key = getattr(settings, 'MPESA_CONSUMER_KEY', '')
-        self.consumer_secret = getattr(settings, 'MPESA_CONSUMER_SECRET', '')
-        self.business_shortcode = getattr(settings, 'MPESA_BUSINESS_SHORTCODE', '')
-        self.passkey = getattr(settings, 'MPESA_PASSKEY', '')
-        self.environment = getattr(settings, 'MPESA_ENVIRONMENT', 'sandbox')
-        
-        logger.info(f"M-Pesa Service initialized - Environment: {self.environment}, Shortcode: {self.business_shortcode}")
-        
-        if not all([self.consumer_key, self.consumer_secret, self.business_shortcode, self.passkey]):
-            logger.error("Missing M-Pesa configuration in settings")
-            raise ValueError("M-Pesa configuration is incomplete. Check your settings.")
-        
-        if self.environment == 'sandbox':
-            self.base_url = 'https://sandbox.safaricom.co.ke'
-        else:
-            self.base_url = 'https://api.safaricom.co.ke'
-    
-    def get_access_token(self):
-        """Get M-Pesa access token with enhanced error handling"""
-        logger.info("Requesting M-Pesa access token")
-        
-        try:
-            url = f"{self.base_url}/oauth/v1/generate?grant_type=client_credentials"
-            credentials = f"{self.consumer_key}:{self.consumer_secret}"
-            encoded_credentials = base64.b64encode(credentials.encode()).decode()
-            
-            headers = {
-                'Authorization': f'Basic {encoded_credentials}',
-                'Content-Type': 'application/json'
-            }
-            
-            response = requests.get(url, headers=headers, timeout=30)
-            
-            if response.status_code != 200:
-                logger.error(f"Token request failed with status {response.status_code}")
-                raise Exception(f"Token request failed: HTTP {response.status_code}")
-            
-            token_data = response.json()
-            access_token = token_data.get('access_token')
-            
-            if not access_token:
-                raise Exception("No access token received from API")
-            
-            logger.info("Access token obtained successfully")
-            return access_token
-            
-        except Exception as e:
-            logger.exception(f"Error getting access token: {str(e)}")
-            raise Exception(f"Failed to get access token: {str(e)}")
-    
-    def generate_password(self):
-        """Generate M-Pesa password"""
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        password_string = f"{self.business_shortcode}{self.passkey}{timestamp}"
-        password = base64.b64encode(password_string.encode()).decode()
-        return password, timestamp
-    
-    def stk_push(self, phone_number, amount, account_reference, transaction_desc):
-        """Initiate STK Push with comprehensive error handling"""
-        logger.info(f"Starting STK Push - Phone: {phone_number}, Amount: {amount}")
-        
-        try:
-            access_token = self.get_access_token()
-            password, timestamp = self.generate_password()
-            
-            url = f"{self.base_url}/mpesa/stkpush/v1/processrequest"
-            
-            headers = {
-                'Authorization': f'Bearer {access_token}',
-                'Content-Type': 'application/json'
-            }
-            
-            amount = int(float(amount))
-            callback_url = getattr(settings, 'MPESA_CALLBACK_URL', '')
-            
-            payload = {
-                'BusinessShortCode': self.business_shortcode,
-                'Password': password,
-                'Timestamp': timestamp,
-                'TransactionType': 'CustomerPayBillOnline',
-                'Amount': amount,
-                'PartyA': phone_number,
-                'PartyB': self.business_shortcode,
-                'PhoneNumber': phone_number,
-                'CallBackURL': callback_url,
-                'AccountReference': account_reference,
-                'TransactionDesc': transaction_desc
-            }
-            
-            logger.info("Sending STK Push request...")
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
-            
-            if response.status_code != 200:
-                raise Exception(f"STK Push API error: HTTP {response.status_code}")
-            
-            response_data = response.json()
-            response_code = response_data.get('ResponseCode')
-            
-            if response_code != '0':
-                error_desc = response_data.get('ResponseDescription', 'Unknown error')
-                raise Exception(f"STK Push failed: {error_desc}")
-            
-            logger.info("STK Push completed successfully")
-            return response_data
-            
-        except Exception as e:
-            logger.exception(f"STK Push failed: {str(e)}")
-            raise Exception(f"STK Push failed: {str(e)}")
-
+# Most codes a scanner burst may send in one request
+MAX_SCAN_BATCH = 100
 
 @login_required
 def pos_terminal(request):
     """Enhanced POS Terminal with M-Pesa support"""
-    categories = Category.objects.all()
-    products = Product.objects.filter(is_active=True, stock_quantity__gt=0)
-    customers = Customer.objects.all()
-    discounts = Discount.objects.filter(is_active=True)
-    
+    # Products, customers and discounts are loaded by the page from
+    # catalog_snapshot / catalog_changes and cached on the terminal
     context = {
-        'categories': categories,
-        'products': products,
-        'customers': customers,
-        'discounts': discounts,
+        'categories': get_catalog().categories,
+        'barcode_scanner': settings.POS_SETTINGS.get('BARCODE_SCANNER', False),
     }
     
     return render(request, 'terminal.html', context)
 
 
+@login_required
+@gzip_page
+def catalog_snapshot(request):
+    """Full terminal catalog for a terminal with nothing cached"""
+    return JsonResponse(snapshot_payload(), json_dumps_params={'separators': (',', ':')})
+
+
+@login_required
+@gzip_page
+def catalog_changes(request):
+    """Catalog rows changed since ?since=<version> from an earlier snapshot or delta"""
+    return JsonResponse(changes_payload(request.GET.get('since')), json_dumps_params={'separators': (',', ':')})
+
+
 @login_required
 def process_sale(request):
     """Enhanced process_sale with M-Pesa integration"""
@@ -331,32 +245,38 @@ def process_sale(request):
                     })
                 phone_number = cleaned_phone
             
+            # Abandoned M-Pesa holds go back on sale before this basket is checked
+            release_expired_reservations()
+            
+            # Numbered in a transaction of its own, so the counter row is not
+            # held while the basket is written; a failed checkout leaves a gap
+            sale_number = SaleNumberSequence.next_sale_number()
+            
             with transaction.atomic():
-                # Calculate totals (same as before)
+                lock_for_checkout()
+                
+                # Load every product in the basket with one query
+                quantities = merge_cart_lines(cart_items)
+                products = load_products(quantities.keys())
+                
                 total_amount = Decimal('0.00')
-                sale_items = []
+                sale_lines = []
                 
                 for item in cart_items:
-                    product = get_object_or_404(Product, id=item['product_id'])
+                    product = products.get(int(item['product_id']))
+                    if product is None:
+                        raise CheckoutError('Product not found')
+                    
                     quantity = int(item['quantity'])
                     unit_price = product.price
                     
-                    # Check stock
-                    if product.stock_quantity < quantity:
-                        return JsonResponse({
-                            'success': False, 
-                            'error': f'Insufficient stock for {product.name}'
-                        })
-                    
-                    item_total = unit_price * quantity
-                    total_amount += item_total
+                    # Check stock against the whole basket, not just this line; the
+                    # conditional update below is what actually guards the stock
+                    if product.available_quantity < quantities[product.pk]:
+                        raise InsufficientStock(f'Insufficient stock for {product.name}')
                     
-                    sale_items.append({
-                        'product': product,
-                        'quantity': quantity,
-                        'unit_price': unit_price,
-                        'total_price': item_total,
-                    })
+                    total_amount += unit_price * quantity
+                    sale_lines.append((product, quantity, unit_price))
                 
                 # Apply discount
                 discount_amount = Decimal('0.00')
@@ -378,6 +298,7 @@ def process_sale(request):
                 
                 # Create sale record
                 sale = Sale.objects.create(
+                    sale_number=sale_number,
                     customer_id=customer_id if customer_id else None,
                     cashier=request.user,
                     total_amount=total_amount,
@@ -392,94 +313,47 @@ def process_sale(request):
                 
                 logger.info(f"Sale created: {sale.sale_number}")
                 
-                # Create sale items and update inventory
-                for item_data in sale_items:
-                    SaleItem.objects.create(
-                        sale=sale,
-                        product=item_data['product'],
-                        quantity=item_data['quantity'],
-                        unit_price=item_data['unit_price'],
-                        total_price=item_data['total_price'],
+                # Create sale items in one bulk insert
+                create_sale_items(sale, sale_lines)
+                if sale.status == 'completed':
+                    record_sale(sale, [
+                        (product.pk, product.category_id, quantity, unit_price * quantity)
+                        for product, quantity, unit_price in sale_lines
+                    ])
+                
+                # Update stock. M-Pesa stock is only held here and moves when the payment succeeds
+                if payment_method == 'mpesa':
+                    reserve_stock(sale, quantities)
+                else:
+                    decrement_stock(quantities)
+                    record_stock_movements(
+                        {product_id: -quantity for product_id, quantity in quantities.items()},
+                        user=request.user,
+                        transaction_type='sale',
+                        notes=f'Sale {sale.sale_number}',
                     )
-                    
-                    # Update product stock (only if not M-Pesa or if M-Pesa payment succeeds)
-                    if payment_method != 'mpesa':
-                        product = item_data['product']
-                        product.stock_quantity -= item_data['quantity']
-                        product.save()
-                        
-                        # Create inventory transaction
-                        Inventory.objects.create(
-                            product=product,
-                            transaction_type='sale',
-                            quantity=-item_data['quantity'],
-                            notes=f'Sale {sale.sale_number}',
-                            user=request.user,
-                        )
                 
                 # Update customer loyalty points (only if payment completes)
                 if customer_id and payment_method != 'mpesa':
-                    customer = Customer.objects.get(id=customer_id)
-                    points_earned = int(final_amount / 10)
-                    customer.loyalty_points += points_earned
-                    customer.total_spent += final_amount
-                    customer.save()
+                    Customer.objects.filter(id=customer_id).update(
+                        loyalty_points=F('loyalty_points') + int(final_amount / 10),
+                        total_spent=F('total_spent') + final_amount,
+                        updated_at=timezone.now(),
+                    )
                 
-                # Handle M-Pesa payment
+                # Handle M-Pesa payment: queue the STK push, it is sent after this commits
                 if payment_method == 'mpesa':
-                    logger.info(f"Initiating M-Pesa payment for sale {sale.sale_number}")
+                    enqueue_stk_push(sale, phone_number=phone_number, amount=final_amount)
                     
-                    try:
-                        mpesa_service = MpesaService()
-                        response = mpesa_service.stk_push(
-                            phone_number=phone_number,
-                            amount=int(final_amount),
-                            account_reference=f"Sale-{sale.sale_number}",
-                            transaction_desc=f"Payment for Sale {sale.sale_number}"
-                        )
-                        
-                        if response.get('ResponseCode') == '0':
-                            checkout_request_id = response.get('CheckoutRequestID')
-                            
-                            # Create Payment record
-                            Payment.objects.create(
-                                sale=sale,  # Link to sale instead of order
-                                checkout_request_id=checkout_request_id,
-                                status="PENDING",
-                                raw_response=response,
-                                phone_number=phone_number,
-                                amount=final_amount
-                            )
-                            
-                            logger.info(f"STK Push successful. CheckoutRequestID: {checkout_request_id}")
-                            
-                            return JsonResponse({
-                                'success': True,
-                                'payment_pending': True,
-                                'message': 'STK Push sent to your phone. Please enter your M-Pesa PIN.',
-                                'checkout_request_id': checkout_request_id,
-                                'sale_id': sale.id,
-                                'sale_number': sale.sale_number,
-                                'total': float(final_amount)
-                            })
-                        else:
-                            error_msg = response.get('ResponseDescription', 'Unknown error')
-                            logger.error(f"STK Push failed: {error_msg}")
-                            sale.delete()  # Clean up failed sale
-                            
-                            return JsonResponse({
-                                'success': False,
-                                'error': f"M-Pesa payment failed: {error_msg}"
-                            })
-                            
-                    except Exception as e:
-                        logger.exception(f"M-Pesa payment initialization failed: {str(e)}")
-                        sale.delete()  # Clean up failed sale
-                        
-                        return JsonResponse({
-                            'success': False,
-                            'error': f"Payment initialization failed: {str(e)}"
-                        })
+                    return JsonResponse({
+                        'success': True,
+                        'payment_pending': True,
+                        'message': 'Sending STK Push to your phone. Please enter your M-Pesa PIN.',
+                        'checkout_request_id': None,
+                        'sale_id': sale.id,
+                        'sale_number': sale.sale_number,
+                        'total': float(final_amount)
+                    })
                 
                 # For non-M-Pesa payments, return success immediately
                 return JsonResponse({
@@ -491,6 +365,8 @@ def process_sale(request):
                     'change': float(change_given),
                 })
                 
+        except CheckoutError as e:
+            return JsonResponse({'success': False, 'error': str(e)})
         except Exception as e:
             logger.exception(f"Error processing sale: {str(e)}")
             return JsonResponse({'success': False, 'error': str(e)})
@@ -498,35 +374,15 @@ def process_sale(request):
     return JsonResponse({'success': False, 'error': 'Invalid request method'})
 
 
-def clean_phone_number(phone):
-    """Clean and format phone number for M-Pesa"""
-    if not phone:
-        return None
-    
-    # Remove all non-digit characters
-    phone = ''.join(filter(str.isdigit, str(phone)))
-    
-    # Handle Kenyan phone numbers
-    if phone.startswith('0'):
-        phone = '254' + phone[1:]
-    elif phone.startswith('+254'):
-        phone = phone[1:]
-    elif phone.startswith('254'):
-        pass
-    elif len(phone) == 9:
-        phone = '254' + phone
-    
-    # Validate length
-    if len(phone) == 12 and phone.startswith('254'):
-        return phone
-    
-    return None
-
-
 @csrf_exempt
 @require_POST
 def mpesa_callback(request):
-    """Handle M-Pesa callback for POS transactions"""
+    """Journal an M-Pesa callback and acknowledge it straight away.
+    
+    The callback is applied to Payment, Sale and stock afterwards by
+    apply_callback. Replays of the same CheckoutRequestID are dropped by
+    the journal's unique key, so stock is only ever moved once.
+    """
     logger.info("M-Pesa callback received for POS")
     logger.debug(f"Callback request body: {request.body}")
     
@@ -535,72 +391,14 @@ def mpesa_callback(request):
         stk_callback = callback_data.get('Body', {}).get('stkCallback', {})
         result_code = stk_callback.get('ResultCode')
         checkout_request_id = stk_callback.get('CheckoutRequestID')
-        result_desc = stk_callback.get('ResultDesc')
         
         logger.info(f"Callback details - ResultCode: {result_code}, CheckoutRequestID: {checkout_request_id}")
         
-        # Find Payment by checkout_request_id
-        payment = Payment.objects.filter(checkout_request_id=checkout_request_id).first()
-        if not payment:
-            logger.error(f"No Payment found for CheckoutRequestID: {checkout_request_id}")
+        if not checkout_request_id:
+            logger.error("Callback without CheckoutRequestID ignored")
             return JsonResponse({'ResultCode': 0, 'ResultDesc': 'Accepted'})
         
-        sale = payment.sale
-        
-        if result_code == 0:  # Success
-            callback_metadata = stk_callback.get('CallbackMetadata', {}).get('Item', [])
-            transaction_data = {item['Name']: item.get('Value') for item in callback_metadata}
-            
-            logger.info(f"Transaction data: {transaction_data}")
-            
-            # Update payment record
-            payment.status = "SUCCESS"
-            payment.mpesa_receipt = transaction_data.get('MpesaReceiptNumber')
-            payment.phone_number = transaction_data.get('PhoneNumber')
-            payment.transaction_date = str(transaction_data.get('TransactionDate'))
-            payment.amount = transaction_data.get('Amount')
-            payment.raw_response = callback_data
-            payment.save()
-            
-            # Update sale status and complete inventory updates
-            sale.status = "completed"
-            sale.save()
-            
-            # Now update inventory (was deferred for M-Pesa)
-            for sale_item in sale.items.all():
-                product = sale_item.product
-                product.stock_quantity -= sale_item.quantity
-                product.save()
-                
-                # Create inventory transaction
-                Inventory.objects.create(
-                    product=product,
-                    transaction_type='sale',
-                    quantity=-sale_item.quantity,
-                    notes=f'Sale {sale.sale_number} - M-Pesa Payment Confirmed',
-                    user=sale.cashier,
-                )
-            
-            # Update customer loyalty points if applicable
-            if sale.customer:
-                customer = sale.customer
-                points_earned = int(sale.final_amount / 10)
-                customer.loyalty_points += points_earned
-                customer.total_spent += sale.final_amount
-                customer.save()
-            
-            logger.info(f"Payment completed - Receipt: {payment.mpesa_receipt}")
-        
-        else:  # Failed
-            payment.status = "FAILED"
-            payment.raw_response = callback_data
-            payment.save()
-            
-            sale.status = "cancelled"
-            sale.save()
-            
-            logger.error(f"Payment failed - ResultCode: {result_code}, ResultDesc: {result_desc}")
-        
+        journal_callback(checkout_request_id, result_code, callback_data)
         return JsonResponse({'ResultCode': 0, 'ResultDesc': 'Accepted'})
     
     except Exception as e:
@@ -608,48 +406,133 @@ def mpesa_callback(request):
         return JsonResponse({'ResultCode': 1, 'ResultDesc': f'Error processing callback: {str(e)}'})
 
 
+def payment_status_payload(checkout_request_id=None, sale_id=None):
+    """Build the payment status response shared by polling and streaming"""
+    payments = Payment.objects.select_related('sale')
+    if checkout_request_id:
+        payment = payments.filter(checkout_request_id=checkout_request_id).first()
+    else:
+        payment = payments.filter(sale_id=sale_id).first()
+    
+    if payment:
+        if payment.status == "SUCCESS":
+            return {
+                'status': 'SUCCESS',
+                'message': 'Payment completed successfully!',
+                'sale_number': payment.sale.sale_number,
+                'mpesa_receipt': payment.mpesa_receipt
+            }
+        elif payment.status == "FAILED":
+            return {
+                'status': 'FAILED',
+                'message': 'Payment failed. Please try again.'
+            }
+        else:
+            return {
+                'status': 'PENDING',
+                'message': 'Please complete the payment on your phone...'
+            }
+    
+    # No Payment yet: the STK push may still be waiting in the outbox
+    if sale_id:
+        outbox = MpesaOutbox.objects.filter(sale_id=sale_id).only('status', 'last_error').first()
+        if outbox and outbox.status == 'FAILED':
+            return {
+                'status': 'FAILED',
+                'message': f'Payment initialization failed: {outbox.last_error}'
+            }
+        if outbox and outbox.status in ('PENDING', 'SENDING'):
+            return {
+                'status': 'PENDING',
+                'message': 'Sending payment request to your phone...'
+            }
+    
+    # Default pending response
+    return {
+        'status': 'PENDING',
+        'message': 'Payment is being processed...'
+    }
+
+
 @login_required
 def check_payment_status(request):
-    """Check M-Pesa payment status via AJAX polling"""
+    """Check M-Pesa payment status via AJAX polling (fallback for payment_status_stream)"""
     checkout_request_id = request.GET.get('checkout_request_id')
-    logger.info(f"Checking payment status for CheckoutRequestID: {checkout_request_id}")
+    sale_id = request.GET.get('sale_id')
+    logger.info(f"Checking payment status for CheckoutRequestID: {checkout_request_id}, Sale: {sale_id}")
     
-    if not checkout_request_id:
-        return JsonResponse({'error': 'Checkout request ID required'}, status=400)
+    if not checkout_request_id and not sale_id:
+        return JsonResponse({'error': 'Checkout request ID or sale ID required'}, status=400)
     
     try:
-        payment = Payment.objects.filter(checkout_request_id=checkout_request_id).first()
-        
-        if payment:
-            if payment.status == "SUCCESS":
-                return JsonResponse({
-                    'status': 'SUCCESS',
-                    'message': 'Payment completed successfully!',
-                    'sale_number': payment.sale.sale_number,
-                    'mpesa_receipt': payment.mpesa_receipt
-                })
-            elif payment.status == "FAILED":
-                return JsonResponse({
-                    'status': 'FAILED',
-                    'message': 'Payment failed. Please try again.'
-                })
-            else:
-                return JsonResponse({
-                    'status': 'PENDING',
-                    'message': 'Please complete the payment on your phone...'
-                })
-        
-        # Default pending response
-        return JsonResponse({
-            'status': 'PENDING',
-            'message': 'Payment is being processed...'
-        })
-        
+        return JsonResponse(payment_status_payload(checkout_request_id=checkout_request_id, sale_id=sale_id))
     except Exception as e:
         logger.exception(f"Error checking payment status: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
 
 
+# Longest a terminal waits on one stream; matches the terminal's own payment timeout
+PAYMENT_STREAM_TIMEOUT = 300
+PAYMENT_STREAM_KEEPALIVE = 15
+
+
+async def payment_status_stream(request):
+    """Server-Sent Events stream of one sale's M-Pesa payment status.
+    
+    The connection sleeps until mpesa_callback (or the outbox) reports a
+    change, and otherwise reads the status once per keep-alive, so waiting
+    terminals cost no requests and one query every PAYMENT_STREAM_KEEPALIVE
+    seconds.
+    Needs the ASGI server; under WSGI it answers 501 and the terminal falls
+    back to polling check_payment_status.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'Payment streaming requires the ASGI server'}, status=501)
+    
+    is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+    if not is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    
+    sale_id = request.GET.get('sale_id', '')
+    if not sale_id.isdigit():
+        return JsonResponse({'error': 'Sale ID required'}, status=400)
+    
+    async def events():
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + PAYMENT_STREAM_TIMEOUT
+        version = await current_payment_version(sale_id)
+        last_payload = None
+        
+        while True:
+            payload = await sync_to_async(payment_status_payload)(sale_id=sale_id)
+            if payload != last_payload:
+                yield f"event: status\ndata: {json.dumps(payload)}\n\n"
+                last_payload = payload
+            else:
+                # Comment lines keep proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+            if payload['status'] != 'PENDING':
+                return
+            
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                yield "event: timeout\ndata: {}\n\n"
+                return
+            # Sleep until notified or the keep-alive is due. The status is
+            # read again either way: without a shared cache a callback
+            # applied by another process never moves this process's version.
+            new_version = await wait_for_payment_update(
+                sale_id, version, timeout=min(PAYMENT_STREAM_KEEPALIVE, remaining)
+            )
+            if new_version is not None:
+                version = new_version
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @login_required
 def sale_detail(request, sale_id):
     """Enhanced sale detail view with payment info"""
@@ -673,50 +556,79 @@ def sale_detail(request, sale_id):
 # Additional utility functions
 @login_required
 def get_pending_mpesa_sales(request):
-    """Get sales with pending M-Pesa payments"""
+    """Get sales with pending M-Pesa payments in one joined query"""
     pending_sales = Sale.objects.filter(
         payment_method='mpesa',
         status='pending'
-    ).select_related('customer', 'cashier')
+    ).values(
+        'id', 'sale_number', 'final_amount', 'created_at', 'customer__name',
+        'payments__checkout_request_id', 'payments__phone_number',
+    ).order_by('created_at')
     
     sales_data = []
     for sale in pending_sales:
-        payment = Payment.objects.filter(sale=sale).first()
         sales_data.append({
-            'id': sale.id,
-            'sale_number': sale.sale_number,
-            'total': float(sale.final_amount),
-            'customer': sale.customer.name if sale.customer else 'Walk-in',
-            'created_at': sale.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            'checkout_request_id': payment.checkout_request_id if payment else None,
-            'phone_number': payment.phone_number if payment else None
+            'id': sale['id'],
+            'sale_number': sale['sale_number'],
+            'total': float(sale['final_amount']),
+            'customer': sale['customer__name'] or 'Walk-in',
+            'created_at': sale['created_at'].strftime('%Y-%m-%d %H:%M:%S'),
+            'checkout_request_id': sale['payments__checkout_request_id'],
+            'phone_number': sale['payments__phone_number']
         })
     
     return JsonResponse({'pending_sales': sales_data})
 
 @login_required
+def scan_products(request):
+    """Barcode fast path: exact SKU lookups against the in-memory catalog.
+    
+    GET ?code=<sku> for a single scan, or POST {"codes": [...]} for a burst
+    of scans. Returns one compact entry per code found, in scan order.
+    """
+    if request.method == 'POST':
+        try:
+            codes = json.loads(request.body).get('codes', [])
+        except (json.JSONDecodeError, AttributeError):
+            return JsonResponse({'success': False, 'error': 'Invalid JSON data'}, status=400)
+    else:
+        codes = [request.GET.get('code', '')]
+    
+    if not isinstance(codes, list) or len(codes) > MAX_SCAN_BATCH:
+        return JsonResponse({'success': False, 'error': f'Send up to {MAX_SCAN_BATCH} codes'}, status=400)
+    
+    catalog = get_catalog()
+    products = []
+    missing = []
+    for code in codes:
+        product = catalog.lookup_sku(str(code))
+        if product is None:
+            missing.append(code)
+        else:
+            products.append({
+                'code': code,
+                'id': product.id,
+                'name': product.name,
+                'price': float(product.price),
+                'stock': product.stock_quantity,
+            })
+    
+    return JsonResponse({'success': True, 'products': products, 'missing': missing})
+
+
+@login_required
+@gzip_page
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=catalog_etag)
 def search_products(request):
     """AJAX view to search products"""
     query = request.GET.get('q', '')
     if len(query) < 2:
         return JsonResponse({'products': []})
     
-    products = Product.objects.filter(
-        Q(name__icontains=query) | Q(sku__icontains=query),
-        is_active=True,
-        stock_quantity__gt=0
-    )[:10]
-    
-    products_data = []
-    for product in products:
-        products_data.append({
-            'id': product.id,
-            'name': product.name,
-            'sku': product.sku,
-            'price': float(product.price),
-            'stock': product.stock_quantity,
-            'category': product.category.name,
-        })
+    products_data = find_products(query, limit=10)
+    for product in products_data:
+        product['price'] = float(product['price'])
     
     return JsonResponse({'products': products_data})
 
@@ -747,28 +659,44 @@ def sales_history(request):
 
 @login_required
 def inventory_management(request):
-    """Inventory management view"""
-    products = Product.objects.select_related('category').all()
-    categories = Category.objects.all()
+    """Inventory management view: one filtered, sorted page of products"""
+    categories = Category.objects.order_by('name')
     
     # Filter by category if provided
-    category_id = request.GET.get('category')
-    if category_id:
-        products = products.filter(category_id=category_id)
+    category_id = request.GET.get('category', '')
+    if not category_id.isdigit():
+        category_id = ''
     
-    # Search functionality
-    search_query = request.GET.get('search')
-    if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) | 
-            Q(sku__icontains=search_query)
-        )
+    search_query = request.GET.get('search', '')
+    stock_status = request.GET.get('stock_status', '')
+    sort_by = request.GET.get('sort_by', DEFAULT_SORT)
+    if sort_by not in SORT_ORDERS:
+        sort_by = DEFAULT_SORT
+    
+    products, status_counts, category_counts = inventory_page(
+        category_id=category_id,
+        status=stock_status,
+        query=search_query,
+        sort=sort_by,
+        page=request.GET.get('page'),
+    )
+    for category in categories:
+        category.product_count = category_counts.get(category.id, 0)
+    
+    # Query string for pagination links, minus the page itself
+    params = request.GET.copy()
+    params.pop('page', None)
     
     context = {
         'products': products,
+        'page_range': products.paginator.get_elided_page_range(products.number),
         'categories': categories,
         'selected_category': category_id,
         'search_query': search_query,
+        'stock_status': stock_status,
+        'sort_by': sort_by,
+        'status_counts': status_counts,
+        'page_params': params.urlencode(),
     }
     
     return render(request, 'inventory.html', context)
@@ -787,30 +715,28 @@ def update_inventory(request):
         product = get_object_or_404(Product, id=product_id, is_active=True)
         
         # Validate stock out doesn't exceed available stock
-        if transaction_type == 'out' and abs(quantity) > product.stock_quantity:
+        # Units held for pending M-Pesa sales are not available to take out
+        if transaction_type == 'out' and abs(quantity) > product.available_quantity:
             return JsonResponse({
                 'success': False,
-                'error': f'Insufficient stock. Available: {product.stock_quantity}'
+                'error': f'Insufficient stock. Available: {product.available_quantity}'
             })
         
-        # Update product stock
-        if transaction_type == 'in':
-            product.stock_quantity += abs(quantity)
-            inventory_quantity = abs(quantity)
-        else:  # out
-            product.stock_quantity -= abs(quantity)
-            inventory_quantity = -abs(quantity)
-        
-        product.save()
-        
-        # Create inventory transaction record
-        Inventory.objects.create(
-            product=product,
-            transaction_type=transaction_type,
-            quantity=inventory_quantity,
-            notes=notes,
-            user=request.user
-        )
+        # Move the stock and write its ledger row together. The conditional
+        # update re-checks availability, so a sale landing between the check
+        # above and this write cannot be overwritten or oversold.
+        with transaction.atomic():
+            if transaction_type == 'in':
+                add_stock({product.id: abs(quantity)})
+                inventory_quantity = abs(quantity)
+            else:  # out
+                decrement_stock({product.id: abs(quantity)})
+                inventory_quantity = -abs(quantity)
+            
+            # Create inventory transaction record
+            record_stock_movements({product.id: inventory_quantity}, user=request.user,
+                                   transaction_type=transaction_type, notes=notes)
+        product.refresh_from_db(fields=['stock_quantity', 'reserved_quantity'])
         
         return JsonResponse({
             'success': True,
@@ -819,93 +745,97 @@ def update_inventory(request):
             'is_low_stock': product.is_low_stock
         })
         
+    except InsufficientStock:
+        product.refresh_from_db(fields=['stock_quantity', 'reserved_quantity'])
+        return JsonResponse({
+            'success': False,
+            'error': f'Insufficient stock. Available: {product.available_quantity}'
+        })
     except Exception as e:
         return JsonResponse({
             'success': False,
             'error': str(e)
         })
 
+def stream_for_server(request, iterator):
+    """Hand a sync iterator to StreamingHttpResponse without ASGI buffering it.
+
+    Under ASGI a sync iterator is drained into a list before the first byte
+    goes out. There each item is pulled through sync_to_async instead, in
+    the thread that owns the request's database connection, so cursors and
+    transactions opened by the iterator stay on one connection.
+    """
+    if not isinstance(request, ASGIRequest):
+        return iterator
+    
+    async def pull():
+        items = iter(iterator)
+        done = object()
+        while True:
+            item = await sync_to_async(next)(items, done)
+            if item is done:
+                return
+            yield item
+    
+    return pull()
+
+@login_required
+@require_POST
+def import_inventory(request):
+    """Create or restock products by SKU from an uploaded CSV or XLSX file.
+
+    Streams one JSON line of running totals per committed chunk, so large
+    deliveries show progress instead of timing out
+    """
+    upload = request.FILES.get('file')
+    if not upload:
+        return JsonResponse({'success': False, 'error': 'Choose a CSV or XLSX file to import'})
+    notes = request.POST.get('notes') or f'Import {upload.name}'
+
+    def progress():
+        report = None
+        try:
+            for report in run_inventory_import(read_rows(upload, upload.name), request.user, notes):
+                yield json.dumps(dict(report.as_dict(), errors=[])) + '\n'
+            yield json.dumps(dict(report.as_dict(), success=True, done=True)) + '\n'
+        except ValueError as e:
+            # The file itself is unusable: no header, not UTF-8, not a workbook
+            yield json.dumps(dict(report.as_dict() if report else {}, success=False, done=True, error=str(e))) + '\n'
+        except Exception as e:
+            logger.exception(f"Inventory import of {upload.name} failed")
+            yield json.dumps(dict(report.as_dict() if report else {}, success=False, done=True, error=str(e))) + '\n'
+
+    # Each chunk commits in the sync thread; under ASGI its line is sent before the next starts
+    response = StreamingHttpResponse(stream_for_server(request, progress()), content_type='application/x-ndjson')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @login_required
 def export_inventory(request):
-    """Export inventory to Excel"""
+    """Export inventory to Excel, or to CSV with ?format=csv"""
     try:
-        # Create workbook and worksheet
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Inventory Report"
-        
-        # Define headers
-        headers = [
-            'SKU', 'Product Name', 'Category', 'Current Stock', 
-            'Min Level', 'Unit Price', 'Cost Price', 'Stock Value', 'Status'
-        ]
-        
-        # Style headers
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        header_alignment = Alignment(horizontal="center", vertical="center")
-        
-        # Add headers
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_alignment
-        
-        # Get products data
-        products = Product.objects.select_related('category').filter(is_active=True).order_by('name')
-        
-        # Add data rows
-        for row, product in enumerate(products, 2):
-            stock_value = product.stock_quantity * product.cost_price
-            
-            # Determine status
-            if product.stock_quantity == 0:
-                status = "Out of Stock"
-            elif product.is_low_stock:
-                status = "Low Stock"
-            else:
-                status = "In Stock"
-            
-            row_data = [
-                product.sku,
-                product.name,
-                product.category.name,
-                product.stock_quantity,
-                product.min_stock_level,
-                float(product.price),
-                float(product.cost_price),
-                float(stock_value),
-                status
-            ]
-            
-            for col, value in enumerate(row_data, 1):
-                ws.cell(row=row, column=col, value=value)
+        filename = f'inventory_report_{timezone.now().strftime("%Y%m%d_%H%M%S")}'
         
-        # Auto-adjust column widths
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
-        
-        # Save to BytesIO
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
+        if request.GET.get('format') == 'csv':
+            # Rows go out as they are read: nothing is held but the current chunk
+            response = StreamingHttpResponse(
+                stream_for_server(request, stream_csv(inventory_rows())), content_type='text/csv; charset=utf-8',
+            )
+            response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+            return response
         
-        # Create response
-        response = HttpResponse(
-            output.getvalue(),
+        # An XLSX is a zip and is only readable once complete, so it is built
+        # in a spooled file first and then sent in blocks
+        response = FileResponse(
+            write_xlsx(inventory_rows()),
+            as_attachment=True,
+            filename=f'{filename}.xlsx',
             content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
         )
-        response['Content-Disposition'] = f'attachment; filename="inventory_report_{timezone.now().strftime("%Y%m%d_%H%M%S")}.xlsx"'
+        # Under WSGI the file is left as it is so the server can use its file wrapper
+        if isinstance(request, ASGIRequest):
+            response.streaming_content = stream_for_server(request, response.streaming_content)
         
         return response
         
@@ -920,7 +850,11 @@ def export_inventory(request):
 def add_product(request):
     """AJAX view to add new product"""
     try:
-        data = json.loads(request.body)
+        # The inventory form posts multipart when a photo is attached
+        if request.content_type == 'multipart/form-data':
+            data = request.POST
+        else:
+            data = json.loads(request.body)
         
         # Validate required fields
         required_fields = ['name', 'category_id', 'sku', 'price']
@@ -957,8 +891,11 @@ def add_product(request):
             cost_price=data.get('cost_price', 0),
             stock_quantity=data.get('stock_quantity', 0),
             min_stock_level=data.get('min_stock_level', 5),
+            image=request.FILES.get('image'),
             is_active=True
         )
+        if product.image:
+            schedule_thumbnails(product.id)
         
         # If initial stock is added, create inventory record
         if product.stock_quantity > 0:
@@ -983,30 +920,71 @@ def add_product(request):
             'error': str(e)
         })
 
+def parse_moment(value, end_of_day=False):
+    """A datetime from a query parameter: a full timestamp, or a bare date
+    meaning its start (or close, with end_of_day). None if unparseable."""
+    day = parse_date(value)
+    if day:
+        moment = datetime.combine(day, datetime.max.time() if end_of_day else datetime.min.time())
+    else:
+        moment = parse_datetime(value)
+    if moment is not None and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
 @login_required
 def get_product_history(request, product_id):
-    """Get inventory history for a specific product"""
+    """Get inventory history for a specific product, a page at a time.
+
+    ?cursor= continues from the previous page's next; ?since= and ?until=
+    (dates or timestamps) limit the range; ?at= adds the stock on the shelf
+    at that moment.
+    """
     try:
         product = get_object_or_404(Product, id=product_id)
         
-        history = Inventory.objects.filter(product=product).select_related('user').order_by('-created_at')[:50]
+        bounds = {}
+        for param, end_of_day in (('since', False), ('until', True), ('at', True)):
+            if request.GET.get(param):
+                bounds[param] = parse_moment(request.GET[param], end_of_day)
+                if bounds[param] is None:
+                    return JsonResponse({'success': False, 'error': f'Invalid date for {param}'}, status=400)
+        
+        try:
+            limit = int(request.GET.get('limit', HISTORY_PAGE_SIZE))
+        except ValueError:
+            limit = HISTORY_PAGE_SIZE
+        try:
+            history, next_cursor = product_history(
+                product.id, cursor=request.GET.get('cursor'), limit=limit,
+                since=bounds.get('since'), until=bounds.get('until'),
+            )
+        except ValueError as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=400)
         
         history_data = []
         for record in history:
             history_data.append({
-                'date': record.created_at.strftime('%Y-%m-%d %H:%M'),
+                'date': timezone.localtime(record.created_at).strftime('%Y-%m-%d %H:%M'),
                 'type': record.get_transaction_type_display(),
                 'quantity': record.quantity,
                 'notes': record.notes,
                 'user': record.user.username if record.user else 'System'
             })
         
-        return JsonResponse({
+        response = {
             'success': True,
             'product_name': product.name,
             'current_stock': product.stock_quantity,
-            'history': history_data
-        })
+            'history': history_data,
+            'next': next_cursor,
+        }
+
+        if 'at' in bounds:
+            response['as_of'] = bounds['at'].isoformat()
+            response['stock_as_of'] = stock_as_of(product.id, bounds['at'])
+
+        return JsonResponse(response)
         
     except Exception as e:
         return JsonResponse({
@@ -1019,12 +997,11 @@ from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
 from django.db.models import Sum, Count, F, Q
-from django.db.models.functions import Extract
 from django.utils import timezone
-from datetime import datetime, timedelta
+from datetime import datetime
 import json
 from decimal import Decimal
-from .models import Customer, Sale, SaleItem, Product, Category
+from .models import Customer, Sale, Product, Category
 
 # Customer Views
 @login_required
@@ -1032,11 +1009,63 @@ def customers_list(request):
     """Display customers list page"""
     return render(request, 'customers.html')
 
+
+def customers_etag(request):
+    """Changes whenever a customer is added, edited or deleted.
+
+    Both maxima are read off the end of an index, so this stays cheap
+    however many customers there are.
+    """
+    latest = Customer.objects.aggregate(latest=Max('updated_at'))['latest']
+    deleted = CatalogTombstone.objects.filter(kind='customer').aggregate(latest=Max('deleted_at'))['latest']
+    return f"customers-{latest.timestamp() if latest else 0}-{deleted.timestamp() if deleted else 0}"
+
+
+def customer_stats(version):
+    """Totals for the customers page header, computed once per customer version"""
+    def compute():
+        stats = Customer.objects.aggregate(
+            total=Count('id'),
+            gold=Count('id', filter=Q(loyalty_tier__in=['gold', 'platinum'])),
+            spent=Sum('total_spent'),
+        )
+        spent = stats['spent'] or Decimal('0')
+        average = spent / stats['total'] if stats['total'] else Decimal('0')
+        return {
+            'total_customers': stats['total'],
+            'gold_customers': stats['gold'],
+            'total_spent': str(spent.quantize(Decimal('0.01'))),
+            'avg_spent': str(average.quantize(Decimal('0.01'))),
+        }
+    return cache.get_or_set(f'customers:stats:{version}', compute, 60 * 60)
+
+
+def customer_etag(request, customer_id):
+    updated_at = Customer.objects.filter(id=customer_id).values_list('updated_at', flat=True).first()
+    return f"customer-{customer_id}-{updated_at.timestamp()}" if updated_at else None
+
+
 @login_required
+@gzip_page
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=customers_etag)
 def customers_ajax(request):
-    """AJAX endpoint for customer data"""
+    """AJAX endpoint for customer data, one keyset page at a time.
+    
+    ?q= searches by name, email or phone number prefix; ?cursor= is the
+    'next' value of the previous page.
+    """
     if request.method == 'GET':
-        customers = Customer.objects.all().order_by('-created_at')
+        try:
+            limit = int(request.GET.get('limit', CUSTOMER_PAGE_SIZE))
+        except ValueError:
+            limit = CUSTOMER_PAGE_SIZE
+        try:
+            customers, next_cursor = find_customers(
+                request.GET.get('q', ''), request.GET.get('cursor'), limit,
+            )
+        except ValueError as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=400)
         data = []
         for customer in customers:
             data.append({
@@ -1051,9 +1080,15 @@ def customers_ajax(request):
                 'discount_percentage': customer.discount_percentage,
                 'created_at': customer.created_at.strftime('%Y-%m-%d %H:%M')
             })
-        return JsonResponse({'data': data})
+        response = {'data': data, 'next': next_cursor}
+        if request.GET.get('stats'):
+            response['stats'] = customer_stats(customers_etag(request))
+        return JsonResponse(response)
 
 @login_required
+@gzip_page
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=customer_etag)
 def customer_detail_ajax(request, customer_id):
     """Get single customer details"""
     try:
@@ -1144,140 +1179,32 @@ def reports_view(request):
     """Display reports dashboard"""
     return render(request, 'reports.html')
 
+@login_required
+@gzip_page
+def reports_ajax(request):
+    """Everything the reports page shows, in one cached response"""
+    return JsonResponse(reports_payload())
+
+# The single-chart endpoints are slices of the same cached payload
 @login_required
 def sales_data_ajax(request):
     """Get sales data for the past year"""
-    end_date = timezone.now()
-    start_date = end_date - timedelta(days=365)
-    
-    # Monthly sales data
-    monthly_sales = Sale.objects.filter(
-        created_at__range=[start_date, end_date]
-    ).extra(
-        select={'month': "DATE_TRUNC('month', created_at)"}
-    ).values('month').annotate(
-        total_sales=Sum('final_amount'),
-        total_orders=Count('id')
-    ).order_by('month')
-    
-    # Format data for Chart.js
-    months = []
-    sales = []
-    orders = []
-    
-    for item in monthly_sales:
-        months.append(item['month'].strftime('%Y-%m'))
-        sales.append(float(item['total_sales'] or 0))
-        orders.append(item['total_orders'])
-    
-    return JsonResponse({
-        'months': months,
-        'sales': sales,
-        'orders': orders
-    })
+    return JsonResponse(reports_payload()['sales_data'])
 
 @login_required
 def top_products_ajax(request):
     """Get most sold products"""
-    top_products = SaleItem.objects.values(
-        'product__name'
-    ).annotate(
-        total_quantity=Sum('quantity'),
-        total_revenue=Sum('total_price')
-    ).order_by('-total_quantity')[:10]
-    
-    products = []
-    quantities = []
-    revenues = []
-    
-    for item in top_products:
-        products.append(item['product__name'])
-        quantities.append(item['total_quantity'])
-        revenues.append(float(item['total_revenue']))
-    
-    return JsonResponse({
-        'products': products,
-        'quantities': quantities,
-        'revenues': revenues
-    })
+    return JsonResponse(reports_payload()['top_products'])
 
 @login_required
 def daily_sales_analysis_ajax(request):
     """Analyze sales by day of week"""
-    sales_by_day = Sale.objects.annotate(
-        day_of_week=Extract('created_at', 'dow')
-    ).values('day_of_week').annotate(
-        total_sales=Sum('final_amount'),
-        total_orders=Count('id'),
-        avg_order_value=Sum('final_amount') / Count('id')
-    ).order_by('day_of_week')
-    
-    days = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
-    day_sales = [0] * 7
-    day_orders = [0] * 7
-    day_avg = [0] * 7
-    
-    for item in sales_by_day:
-        day_index = item['day_of_week']
-        day_sales[day_index] = float(item['total_sales'] or 0)
-        day_orders[day_index] = item['total_orders']
-        day_avg[day_index] = float(item['avg_order_value'] or 0)
-    
-    return JsonResponse({
-        'days': days,
-        'sales': day_sales,
-        'orders': day_orders,
-        'avg_values': day_avg
-    })
+    return JsonResponse(reports_payload()['daily_analysis'])
 
 @login_required
 def sales_summary_ajax(request):
     """Get sales summary statistics"""
-    today = timezone.now().date()
-    this_month_start = today.replace(day=1)
-    last_month_start = (this_month_start - timedelta(days=1)).replace(day=1)
-    
-    # Today's sales
-    today_sales = Sale.objects.filter(
-        created_at__date=today
-    ).aggregate(
-        total_sales=Sum('final_amount'),
-        total_orders=Count('id')
-    )
-    
-    # This month's sales
-    this_month_sales = Sale.objects.filter(
-        created_at__date__gte=this_month_start
-    ).aggregate(
-        total_sales=Sum('final_amount'),
-        total_orders=Count('id')
-    )
-    
-    # Last month's sales
-    last_month_sales = Sale.objects.filter(
-        created_at__date__gte=last_month_start,
-        created_at__date__lt=this_month_start
-    ).aggregate(
-        total_sales=Sum('final_amount'),
-        total_orders=Count('id')
-    )
-    
-    # Top customer
-    top_customer = Customer.objects.order_by('-total_spent').first()
-    
-    return JsonResponse({
-        'today_sales': float(today_sales['total_sales'] or 0),
-        'today_orders': today_sales['total_orders'] or 0,
-        'month_sales': float(this_month_sales['total_sales'] or 0),
-        'month_orders': this_month_sales['total_orders'] or 0,
-        'last_month_sales': float(last_month_sales['total_sales'] or 0),
-        'top_customer': top_customer.name if top_customer else 'No customers',
-        'total_customers': Customer.objects.count(),
-        'total_products': Product.objects.count(),
-        'low_stock_products': Product.objects.filter(
-            stock_quantity__lte=F('min_stock_level')
-        ).count()
-    })
+    return JsonResponse(reports_payload()['summary'])
 
 # Settings Views
 @login_required